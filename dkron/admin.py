@@ -1,13 +1,20 @@
 import re
 from urllib.parse import parse_qsl
 
+import requests
 from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import Http404
 from django.http.response import HttpResponseForbidden, HttpResponseRedirect
+from django.template.response import TemplateResponse
 from django.templatetags.static import static
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from dkron import models, utils
+from dkron import cron, models, utils
 from dkron.forms import JobForm
 
 
@@ -20,20 +27,10 @@ class JobAdminForm(forms.ModelForm):
         return self.cleaned_data['name'].lower()
 
     def clean_schedule(self):
-        # crappy way to validate it but oh well...
-        j = models.Job(
-            name='tmp_test_job', schedule=self.cleaned_data['schedule'], enabled=False, command='echo validator'
-        )
         try:
-            utils.sync_job(j)
-        except utils.DkronException:
-            raise forms.ValidationError('Invalid value')
-        else:
-            try:
-                utils.delete_job(j)
-            except Exception:
-                # don't really care, just cleanup
-                pass
+            cron.parse(self.cleaned_data['schedule'])
+        except cron.CronError as e:
+            raise forms.ValidationError(f'Invalid value - {e}')
         return self.cleaned_data['schedule']
 
 
@@ -48,11 +45,12 @@ class JobAdmin(admin.ModelAdmin):
         'enabled',
         'notify_on_error',
         'get_last_run',
+        'get_sync_state',
         'get_dkron_link',
     )
     list_display_links = ('name',)
     search_fields = ('name', 'schedule', 'command', 'description')
-    list_filter = ('name', 'schedule', 'enabled', 'last_run_success', 'notify_on_error')
+    list_filter = ('name', 'schedule', 'enabled', 'last_run_success', 'notify_on_error', 'dirty')
     actions = ['disable_jobs', 'enable_jobs']
     form = JobForm
 
@@ -60,11 +58,20 @@ class JobAdmin(admin.ModelAdmin):
         return request.user.has_perm('dkron.can_use_dashboard')
 
     def _change_job_enabled(self, request, queryset, value):
+        if settings.DKRON_SYNC_ON_SAVE:
+            # queued by JobQuerySet.update
+            queryset.update(enabled=value)
+            return
+        if settings.DKRON_SYNC_ASYNC:
+            with transaction.atomic():
+                queryset.update(enabled=value)
+                utils.enqueue_sync(queryset.values_list('name', flat=True))
+            return
         queryset.update(enabled=value)
         for job in queryset:
             try:
                 utils.sync_job(job)
-            except utils.DkronException as e:
+            except (utils.DkronException, requests.RequestException) as e:
                 self.message_user(request, f'Failed to sync {job.name} config with dkron - {str(e)}', 'ERROR')
 
     def get_dkron_link(self, obj):
@@ -91,6 +98,43 @@ class JobAdmin(admin.ModelAdmin):
     get_last_run.short_description = 'Last Run'
     get_last_run.admin_order_field = 'last_run_date'
 
+    def get_sync_state(self, obj):
+        if obj.outbox_attempts:
+            return format_html(
+                '<img src="{}" title="{}" alt="failed">', static('admin/img/icon-no.svg'), obj.outbox_error or ''
+            )
+        if obj.outbox_attempts is not None:
+            return format_html('<img src="{}" title="pending" alt="pending">', static('admin/img/icon-clock.svg'))
+        if obj.dirty:
+            return format_html('<img src="{}" title="not synced" alt="dirty">', static('admin/img/icon-unknown.svg'))
+        return format_html('<img src="{}" title="{}" alt="synced">', static('admin/img/icon-yes.svg'), obj.synced_at)
+
+    get_sync_state.short_description = 'Sync'
+
+    def get_failure_rate(self, obj):
+        runs = sum(r.runs for r in obj.recent_rollups)
+        if not runs:
+            return None
+        failures = sum(r.failures for r in obj.recent_rollups)
+        return f'{failures / runs:.0%} of {runs}'
+
+    get_failure_rate.short_description = '24h failure rate'
+
+    def get_p95_runtime(self, obj):
+        p95 = models.JobRunRollup.percentile(obj.recent_rollups, 0.95)
+        if p95 is None:
+            return None
+        return f'{p95:.1f}s' if p95 < 60 else f'{p95 / 60:.1f}m'
+
+    get_p95_runtime.short_description = 'p95 runtime'
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if settings.DKRON_EXECUTIONS:
+            i = list_display.index('get_last_run') + 1
+            list_display = list_display[:i] + ('get_failure_rate', 'get_p95_runtime') + list_display[i:]
+        return list_display
+
     def disable_jobs(self, request, queryset):
         self._change_job_enabled(request, queryset, False)
 
@@ -101,34 +145,66 @@ class JobAdmin(admin.ModelAdmin):
 
     enable_jobs.short_description = 'Enable selected jobs'
 
+    def get_queryset(self, request):
+        # outbox state for the sync column, without a query per row
+        outbox = models.JobSyncOutbox.objects.filter(job_name=OuterRef('name'))
+        qs = (
+            super()
+            .get_queryset(request)
+            .annotate(
+                outbox_attempts=Subquery(outbox.values('attempts')[:1]),
+                outbox_error=Subquery(outbox.values('last_error')[:1]),
+            )
+        )
+        if settings.DKRON_EXECUTIONS:
+            # hourly rollups of the whole page in one query, for the 24h columns
+            since = timezone.now() - timezone.timedelta(hours=24)
+            qs = qs.prefetch_related(
+                Prefetch(
+                    'rollups',
+                    queryset=models.JobRunRollup.objects.filter(period=models.JobRunRollup.HOUR, start__gte=since),
+                    to_attr='recent_rollups',
+                )
+            )
+        return qs
+
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
+        if settings.DKRON_SYNC_ON_SAVE:
+            # synced (or queued in the outbox) by the post_save receiver
+            return
+        if settings.DKRON_SYNC_ASYNC:
+            # changeform_view is already running in a transaction
+            utils.enqueue_sync([obj.name])
+            return
         try:
             utils.sync_job(obj, job_update=None)
-        except utils.DkronException as e:
+        except (utils.DkronException, requests.RequestException) as e:
             self.message_user(request, f'Failed to sync {obj.name} config with dkron - {str(e)}', 'ERROR')
 
     def delete_model(self, request, obj):
         super().delete_model(request, obj)
+        if settings.DKRON_SYNC_ON_SAVE:
+            return
+        if settings.DKRON_SYNC_ASYNC:
+            utils.enqueue_sync([obj.name], action='d')
+            return
         try:
             utils.delete_job(obj)
-        except utils.DkronException as e:
+        except (utils.DkronException, requests.RequestException) as e:
             self.message_user(request, f'Failed to delete {obj.name} from dkron - {str(e)}', 'ERROR')
 
     def resync(self, request):
         if not self.has_dashboard_permission(request):
             return HttpResponseForbidden()
-        c = [0, 0]
+        c = {'u': 0, 'n': 0, 'd': 0}
         for _, action, result in utils.resync_jobs():
             if result:
                 self.message_user(request, result, 'ERROR')
             else:
-                if action == 'u':
-                    c[0] += 1
-                else:
-                    c[1] += 1
+                c[action] += 1
 
-        self.message_user(request, '%d jobs updated and %d deleted' % tuple(c))
+        self.message_user(request, '%(u)d jobs updated, %(n)d unchanged and %(d)d deleted' % c)
         post_url = reverse('admin:dkron_job_changelist', current_app=self.admin_site.name)
         preserved_filters = self.get_preserved_filters(request)
         preserved_filters = dict(parse_qsl(preserved_filters)).get('_changelist_filters')
@@ -136,15 +212,50 @@ class JobAdmin(admin.ModelAdmin):
             post_url = '%s?%s' % (post_url, preserved_filters)
         return HttpResponseRedirect(post_url)
 
+    def upcoming(self, request):
+        if not settings.DKRON_UPCOMING_RUNS:
+            # table not maintained
+            raise Http404
+        if not self.has_view_permission(request):
+            return HttpResponseForbidden()
+        start = end = None
+        try:
+            start = forms.DateTimeField().clean(request.GET.get('start') or None)
+            end = forms.DateTimeField().clean(request.GET.get('end') or None)
+        except forms.ValidationError:
+            pass
+        start = start or timezone.now()
+        end = end or start + timezone.timedelta(hours=settings.DKRON_UPCOMING_RUNS_HOURS)
+
+        limit = 1000
+        runs = list(
+            models.UpcomingRun.objects.filter(run_at__gte=start, run_at__lt=end)
+            .select_related('job')
+            .only('run_at', 'job__name', 'job__schedule')[: limit + 1]
+        )
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Upcoming runs',
+            opts=self.model._meta,
+            runs=runs[:limit],
+            truncated=len(runs) > limit,
+            limit=limit,
+            start=start,
+            end=end,
+        )
+        return TemplateResponse(request, 'admin/dkron/job/upcoming.html', context)
+
     def get_urls(self):
         from django.urls import path
 
         urls = super().get_urls()
         urls.insert(0, path('resync/', self.admin_site.admin_view(self.resync), name='dkron_job_resync'))
+        urls.insert(0, path('upcoming/', self.admin_site.admin_view(self.upcoming), name='dkron_job_upcoming'))
         return urls
 
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context['has_dashboard_permission'] = self.has_dashboard_permission(request)
         extra_context['has_change_permission'] = self.has_change_permission(request)
+        extra_context['upcoming_runs_enabled'] = bool(settings.DKRON_UPCOMING_RUNS)
         return super().changelist_view(request, extra_context)
@@ -1,6 +1,8 @@
+import django
 from django.shortcuts import reverse
 from django.apps import AppConfig
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 APP_SETTINGS = dict(
     # dkron server URL
@@ -27,9 +29,94 @@ APP_SETTINGS = dict(
     ENCRYPT=None,
     # HTTP Basic auth header value, if dkron instance is protected with it (really recommended, if instance is exposed)
     API_AUTH=None,
+    # seconds to wait for a connection to the dkron API to be established
+    API_CONNECT_TIMEOUT=5,
+    # seconds to wait for a dkron API response (between bytes) once connected
+    API_READ_TIMEOUT=30,
+    # number of retries for idempotent dkron API calls (GET/DELETE) on connection errors or 502/503/504
+    API_RETRIES=3,
+    # backoff factor for those retries - sleeps {backoff} * 2 ** (retry - 1) seconds between attempts
+    API_RETRY_BACKOFF=0.5,
+    # max number of keep-alive connections kept open to the dkron API
+    API_POOL_SIZE=10,
+    # number of jobs fetched per request when listing dkron jobs (resync and cleanup)
+    API_PAGE_SIZE=500,
+    # number of jobs synced concurrently by `resync_dkron` (and admin resync) - keep it lower or equal to API_POOL_SIZE
+    RESYNC_WORKERS=1,
+    # sync jobs with dkron whenever they are saved or deleted (any ORM write, not only admin) once the transaction commits
+    SYNC_ON_SAVE=False,
+    # queue admin changes in an outbox table (pushed to dkron by `drain_dkron_outbox`) instead of syncing them in the request
+    SYNC_ASYNC=False,
+    # max number of outbox entries pushed to dkron per batch
+    OUTBOX_BATCH_SIZE=100,
+    # seconds before retrying a failed outbox entry, doubled on every failure
+    OUTBOX_RETRY_DELAY=30,
+    # upper limit for the retry delay of failed outbox entries
+    OUTBOX_MAX_RETRY_DELAY=3600,
+    # number of next runs of each job kept in the upcoming runs table (0 disables it)
+    UPCOMING_RUNS=0,
+    # only runs within this many hours are kept in the upcoming runs table - refresh it with `refresh_dkron_upcoming`
+    UPCOMING_RUNS_HOURS=24,
+    # stream responses (and request bodies) through the dashboard proxy instead of buffering them in memory
+    PROXY_STREAM=False,
+    # max size (bytes) of each chunk read from dkron when streaming through the dashboard proxy
+    PROXY_CHUNK_SIZE=64 * 1024,
+    # gzip dashboard proxy responses that dkron did not compress (compressed ones are passed through as they are)
+    PROXY_GZIP=False,
+    # use the async dashboard proxy view (`views.async_proxy`, requires httpx and Django 4.2+) in `dkron.urls` - for ASGI deployments
+    PROXY_ASYNC=False,
+    # max number of connections to dkron opened by the async dashboard proxy (per event loop)
+    PROXY_ASYNC_POOL_SIZE=100,
+    # dashboard proxy GETs to cache, as {path regex: seconds} - concurrent identical requests to a matching path are
+    # sent once to dkron and the response is cached for that long (0 to only share concurrent requests)
+    PROXY_CACHE={},
+    # django cache used by DKRON_PROXY_CACHE
+    PROXY_CACHE_ALIAS='default',
+    # seconds to cache the dashboard permission decision of each session for `views.auth` (0 to check it every time)
+    AUTH_CACHE_TTL=0,
+    # django cache used by DKRON_AUTH_CACHE_TTL - should be shared by all the processes, invalidations go through it
+    AUTH_CACHE_ALIAS='default',
+    # threads sending sentry monitor check-ins and failure notifications for the webhooks in the background
+    # (0 to send them before responding to dkron)
+    WEBHOOK_WORKERS=0,
+    # seconds to buffer the job results received by the webhook for, so they are written in batches
+    # (0 to write each one as it comes) - flushed on exit as well
+    WEBHOOK_FLUSH_INTERVAL=0,
+    # keep the history of job runs received by the webhooks (`JobExecution`) - prune it with `prune_dkron_executions`
+    EXECUTIONS=False,
+    # days of history (and hourly rollups) kept by `prune_dkron_executions`
+    EXECUTIONS_RETENTION_DAYS=30,
+    # bearer token required by `views.metrics` (job runs and durations for prometheus), disabled if None
+    METRICS_TOKEN=None,
+    # run job commands through `dkron.wrapper` (overridden by `Job.use_wrapper`) to report their resource usage
+    WRAPPER=False,
+    # python used by dkron agents to run `dkron.wrapper` (the one with this app installed)
+    WRAPPER_PYTHON='python',
+    # URL called by `dkron.wrapper` to post the resource usage of job runs - exported by `run_dkron` to the job commands, so you need to map `dkron.views.usage` in your project urls.py and this should be full URL to that route and reachable by dkron agents
+    USAGE_URL=None,
+    # directory where `dkron.wrapper` writes the (gzipped) output of job commands and `run_async` commands, instead of storing all of it in dkron - exported by `run_dkron` to the job commands
+    OUTPUT_DIR=None,
+    # full URL to `dkron.views.output` (serving DKRON_OUTPUT_DIR) used to link the full output from the dkron executions, file path is used if not set
+    OUTPUT_URL=None,
+    # bytes of output written to DKRON_OUTPUT_DIR per run, the rest is dropped
+    OUTPUT_MAX_SIZE=50 * 1024 * 1024,
+    # bytes at the end of the output still stored in dkron (outputs up to this size are not written to DKRON_OUTPUT_DIR)
+    OUTPUT_TAIL=8 * 1024,
+    # warm worker processes (with django already set up) started by `run_dkron` on each agent to run `run_async` commands, instead of booting django for each of them - 0 to disable
+    WORKERS=0,
+    # unix socket of the warm worker pool, local to each agent - only accepted when the pool runs as the same user
+    WORKERS_SOCKET='/tmp/dkron-workers.sock',
+    # tasks run by each worker process before it is replaced by a fresh one
+    WORKERS_MAX_TASKS=100,
+    # management commands that http executor jobs (`Job.executor`) can run in the web app
+    HTTP_COMMANDS=(),
+    # URL called by dkron agents for http executor jobs - you need to map `dkron.views.run` in your project urls.py (`dkron.urls_api`) and this should be full URL to that route
+    HTTP_EXECUTOR_URL=None,
+    # seconds dkron waits for http executor jobs to complete
+    HTTP_EXECUTOR_TIMEOUT=60,
     # Token used by `run_dkron` for webhook calls into this app
     TOKEN=None,
-    # URL called by dkron webhooks to post job start to this app - passed as `--pre-webhook-url` to dkron, so you need to map `dkron.views.pre_webhook` in your project urls.py and this should be full URL to that route and reachable by dkron. Requires DKRON_SENTRY_CRON_URL otherwise nothing would happen
+    # URL called by dkron webhooks to post job start to this app - passed as `--pre-webhook-url` to dkron, so you need to map `dkron.views.pre_webhook` in your project urls.py and this should be full URL to that route and reachable by dkron. Requires DKRON_SENTRY_CRON_URL or DKRON_EXECUTIONS otherwise nothing would happen
     PRE_WEBHOOK_URL=None,
     # URL called by dkron webhooks to post job status to this app - passed as `--webhook-url` to dkron, so you need to map `dkron.views.webhook` in your project urls.py and this should be full URL to that route and reachable by dkron
     WEBHOOK_URL=None,
@@ -55,3 +142,9 @@ class DkronConfig(AppConfig):
                 # special one to default to reverse url
                 v = reverse('dkron:proxy')
             setattr(settings, _k, v)
+
+        if settings.DKRON_PROXY_ASYNC and django.VERSION < (4, 2):
+            # async_proxy streams with an async iterator, only supported by StreamingHttpResponse since 4.2
+            raise ImproperlyConfigured('DKRON_PROXY_ASYNC requires Django 4.2 or later')
+
+        from dkron import signals  # noqa: F401 - connect receivers
@@ -0,0 +1,314 @@
+"""
+pure python parser for the dkron schedule spec (https://dkron.io/docs/usage/cron-spec/)
+so schedules can be validated (and evaluated) without a round-trip to dkron.
+
+Follows robfig/cron (used by dkron) rules: 6 fields cron expressions (with seconds), optional `TZ=`/`CRON_TZ=` prefix,
+predefined descriptors, `@every <go duration>`, plus the dkron extensions `@at <RFC3339>`, `@manually`, `@minutely`
+and this app `@parent JOBNAME`.
+"""
+import re
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from decimal import Decimal
+from functools import lru_cache
+from itertools import count, islice, takewhile
+from typing import Iterator, NamedTuple, Optional, Union
+import zoneinfo
+
+
+class CronError(ValueError):
+    pass
+
+
+class CronSchedule(NamedTuple):
+    second: frozenset
+    minute: frozenset
+    hour: frozenset
+    day: frozenset
+    month: frozenset
+    # 0 is sunday
+    weekday: frozenset
+    # `*` (or `?`) in day of month / day of week: when only one of them is restricted, that one is used,
+    # if both are restricted a time matches if either matches
+    day_star: bool
+    weekday_star: bool
+    tz: Optional[str] = None
+
+
+class EverySchedule(NamedTuple):
+    interval: timedelta
+
+
+class AtSchedule(NamedTuple):
+    at: datetime
+
+
+class ParentSchedule(NamedTuple):
+    parent: str
+
+
+class ManualSchedule(NamedTuple):
+    pass
+
+
+Schedule = Union[CronSchedule, EverySchedule, AtSchedule, ParentSchedule, ManualSchedule]
+
+MONTH_NAMES = {
+    name: i
+    for i, name in enumerate(('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)
+}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+
+# (name, min, max, names)
+FIELDS = (
+    ('second', 0, 59, {}),
+    ('minute', 0, 59, {}),
+    ('hour', 0, 23, {}),
+    ('day of month', 1, 31, {}),
+    ('month', 1, 12, MONTH_NAMES),
+    ('day of week', 0, 6, WEEKDAY_NAMES),
+)
+
+DESCRIPTORS = {
+    '@yearly': '0 0 0 1 1 *',
+    '@annually': '0 0 0 1 1 *',
+    '@monthly': '0 0 0 1 * *',
+    '@weekly': '0 0 0 * * 0',
+    '@daily': '0 0 0 * * *',
+    '@midnight': '0 0 0 * * *',
+    '@hourly': '0 0 * * * *',
+    '@minutely': '0 * * * * *',
+}
+
+# https://pkg.go.dev/time#ParseDuration
+DURATION_UNITS = {
+    'ns': Decimal('0.000000001'),
+    'us': Decimal('0.000001'),
+    'µs': Decimal('0.000001'),
+    'μs': Decimal('0.000001'),
+    'ms': Decimal('0.001'),
+    's': Decimal(1),
+    'm': Decimal(60),
+    'h': Decimal(3600),
+}
+DURATION_RE = re.compile(r'([+-]?)((?:(?:\d+\.?\d*|\.\d+)(?:ns|us|µs|μs|ms|s|m|h))+)', re.ASCII)
+DURATION_PART_RE = re.compile(r'(\d+\.?\d*|\.\d+)(ns|us|µs|μs|ms|s|m|h)', re.ASCII)
+
+# https://pkg.go.dev/time#RFC3339 (as parsed by go)
+RFC3339_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?(?:(Z)|([+-])(\d{2}):(\d{2}))',
+    re.IGNORECASE | re.ASCII,
+)
+
+
+def parse_duration(value: str) -> timedelta:
+    """
+    parse a go duration string (such as "1h30m" or "1.5s")
+    """
+    if value in ('0', '+0', '-0'):
+        return timedelta()
+    m = DURATION_RE.fullmatch(value)
+    if m is None:
+        raise CronError(f'invalid duration {value!r}')
+    seconds = sum(Decimal(n) * DURATION_UNITS[unit] for n, unit in DURATION_PART_RE.findall(m.group(2)))
+    if m.group(1) == '-':
+        seconds = -seconds
+    return timedelta(seconds=float(seconds))
+
+
+def parse_rfc3339(value: str) -> datetime:
+    m = RFC3339_RE.fullmatch(value)
+    if m is None:
+        raise CronError(f'invalid RFC3339 date {value!r}')
+    year, month, day, hour, minute, second, fraction, utc, sign, tz_hour, tz_minute = m.groups()
+    if utc:
+        tz = timezone.utc
+    else:
+        offset = timedelta(hours=int(tz_hour), minutes=int(tz_minute))
+        if int(tz_hour) > 23 or int(tz_minute) > 59:
+            raise CronError(f'invalid RFC3339 date {value!r}')
+        tz = timezone(-offset if sign == '-' else offset)
+    try:
+        return datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            int((fraction or '0')[:6].ljust(6, '0')),
+            tzinfo=tz,
+        )
+    except ValueError as e:
+        raise CronError(f'invalid RFC3339 date {value!r}: {e}')
+
+
+def _parse_value(value: str, name: str, names: dict) -> int:
+    if value.lower() in names:
+        return names[value.lower()]
+    if not (value.isascii() and value.isdigit()):
+        raise CronError(f'{name}: invalid value {value!r}')
+    return int(value)
+
+
+def _parse_field(expr: str, name: str, low: int, high: int, names: dict) -> tuple[frozenset, bool]:
+    """
+    :return: tuple with the allowed values and whether the field is a plain `*` (or `?`)
+    """
+    values = set()
+    star = False
+    for part in expr.split(','):
+        range_step = part.split('/')
+        if len(range_step) > 2:
+            raise CronError(f'{name}: too many slashes in {part!r}')
+        bounds = range_step[0].split('-')
+        if bounds[0] in ('*', '?'):
+            if len(bounds) > 1:
+                raise CronError(f'{name}: invalid range {range_step[0]!r}')
+            start, end = low, high
+        elif len(bounds) > 2:
+            raise CronError(f'{name}: too many hyphens in {range_step[0]!r}')
+        else:
+            start = _parse_value(bounds[0], name, names)
+            end = _parse_value(bounds[1], name, names) if len(bounds) == 2 else start
+
+        step = 1
+        if len(range_step) == 2:
+            if not (range_step[1].isascii() and range_step[1].isdigit()):
+                raise CronError(f'{name}: invalid step {range_step[1]!r}')
+            step = int(range_step[1])
+            if step == 0:
+                raise CronError(f'{name}: step of range should be a positive number')
+            if len(bounds) == 1 and bounds[0] not in ('*', '?'):
+                # "N/step" means "N-max/step"
+                end = high
+        if start < low:
+            raise CronError(f'{name}: {start} is below minimum ({low})')
+        if end > high:
+            raise CronError(f'{name}: {end} is above maximum ({high})')
+        if start > end:
+            raise CronError(f'{name}: beginning of range ({start}) beyond end of range ({end})')
+
+        if bounds[0] in ('*', '?') and step == 1:
+            star = True
+        values.update(range(start, end + 1, step))
+    return frozenset(values), star
+
+
+def _parse_cron(spec: str, tz: Optional[str] = None) -> CronSchedule:
+    fields = spec.split()
+    if len(fields) != len(FIELDS):
+        raise CronError(f'expected exactly {len(FIELDS)} fields, found {len(fields)}: {spec!r}')
+    parsed = [_parse_field(expr, *field) for expr, field in zip(fields, FIELDS)]
+    return CronSchedule(*(values for values, _ in parsed), day_star=parsed[3][1], weekday_star=parsed[5][1], tz=tz)
+
+
+@lru_cache(maxsize=1024)
+def parse(spec: str) -> Schedule:
+    """
+    parse (and validate) a job schedule - results are cached as the same few specs are used all over
+
+    :raises CronError: if `spec` is not valid
+    """
+    spec = spec.strip()
+    if not spec:
+        raise CronError('empty schedule')
+
+    tz = None
+    if spec.startswith(('TZ=', 'CRON_TZ=')):
+        tz_spec, _, spec = spec.partition(' ')
+        tz = tz_spec.split('=', 1)[1]
+        try:
+            zoneinfo.ZoneInfo(tz)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise CronError(f'unknown time zone {tz!r}')
+        spec = spec.strip()
+
+    if not spec.startswith('@'):
+        return _parse_cron(spec, tz)
+
+    descriptor, _, arg = spec.partition(' ')
+    arg = arg.strip()
+    if descriptor in DESCRIPTORS and not arg:
+        return _parse_cron(DESCRIPTORS[descriptor], tz)
+    if descriptor == '@manually' and not arg:
+        return ManualSchedule()
+    if descriptor == '@every':
+        interval = parse_duration(arg)
+        # same as robfig/cron: at least one second, sub-second precision is dropped
+        return EverySchedule(max(timedelta(seconds=int(interval.total_seconds())), timedelta(seconds=1)))
+    if descriptor == '@at':
+        return AtSchedule(parse_rfc3339(arg))
+    if descriptor == '@parent':
+        if not arg or ' ' in arg:
+            raise CronError(f'invalid parent job {arg!r}')
+        return ParentSchedule(arg)
+    raise CronError(f'unrecognized descriptor {spec!r}')
+
+
+def _day_matches(c: CronSchedule, day: date) -> bool:
+    day_match = day.day in c.day
+    weekday_match = (day.weekday() + 1) % 7 in c.weekday
+    if c.day_star or c.weekday_star:
+        return day_match and weekday_match
+    return day_match or weekday_match
+
+
+def _iter_cron(c: CronSchedule, after: datetime, tz: tzinfo) -> Iterator[datetime]:
+    if c.tz:
+        tz = zoneinfo.ZoneInfo(c.tz)
+    start = after.astimezone(tz).replace(tzinfo=None, microsecond=0)
+    hours, minutes, seconds = sorted(c.hour), sorted(c.minute), sorted(c.second)
+    day = start.date()
+    # same as robfig/cron, give up on schedules that do not fire within 5 years (such as 30th of February)
+    last_day = day.replace(year=day.year + 5, day=28 if day.month == 2 else day.day)
+    while day <= last_day:
+        if day.month not in c.month:
+            day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+            continue
+        if _day_matches(c, day):
+            for hour in hours:
+                for minute in minutes:
+                    if (day, hour, minute) < (start.date(), start.hour, start.minute):
+                        continue
+                    for second in seconds:
+                        local = datetime.combine(day, time(hour, minute, second))
+                        if local <= start:
+                            continue
+                        # pytz zones (default on django<4) need localize, replace would use their LMT offset
+                        run = tz.localize(local) if hasattr(tz, 'localize') else local.replace(tzinfo=tz)
+                        if run.astimezone(timezone.utc).astimezone(tz).replace(tzinfo=None) != local:
+                            # skipped by a DST change
+                            continue
+                        yield run
+        day += timedelta(days=1)
+
+
+def iter_times(schedule: Schedule, after: datetime, tz: tzinfo = timezone.utc) -> Iterator[datetime]:
+    """
+    fire times of `schedule` strictly after `after` (aware datetime), in ascending order.
+    @every is counted from `after` (dkron counts it from when the job was scheduled) and
+    @parent / @manually never fire on their own.
+
+    :param tz: timezone used to evaluate cron expressions without `TZ=` (dkron agent local time)
+    """
+    if isinstance(schedule, CronSchedule):
+        yield from _iter_cron(schedule, after, tz)
+    elif isinstance(schedule, EverySchedule):
+        start = after.replace(microsecond=0)
+        for i in count(1):
+            yield start + i * schedule.interval
+    elif isinstance(schedule, AtSchedule):
+        if schedule.at > after:
+            yield schedule.at
+
+
+def next_times(
+    schedule: Schedule, after: datetime, limit: int, until: Optional[datetime] = None, tz: tzinfo = timezone.utc
+) -> list[datetime]:
+    """
+    up to `limit` fire times of `schedule` after `after` (and not after `until`)
+    """
+    times = islice(iter_times(schedule, after, tz=tz), limit)
+    if until is not None:
+        times = takewhile(lambda t: t <= until, times)
+    return list(times)
@@ -1,4 +1,8 @@
+import shlex
+
 from django import forms
+from django.conf import settings
+from dkron import cron
 from dkron.models import Job
 
 
@@ -9,8 +13,29 @@ class JobForm(forms.ModelForm):
             raise forms.ValidationError(
                 "Job schedule cannot start with * as this will schedule a job to start every second and can have unintended consequences."
             )
+        try:
+            cron.parse(data)
+        except cron.CronError as e:
+            raise forms.ValidationError(f"Invalid schedule - {e}")
         return data
 
+    def clean(self):
+        cleaned_data = super().clean()
+        command = cleaned_data.get("command")
+        if cleaned_data.get("executor") == "http" and not settings.DKRON_HTTP_EXECUTOR_URL:
+            self.add_error("executor", "http executor requires DKRON_HTTP_EXECUTOR_URL")
+        elif cleaned_data.get("executor") == "http" and command:
+            try:
+                args = shlex.split(command)
+            except ValueError as e:
+                self.add_error("command", f"Invalid command - {e}")
+            else:
+                if not args or args[0] not in settings.DKRON_HTTP_COMMANDS:
+                    self.add_error(
+                        "command", "Not a management command allowed for http executor (DKRON_HTTP_COMMANDS)"
+                    )
+        return cleaned_data
+
     class Meta:
         model = Job
         fields = "__all__"
@@ -15,9 +15,9 @@ class Command(LogBaseCommand):
         oldest = int((timezone.now() - timezone.timedelta(days=options['days'])).timestamp())
         self.log(f'Deleting temporary jobs with timestamp lower than {oldest}')
         to_del = []
-        jobs = utils._get('jobs', params={'metadata[temp]': 'true'}).json()
-        total = len(jobs)
-        for j in jobs:
+        total = 0
+        for j in utils.client().iter_jobs(params={'metadata[temp]': 'true'}, fields=('name',)):
+            total += 1
             try:
                 ts = int(j['name'].split('_')[-1])
             except Exception:
@@ -0,0 +1,41 @@
+import time
+
+from dkron import utils
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Push queued job changes (outbox) to dkron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int, default=None, help='Max entries per batch')
+        parser.add_argument('-w', '--workers', type=int, default=None, help='Number of jobs to sync concurrently')
+        parser.add_argument('-l', '--loop', action='store_true', help='Keep running, polling the outbox')
+        parser.add_argument(
+            '-i', '--interval', type=float, default=5, help='Seconds to wait when the outbox is empty (with --loop)'
+        )
+
+    def drain(self, options):
+        count = 0
+        for job, action, result in utils.drain_outbox(batch_size=options['batch_size'], workers=options['workers']):
+            count += 1
+            if result is None:
+                self.log(f'Job {job} {"deleted" if action == "d" else "synced"}')
+            else:
+                self.log_error(f'Job {job} failed - {result}')
+        return count
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            while self.drain(options):
+                pass
+            return
+
+        while True:
+            try:
+                if self.drain(options):
+                    continue
+            except Exception:
+                # dkron down or similar, entries are retried once their lease expires
+                self.log_exception('failed to drain outbox')
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from dkron import models, utils
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Delete job executions older than DKRON_EXECUTIONS_RETENTION_DAYS, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-d', '--days', type=float, default=None, help='Override DKRON_EXECUTIONS_RETENTION_DAYS')
+        parser.add_argument('-b', '--batch-size', type=int, default=1000, help='Max rows deleted per statement')
+        parser.add_argument(
+            '-s', '--sleep', type=float, default=0, help='Seconds to wait between batches, to spare the database'
+        )
+
+    def handle(self, *args, **options):
+        days = settings.DKRON_EXECUTIONS_RETENTION_DAYS if options['days'] is None else options['days']
+        before = timezone.now() - timezone.timedelta(days=days)
+        totals = {models.JobExecution: 0, models.JobRunRollup: 0}
+        for model, deleted in utils.prune_executions(before, batch_size=options['batch_size']):
+            totals[model] += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.log(f'{totals[models.JobExecution]} executions deleted')
+        self.log(f'{totals[models.JobRunRollup]} hourly rollups deleted')
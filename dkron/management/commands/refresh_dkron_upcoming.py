@@ -0,0 +1,9 @@
+from dkron import utils
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Recompute the upcoming runs of all jobs (schedule it to run at least every DKRON_UPCOMING_RUNS_HOURS)'
+
+    def handle(self, *args, **options):
+        self.log(f'{utils.refresh_upcoming_runs()} upcoming runs')
@@ -5,14 +5,31 @@ from logbasecommand.base import LogBaseCommand
 class Command(LogBaseCommand):
     help = 'Re-sync dkron jobs'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of jobs to sync concurrently (defaults to DKRON_RESYNC_WORKERS)',
+        )
+        parser.add_argument(
+            '--dirty-only',
+            action='store_true',
+            help='Only sync jobs changed since their last sync and delete the ones deleted or renamed since '
+            '(dkron is not listed, settings changes need a full resync)',
+        )
+
     def handle(self, *args, **options):
-        for job, action, result in utils.resync_jobs():
+        for job, action, result in utils.resync_jobs(workers=options['workers'], dirty_only=options['dirty_only']):
             if action == 'u':
                 if result is None:
                     self.stdout.write('Job %s updated\n' % job)
                 else:
                     self.stderr.write('Job %s failed\n' % job)
                     self.stderr.write('%s\n' % result)
+            elif action == 'n':
+                self.stdout.write('Job %s unchanged\n' % job)
             elif action == 'd':
                 if result is None:
                     self.stdout.write('Job %s delete\n' % job)
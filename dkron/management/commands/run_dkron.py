@@ -2,12 +2,14 @@ import tempfile
 import os
 import requests
 import shutil
+import subprocess
+import sys
 import tarfile
 from pathlib import Path
 from django.conf import settings
 
 from logbasecommand.base import LogBaseCommand
-from dkron import utils
+from dkron import utils, wrapper
 
 
 class Command(LogBaseCommand):
@@ -81,9 +83,17 @@ class Command(LogBaseCommand):
             args.extend(['--tag', f'label={settings.DKRON_JOB_LABEL}'])
         for j in options['join'] or settings.DKRON_JOIN or []:
             args.extend(['--join', j])
+        manage_py = os.path.abspath(sys.argv[0])
         if settings.DKRON_WORKDIR:
             os.chdir(settings.DKRON_WORKDIR)
-        if settings.DKRON_PRE_WEBHOOK_URL and settings.DKRON_TOKEN and settings.DKRON_SENTRY_CRON_URL:
+        if settings.DKRON_WORKERS:
+            # the pool exits along with its parent, which is the agent once this process is replaced by it
+            subprocess.Popen([sys.executable, manage_py, 'run_dkron_workers'])
+        if (
+            settings.DKRON_PRE_WEBHOOK_URL
+            and settings.DKRON_TOKEN
+            and (settings.DKRON_SENTRY_CRON_URL or settings.DKRON_EXECUTIONS)
+        ):
             flag_name = '--pre-webhook-url' if utils.dkron_binary_version() < (3, 2, 0) else '--pre-webhook-endpoint'
             args.extend(
                 [
@@ -103,4 +113,14 @@ class Command(LogBaseCommand):
                     f'{settings.DKRON_TOKEN}\n{{{{ .JobName }}}}\n{{{{ .Success }}}}',
                 ]
             )
+        if settings.DKRON_USAGE_URL and settings.DKRON_TOKEN:
+            # inherited by the job commands, for dkron.wrapper
+            os.environ[wrapper.URL_ENV] = settings.DKRON_USAGE_URL
+            os.environ[wrapper.TOKEN_ENV] = settings.DKRON_TOKEN
+        if settings.DKRON_OUTPUT_DIR:
+            os.environ[wrapper.OUTPUT_DIR_ENV] = settings.DKRON_OUTPUT_DIR
+            os.environ[wrapper.OUTPUT_MAX_SIZE_ENV] = str(settings.DKRON_OUTPUT_MAX_SIZE)
+            os.environ[wrapper.OUTPUT_TAIL_ENV] = str(settings.DKRON_OUTPUT_TAIL)
+            if settings.DKRON_OUTPUT_URL:
+                os.environ[wrapper.OUTPUT_URL_ENV] = settings.DKRON_OUTPUT_URL
         os.execv(exe_path, args)
@@ -0,0 +1,20 @@
+from django.conf import settings
+
+from dkron import workers
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Run the warm worker pool for run_async commands (started by run_dkron with DKRON_WORKERS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-w', '--workers', type=int, default=None, help='Override DKRON_WORKERS')
+        parser.add_argument('--socket', default=settings.DKRON_WORKERS_SOCKET, help='Unix socket to listen on')
+        parser.add_argument(
+            '--max-tasks', type=int, default=settings.DKRON_WORKERS_MAX_TASKS, help='Tasks run by each worker process'
+        )
+
+    def handle(self, *args, **options):
+        count = options['workers'] or settings.DKRON_WORKERS or 1
+        self.log(f'Starting {count} workers on {options["socket"]}')
+        workers.serve(options['socket'], count, options['max_tasks'])
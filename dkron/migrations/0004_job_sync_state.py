@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0003_alter_job_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dirty',
+            field=models.BooleanField(
+                db_index=True,
+                default=True,
+                editable=False,
+                help_text='Changed since last sync',
+            ),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='sync_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0004_job_sync_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobSyncOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_name', models.CharField(max_length=255, unique=True)),
+                ('action', models.CharField(choices=[('u', 'update'), ('d', 'delete')], max_length=1)),
+                ('queued_at', models.DateTimeField()),
+                ('next_attempt_at', models.DateTimeField(db_index=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0005_jobsyncoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpcomingRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_at', models.DateTimeField(db_index=True)),
+                (
+                    'job',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='upcoming_runs', to='dkron.job'
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ('run_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0006_upcomingrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobExecution',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('success', models.BooleanField(null=True)),
+                (
+                    'job',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='executions', to='dkron.job'
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['job', 'started_at'], name='dkron_jobexec_job_started'),
+                    models.Index(fields=['success', 'started_at'], name='dkron_jobexec_success_started'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0007_jobexecution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRunRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('h', 'Hour'), ('d', 'Day')], max_length=1)),
+                ('start', models.DateTimeField()),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('timed_runs', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0)),
+                ('duration_min', models.FloatField(blank=True, null=True)),
+                ('duration_max', models.FloatField(blank=True, null=True)),
+                ('histogram', models.TextField(default='')),
+                (
+                    'job',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='dkron.job'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='jobrunrollup',
+            constraint=models.UniqueConstraint(fields=('job', 'period', 'start'), name='dkron_jobrunrollup_unique'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0008_jobrunrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='jobrunrollup',
+            name='period',
+            field=models.CharField(choices=[('h', 'Hour'), ('d', 'Day'), ('t', 'Total')], max_length=1),
+        ),
+    ]
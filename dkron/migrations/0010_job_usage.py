@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0009_jobrunrollup_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='last_run_cpu_system',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='last_run_cpu_user',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='last_run_max_rss',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='last_run_wall_time',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='use_wrapper',
+            field=models.BooleanField(
+                blank=True,
+                default=None,
+                help_text='Run the command through dkron.wrapper to report its resource usage (default: DKRON_WRAPPER)',
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name='jobrunrollup',
+            name='cpu_time_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='jobrunrollup',
+            name='max_rss',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
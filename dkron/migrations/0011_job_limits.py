@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:10
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0010_job_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='max_cpu_time',
+            field=models.PositiveIntegerField(blank=True, help_text='CPU time limit, in seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='max_memory',
+            field=models.PositiveIntegerField(blank=True, help_text='Memory (address space) limit, in MiB', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='max_runtime',
+            field=models.PositiveIntegerField(
+                blank=True, help_text='Seconds before the command (and any process it started) is killed', null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='niceness',
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text='Lower the command priority (nice 0-19)',
+                null=True,
+                validators=[django.core.validators.MaxValueValidator(19)],
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('dkron', '0011_job_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='executor',
+            field=models.CharField(
+                blank=True,
+                choices=[('shell', 'shell'), ('http', 'http')],
+                default='shell',
+                help_text='http: run the management command (one of DKRON_HTTP_COMMANDS) in the web app, no new process',
+                max_length=10,
+            ),
+        ),
+    ]
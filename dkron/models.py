@@ -1,7 +1,46 @@
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.validators import MaxValueValidator
 from django.db import models
 
 
+class JobQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # keep dirty flag in sync with bulk updates as well (such as JobAdmin._change_job_enabled)
+        if 'dirty' in kwargs or not Job.SYNCED_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        kwargs['dirty'] = True
+        refresh_upcoming = settings.DKRON_UPCOMING_RUNS and Job.SCHEDULE_FIELDS.intersection(kwargs)
+        if not settings.DKRON_SYNC_ON_SAVE and not refresh_upcoming and 'name' not in kwargs:
+            return super().update(**kwargs)
+
+        # no post_save for bulk updates, handle them here
+        names = list(self.values_list('name', flat=True))
+        renamed = [name for name in names if name != kwargs.get('name', name)]
+        if 'name' in kwargs:
+            names.append(kwargs['name'])
+        rows = super().update(**kwargs)
+        if settings.DKRON_SYNC_ON_SAVE:
+            utils.queue_sync(names, using=self.db)
+        if renamed:
+            utils.queue_delete(renamed, using=self.db)
+        if refresh_upcoming:
+            utils.queue_upcoming_refresh(names, using=self.db)
+        return rows
+
+
 class Job(models.Model):
+    # fields pushed to dkron by `utils.sync_job`, changing any of them marks the job as dirty
+    # resource limits applied by dkron.wrapper, and the matching wrapper options
+    LIMIT_FIELDS = {'max_runtime': 'timeout', 'max_memory': 'memory', 'max_cpu_time': 'cpu_time', 'niceness': 'nice'}
+    SYNCED_FIELDS = frozenset(
+        ('name', 'schedule', 'command', 'executor', 'enabled', 'use_shell', 'retries', 'use_wrapper', *LIMIT_FIELDS)
+    )
+    # fields that affect when a job runs, see `UpcomingRun`
+    SCHEDULE_FIELDS = frozenset(('name', 'schedule', 'enabled'))
+
     name = models.CharField(max_length=255, null=False, blank=False, unique=True)
     schedule = models.CharField(
         max_length=255,
@@ -9,8 +48,17 @@ class Job(models.Model):
         blank=False,
         help_text='https://dkron.io/docs/usage/cron-spec/ or "@parent JOBNAME" for dependent jobs',
     )
-    # if we add more executors (besides the default "shell"), this needs to change
+    EXECUTOR_CHOICES = (('shell', 'shell'), ('http', 'http'))
+
+    # shell command, or management command (and its arguments) for the http executor
     command = models.CharField(max_length=255, null=False, blank=False)
+    executor = models.CharField(
+        max_length=10,
+        choices=EXECUTOR_CHOICES,
+        default='shell',
+        blank=True,
+        help_text='http: run the management command (one of DKRON_HTTP_COMMANDS) in the web app, no new process',
+    )
     description = models.CharField(max_length=255, null=True, blank=True)
     enabled = models.BooleanField(default=True)
     use_shell = models.BooleanField(default=False, help_text='/bin/sh -c "..."')
@@ -18,10 +66,57 @@ class Job(models.Model):
     last_run_success = models.BooleanField(null=True, editable=False)
     notify_on_error = models.BooleanField(default=True)
     retries = models.IntegerField(default=0)
+    use_wrapper = models.BooleanField(
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Run the command through dkron.wrapper to report its resource usage (default: DKRON_WRAPPER)',
+    )
+    # limits are enforced by dkron.wrapper, so setting any of them implies use_wrapper
+    max_runtime = models.PositiveIntegerField(
+        null=True, blank=True, help_text='Seconds before the command (and any process it started) is killed'
+    )
+    max_memory = models.PositiveIntegerField(null=True, blank=True, help_text='Memory (address space) limit, in MiB')
+    max_cpu_time = models.PositiveIntegerField(null=True, blank=True, help_text='CPU time limit, in seconds')
+    niceness = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=[MaxValueValidator(19)], help_text='Lower the command priority (nice 0-19)'
+    )
+    # resource usage of the last run, reported by dkron.wrapper
+    last_run_wall_time = models.FloatField(null=True, blank=True, editable=False)
+    last_run_cpu_user = models.FloatField(null=True, blank=True, editable=False)
+    last_run_cpu_system = models.FloatField(null=True, blank=True, editable=False)
+    last_run_max_rss = models.BigIntegerField(null=True, blank=True, editable=False)
+    dirty = models.BooleanField(default=True, editable=False, db_index=True, help_text='Changed since last sync')
+    synced_at = models.DateTimeField(null=True, blank=True, editable=False)
+    sync_fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    objects = JobQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        # optional in forms
+        if not self.executor:
+            self.executor = 'shell'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        job = super().from_db(db, field_names, values)
+        # name in dkron, to delete the old job once renamed (see `signals.job_saved`)
+        job._saved_name = job.__dict__.get('name')
+        return job
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.dirty = True
+        elif self.SYNCED_FIELDS.intersection(update_fields):
+            self.dirty = True
+            kwargs['update_fields'] = {*update_fields, 'dirty'}
+        super().save(*args, **kwargs)
+        self._saved_name = self.name
+
     @property
     def namespaced_name(self):
         return utils.add_namespace(self.name)
@@ -30,9 +125,156 @@ class Job(models.Model):
     def parent_name(self):
         return self.schedule[8:] if self.schedule.startswith('@parent ') else ''
 
+    @property
+    def limits(self):
+        return {option: getattr(self, field) for field, option in self.LIMIT_FIELDS.items() if getattr(self, field)}
+
+    @property
+    def wrapped(self):
+        if self.executor != 'shell':
+            return False
+        if self.limits:
+            return True
+        return settings.DKRON_WRAPPER if self.use_wrapper is None else self.use_wrapper
+
     class Meta:
         permissions = (("can_use_dashboard", "Can use the dashboard"),)
 
 
+class JobSyncOutbox(models.Model):
+    """
+    pending dkron changes, written in the same transaction as the job change (see `utils.enqueue_sync`)
+    and pushed to dkron by `drain_dkron_outbox` - only one entry per job, the latest action wins
+    """
+
+    ACTION_CHOICES = (('u', 'update'), ('d', 'delete'))
+
+    job_name = models.CharField(max_length=255, unique=True)
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES)
+    queued_at = models.DateTimeField()
+    next_attempt_at = models.DateTimeField(db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.job_name}'
+
+
+class UpcomingRun(models.Model):
+    """
+    next fire times of each enabled job, see `utils.refresh_upcoming_runs`
+    """
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='upcoming_runs')
+    run_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.job} at {self.run_at}'
+
+    class Meta:
+        ordering = ('run_at',)
+
+
+class JobExecution(models.Model):
+    """
+    history of job runs, fed by the webhooks when DKRON_EXECUTIONS is enabled (see `utils.record_execution_start`)
+    and pruned by `prune_dkron_executions`.
+    `started_at` is empty when the start was not received (no pre-webhook) and `finished_at` while still running.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='executions')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    success = models.BooleanField(null=True)
+
+    def __str__(self):
+        return f'{self.job} at {self.started_at or self.finished_at}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'started_at'], name='dkron_jobexec_job_started'),
+            models.Index(fields=['success', 'started_at'], name='dkron_jobexec_success_started'),
+        ]
+
+
+class JobRunRollup(models.Model):
+    """
+    runs of a job per hour / day (and in total), added up as executions finish (see `utils.add_rollups`)
+    """
+
+    HOUR = 'h'
+    DAY = 'd'
+    # all runs ever, a single row per job
+    TOTAL = 't'
+    TOTAL_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    PERIODS = ((HOUR, 'Hour'), (DAY, 'Day'), (TOTAL, 'Total'))
+    # upper bounds (seconds) of the duration histogram buckets, plus one for anything longer
+    DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=1, choices=PERIODS)
+    start = models.DateTimeField()
+    runs = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    # runs with a known duration (start received)
+    timed_runs = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    duration_min = models.FloatField(null=True, blank=True)
+    duration_max = models.FloatField(null=True, blank=True)
+    # comma separated counts per DURATION_BUCKETS
+    histogram = models.TextField(default='')
+    # resource usage reported by dkron.wrapper (user + system)
+    cpu_time_sum = models.FloatField(default=0)
+    max_rss = models.BigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.job} {self.get_period_display().lower()} of {self.start}'
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['job', 'period', 'start'], name='dkron_jobrunrollup_unique')]
+
+    @property
+    def buckets(self) -> list:
+        if not self.histogram:
+            return [0] * (len(self.DURATION_BUCKETS) + 1)
+        return [int(c) for c in self.histogram.split(',')]
+
+    @buckets.setter
+    def buckets(self, value):
+        self.histogram = ','.join(map(str, value))
+
+    def add(self, success: bool, duration=None):
+        self.runs += 1
+        if not success:
+            self.failures += 1
+        if duration is None:
+            return
+        self.timed_runs += 1
+        self.duration_sum += duration
+        self.duration_min = duration if self.duration_min is None else min(self.duration_min, duration)
+        self.duration_max = duration if self.duration_max is None else max(self.duration_max, duration)
+        buckets = self.buckets
+        buckets[bisect_left(self.DURATION_BUCKETS, duration)] += 1
+        self.buckets = buckets
+
+    @classmethod
+    def percentile(cls, rollups, q: float):
+        """
+        approximate (bucket upper bound, capped by the max) `q` percentile of the durations of `rollups`
+        """
+        buckets = [sum(counts) for counts in zip(*(r.buckets for r in rollups))]
+        total = sum(buckets)
+        if not total:
+            return None
+        longest = max(r.duration_max for r in rollups if r.duration_max is not None)
+        seen = 0
+        for bound, count in zip(cls.DURATION_BUCKETS + (longest,), buckets):
+            seen += count
+            if seen >= total * q:
+                return min(bound, longest)
+        return longest
+
+
 # circular dependency
 from . import utils
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_logged_out
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from dkron import models, utils
+
+
+@receiver(post_save, sender=models.Job, dispatch_uid='dkron_job_saved')
+def job_saved(sender, instance, using, update_fields=None, **kwargs):
+    previous = getattr(instance, '_saved_name', None)
+    if previous and previous != instance.name:
+        # the job under its old name is gone
+        utils.queue_delete([previous], using=using)
+    if not settings.DKRON_SYNC_ON_SAVE:
+        return
+    if update_fields is not None and not models.Job.SYNCED_FIELDS.intersection(update_fields):
+        # such as webhook updating last run
+        return
+    utils.queue_sync([instance.name], using=using)
+
+
+@receiver(post_save, sender=models.Job, dispatch_uid='dkron_job_upcoming_runs')
+def job_schedule_saved(sender, instance, using, update_fields=None, raw=False, **kwargs):
+    if not settings.DKRON_UPCOMING_RUNS or raw:
+        return
+    if update_fields is not None and not models.Job.SCHEDULE_FIELDS.intersection(update_fields):
+        return
+    # children (@parent) follow this one
+    utils.queue_upcoming_refresh([instance.name], using=using)
+
+
+@receiver(post_delete, sender=models.Job, dispatch_uid='dkron_job_deleted')
+def job_deleted(sender, instance, using, **kwargs):
+    utils.queue_delete([instance.name], using=using)
+
+
+@receiver(user_logged_out, dispatch_uid='dkron_auth_logged_out')
+def auth_logged_out(sender, request, **kwargs):
+    if request is not None and request.session.session_key:
+        utils.invalidate_auth_cache(request.session.session_key)
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='dkron_auth_user_saved')
+def auth_user_saved(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        # every login
+        return
+    # is_active, is_superuser or password (sessions of other devices) changed
+    utils.invalidate_auth_cache()
+
+
+@receiver(post_delete, sender=get_user_model(), dispatch_uid='dkron_auth_user_deleted')
+@receiver(post_delete, sender=Group, dispatch_uid='dkron_auth_group_deleted')
+def auth_deleted(sender, **kwargs):
+    utils.invalidate_auth_cache()
+
+
+@receiver(m2m_changed, dispatch_uid='dkron_auth_permissions_changed')
+def auth_permissions_changed(sender, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    user_model = get_user_model()
+    # custom user models might not have PermissionsMixin
+    through = [getattr(user_model, f).through for f in ('user_permissions', 'groups') if hasattr(user_model, f)]
+    if sender is Group.permissions.through or sender in through:
+        utils.invalidate_auth_cache()
@@ -1,11 +1,16 @@
+from django.conf import settings
 from django.urls import path, re_path
 
 from . import views
 
 app_name = 'dkron'
 
+# getattr as this is imported by DkronConfig.ready (reverse) before the default settings are all set
+proxy = views.async_proxy if getattr(settings, 'DKRON_PROXY_ASYNC', False) else views.proxy
+
 urlpatterns = [
     path('auth/', views.auth, name='auth'),
-    path('_/', views.proxy, name='proxy'),
-    re_path(r'_/(?P<path>.*)$', views.proxy),
+    path('output/<path:path>', views.output, name='output'),
+    path('_/', proxy, name='proxy'),
+    re_path(r'_/(?P<path>.*)$', proxy),
 ]
@@ -7,4 +7,7 @@ app_name = 'dkron_api'
 urlpatterns = [
     path('pre-webhook/', views.pre_webhook, name='pre_webhook'),
     path('webhook/', views.webhook, name='webhook'),
+    path('usage/', views.usage, name='usage'),
+    path('run/', views.run, name='run'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -1,19 +1,44 @@
+import asyncio
+import atexit
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 import platform
+import threading
 import time
-from typing import Any, Iterator, Literal, Optional, Union
+from typing import Any, Callable, Container, Iterable, Iterator, Literal, Optional, Union
 import requests
-from functools import lru_cache
+from urllib3.util.retry import Retry
+from functools import lru_cache, reduce
+from itertools import chain
 import re
+import shlex
 import json
 import base64
+import hashlib
+from operator import or_
+import uuid
+import weakref
+from contextlib import nullcontext
+from datetime import datetime
 
 from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
+from django import db
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 
-from dkron import models
+from dkron import cron, models, wrapper
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 logger = logging.getLogger(__name__)
 
@@ -125,46 +150,252 @@ def trim_namespace(job_name):
     return ''
 
 
-def _set_auth(kwargs) -> None:
-    if not settings.DKRON_API_AUTH:
-        return
-    if 'headers' not in kwargs:
-        kwargs['headers'] = {}
-    kwargs['headers']['Authorization'] = f'Basic {settings.DKRON_API_AUTH}'
+class _TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to every request that does not specify one
+    """
 
+    def __init__(self, *args, timeout=None, **kwargs) -> None:
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
 
-def _get(path, *a, **b) -> requests.Response:
-    _set_auth(b)
-    return requests.get(f'{api_url()}{path}', *a, **b)
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
 
 
-def _post(path, *a, **b) -> requests.Response:
-    _set_auth(b)
-    return requests.post(f'{api_url()}{path}', *a, **b)
+class DkronClient:
+    """
+    Dkron API client backed by a single keep-alive `requests.Session`.
+
+    The underlying urllib3 connection pool is thread-safe so one instance (see `client()`) is shared by every
+    caller, including the worker threads of a parallel resync.
+    Idempotent methods (GET/DELETE/...) are retried with exponential backoff on connection errors and on
+    502/503/504 responses, POSTs are never retried.
+    """
 
+    def __init__(
+        self,
+        base_url: str,
+        auth: Optional[str] = None,
+        timeout: Optional[tuple[float, float]] = None,
+        retries: int = 0,
+        backoff_factor: float = 0,
+        pool_size: int = 10,
+        page_size: int = 500,
+    ) -> None:
+        self.base_url = base_url
+        self.page_size = page_size
+        self.session = requests.Session()
+        if auth:
+            self.session.headers['Authorization'] = f'Basic {auth}'
+        adapter = _TimeoutHTTPAdapter(
+            timeout=timeout,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path, *a, **b) -> requests.Response:
+        return self.session.get(f'{self.base_url}{path}', *a, **b)
+
+    def post(self, path, *a, **b) -> requests.Response:
+        return self.session.post(f'{self.base_url}{path}', *a, **b)
+
+    def delete(self, path, *a, **b) -> requests.Response:
+        return self.session.delete(f'{self.base_url}{path}', *a, **b)
+
+    def iter_jobs(self, params: Optional[dict] = None, fields: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """
+        iterate over the jobs listed by `GET /jobs`, fetching them one page (`_start`/`_end`) at a time,
+        so only a page of jobs is in memory at once.
+        Dkron versions that do not support paging (no `X-Total-Count` header) return the full listing in one go.
+
+        :param params: extra query parameters (such as metadata filters)
+        :param fields: only keep these attributes of each job, drop everything else (status, counters, etc)
+        """
+        start = 0
+        while True:
+            r = self.get(
+                'jobs',
+                params={
+                    **(params or {}),
+                    '_sort': 'name',
+                    '_order': 'ASC',
+                    '_start': start,
+                    '_end': start + self.page_size,
+                },
+            )
+            if r.status_code != 200:
+                raise DkronException(r.status_code, r.text)
+            paged = 'X-Total-Count' in r.headers
+            jobs = r.json()
+            for job in jobs:
+                yield job if fields is None else {k: job[k] for k in fields if k in job}
+            if not paged or len(jobs) < self.page_size:
+                return
+            start += len(jobs)
 
-def _delete(path, *a, **b) -> requests.Response:
-    _set_auth(b)
-    return requests.delete(f'{api_url()}{path}', *a, **b)
+    def close(self) -> None:
+        self.session.close()
 
 
-def sync_job(job: Union[str, models.Job], job_update: Optional[Union[bool, dict]] = False) -> None:
+@lru_cache
+def client() -> DkronClient:
+    """
+    shared DkronClient for the configured dkron API
+    """
+    return DkronClient(
+        api_url(),
+        auth=settings.DKRON_API_AUTH,
+        timeout=(settings.DKRON_API_CONNECT_TIMEOUT, settings.DKRON_API_READ_TIMEOUT),
+        retries=settings.DKRON_API_RETRIES,
+        backoff_factor=settings.DKRON_API_RETRY_BACKOFF,
+        pool_size=settings.DKRON_API_POOL_SIZE,
+        page_size=settings.DKRON_API_PAGE_SIZE,
+    )
+
+
+# one client per event loop (httpx clients cannot be shared across loops)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_client() -> 'httpx.AsyncClient':
+    """
+    shared `httpx.AsyncClient` (connection pool) for the running event loop, used by `views.async_proxy`
+    """
+    if httpx is None:
+        raise ImproperlyConfigured('httpx is required for async dkron requests')
+    loop = asyncio.get_running_loop()
+    c = _async_clients.get(loop)
+    if c is None:
+        c = _async_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.DKRON_API_READ_TIMEOUT, connect=settings.DKRON_API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.DKRON_PROXY_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.DKRON_API_POOL_SIZE,
+            ),
+            # only retries failed connection attempts
+            transport=httpx.AsyncHTTPTransport(retries=settings.DKRON_API_RETRIES),
+        )
+    return c
+
+
+# job attributes managed by this app (the rest is left untouched when updating an existing job)
+JOB_MANAGED_FIELDS = (
+    'name',
+    'schedule',
+    'parent_job',
+    'executor',
+    'tags',
+    'metadata',
+    'disabled',
+    'executor_config',
+    'retries',
+)
+
+# attributes kept from dkron job listings: the managed ones plus the ones preserved when updating an existing job
+JOB_LISTING_FIELDS = JOB_MANAGED_FIELDS + (
+    'displayname',
+    'timezone',
+    'owner',
+    'owner_email',
+    'concurrency',
+    'processors',
+    'ephemeral',
+    'expires_at',
+)
+
+
+def job_to_dict(job: models.Job) -> dict[str, Any]:
+    """
+    dkron representation of the managed attributes of `job`
+    """
+    parent_job = add_namespace(job.parent_name) or None
+    return {
+        'name': job.namespaced_name,
+        'schedule': '@manually' if parent_job else job.schedule,
+        'parent_job': parent_job,
+        'executor': job.executor,
+        'tags': {'label': f'{settings.DKRON_JOB_LABEL}:1'} if settings.DKRON_JOB_LABEL else {},
+        'metadata': {'cron': 'auto'},
+        'disabled': not job.enabled,
+        'executor_config': _executor_config(job),
+        'retries': job.retries,
+    }
+
+
+def _executor_config(job: models.Job) -> dict[str, str]:
+    if job.executor == 'http':
+        return _http_executor_config(job)
+    if job.wrapped:
+        # wrapper takes care of the shell, if needed
+        command = wrapper.command(
+            job.namespaced_name, job.command, job.use_shell, python=settings.DKRON_WRAPPER_PYTHON, **job.limits
+        )
+        return {'shell': 'false', 'command': command}
+    return {'shell': 'true' if job.use_shell else 'false', 'command': job.command}
+
+
+def http_command_signer() -> signing.Signer:
+    return signing.Signer(salt='dkron.views.run')
+
+
+def _http_executor_config(job: models.Job) -> dict[str, str]:
+    if not settings.DKRON_HTTP_EXECUTOR_URL:
+        # reported as a failed sync of this job, not of the whole resync (or admin save)
+        raise DkronException(None, 'DKRON_HTTP_EXECUTOR_URL is required by http executor jobs')
+    return {
+        'method': 'POST',
+        'url': settings.DKRON_HTTP_EXECUTOR_URL,
+        'headers': '["Content-Type: text/plain"]',
+        # signed, so only this very command can be run with it (no secret stored in dkron)
+        'body': http_command_signer().sign(job.command),
+        'timeout': str(settings.DKRON_HTTP_EXECUTOR_TIMEOUT),
+        'expectCode': '200',
+    }
+
+
+def job_fingerprint(job_dict: dict[str, Any]) -> str:
+    """
+    canonical hash of the managed attributes of a dkron job dict (either from `job_to_dict` or from dkron API)
+    """
+    canonical = {k: job_dict.get(k) for k in JOB_MANAGED_FIELDS}
+    # dkron API returns empty values instead of null
+    canonical['parent_job'] = canonical['parent_job'] or None
+    canonical['tags'] = canonical['tags'] or {}
+    canonical['metadata'] = canonical['metadata'] or {}
+    canonical['executor_config'] = canonical['executor_config'] or {}
+    canonical['retries'] = canonical['retries'] or 0
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def sync_job(
+    job: Union[str, models.Job], job_update: Optional[Union[bool, dict]] = False, mark_synced: bool = True
+) -> bool:
     """
     :param job: job name or object to be created/updated (without namespace prefix, if any)
     :param job_update: fkin weird variable that can be False for job to be replaced, None to fetch current job and
                        update it or contain a dict with the existing job, saving the request (for batch operations)
-    :return:
+    :param mark_synced: clear the dirty flag of the job (database update) once it is synced
+    :return: False if the existing job (fetched or `job_update`) was already up to date, so nothing was posted
     """
     if not isinstance(job, models.Job):
         job = models.Job.objects.get(name=job)
 
-    parent_job = add_namespace(job.parent_name) or None
-    schedule = '@manually' if parent_job else job.schedule
-
     job_dict = {}
     if job_update is None:
         try:
-            r = _get(f'jobs/{job.namespaced_name}')
+            r = client().get(f'jobs/{job.namespaced_name}')
             if r.status_code == 200:
                 job_dict = r.json()
         except Exception:
@@ -173,22 +404,35 @@ def sync_job(job: Union[str, models.Job], job_update: Optional[Union[bool, dict]
     elif isinstance(job_update, dict):
         job_dict = job_update
 
-    job_dict.update(
-        {
-            'name': job.namespaced_name,
-            'schedule': schedule,
-            'parent_job': parent_job,
-            'executor': 'shell',
-            'tags': {'label': f'{settings.DKRON_JOB_LABEL}:1'} if settings.DKRON_JOB_LABEL else {},
-            'metadata': {'cron': 'auto'},
-            'disabled': not job.enabled,
-            'executor_config': {'shell': 'true' if job.use_shell else 'false', 'command': job.command},
-            'retries': job.retries,
-        }
+    desired = job_to_dict(job)
+    changed = not job_dict or job_fingerprint(job_dict) != job_fingerprint(desired)
+    if changed:
+        job_dict.update(desired)
+        r = client().post('jobs', json=job_dict)
+        if r.status_code != 201:
+            raise DkronException(r.status_code, r.text)
+    if mark_synced:
+        _mark_synced(job)
+    return changed
+
+
+def _mark_synced(job: models.Job) -> None:
+    """
+    clear dirty flag of `job`, unless it was changed (in the database) since it was loaded
+    """
+    if job.pk is None:
+        # not a real job (such as the one used to validate schedules)
+        return
+    fingerprint = job_fingerprint(job_to_dict(job))
+    if not job.dirty and job.sync_fingerprint == fingerprint:
+        # unchanged (such as most jobs of a full resync), nothing to write
+        return
+    job.dirty = False
+    job.synced_at = timezone.now()
+    job.sync_fingerprint = fingerprint
+    models.Job.objects.filter(pk=job.pk, **{f: getattr(job, f) for f in models.Job.SYNCED_FIELDS}).update(
+        dirty=False, synced_at=job.synced_at, sync_fingerprint=fingerprint
     )
-    r = _post('jobs', json=job_dict)
-    if r.status_code != 201:
-        raise DkronException(r.status_code, r.text)
 
 
 def delete_job(job: Union[str, models.Job]) -> None:
@@ -201,53 +445,128 @@ def delete_job(job: Union[str, models.Job]) -> None:
     else:
         job_name = add_namespace(job)
 
-    r = _delete(f'jobs/{job_name}')
+    r = client().delete(f'jobs/{job_name}')
     if r.status_code != 200:
         raise DkronException(r.status_code, r.text)
 
 
-def _dependency_ordered():
+def _dependency_levels(
+    jobs: Optional[Iterable[models.Job]] = None,
+    existing: Container[str] = (),
+) -> tuple[list[list[models.Job]], dict[str, str]]:
     """
-    look into dependencies graph and yield them in order
-    (so parents are always created/updated before children)
+    group jobs in dependency levels (Kahn-style, O(jobs)):
+    jobs without parent are level 0, children of level N jobs are level N+1
+    so all jobs within a level can be synced at the same time, as long as the previous levels are done
+
+    :param jobs: jobs to order, defaults to all jobs
+    :param existing: names of jobs (not in `jobs`) that can be used as parents, as they are already synced
+    :return: tuple with the levels and a dict (job name -> error) of the jobs that cannot be ordered,
+             because their parent does not exist or they are part of a circular dependency (or descend from those)
     """
+    if jobs is None:
+        jobs = models.Job.objects.all()
+
+    by_name = {}
+    children = defaultdict(list)
+    level = []
+    for job in jobs:
+        by_name[job.name] = job
+        if job.parent_name and job.parent_name not in existing:
+            children[job.parent_name].append(job)
+        else:
+            level.append(job)
+
+    levels = []
+    while level:
+        levels.append(level)
+        level = [child for job in level for child in children.pop(job.name, ())]
+
+    # anything left in `children` was never reached from a job without parent
+    broken = {}
+    for orphans in children.values():
+        for job in orphans:
+            if job.name in broken:
+                continue
+            # walk up the chain until a known broken job, a missing parent or a loop
+            chain = [job.name]
+            in_chain = {job.name}
+            while True:
+                parent = by_name[chain[-1]].parent_name
+                if parent in broken:
+                    reason = f'parent job {parent} cannot be synced'
+                    break
+                if parent not in by_name:
+                    reason = f'parent job {parent} does not exist'
+                    break
+                if parent in in_chain:
+                    loop = chain[chain.index(parent) :]
+                    for name in loop:
+                        broken[name] = f'circular dependency: {" -> ".join(loop + [parent])}'
+                    chain = chain[: chain.index(parent)]
+                    reason = f'parent job {parent} cannot be synced'
+                    break
+                chain.append(parent)
+                in_chain.add(parent)
+            # the top of the chain gets the root cause, the rest depend on it
+            for name in reversed(chain):
+                broken[name] = reason
+                reason = f'parent job {name} cannot be synced'
+
+    return levels, broken
+
+
+def _sync_job_result(job: models.Job, job_update: Union[bool, dict]) -> tuple[str, Literal["u", "n"], Optional[str]]:
+    # runs in worker threads: only talks to dkron, database is updated by the caller (see `_sync_levels`)
+    try:
+        return job.name, 'u' if sync_job(job, job_update, mark_synced=False) else 'n', None
+    except (DkronException, requests.RequestException) as e:
+        # dkron unreachable is a failure of this job as well (retried later), not of the whole run
+        return job.name, 'u', str(e)
 
-    # build graph
-    NO_PARENT = '_'
-    dep_graph = defaultdict(list)
-    for job in models.Job.objects.all():
-        p = job.parent_name or NO_PARENT
-        dep_graph[p].append(job)
 
-    # start with those without parent
-    p = NO_PARENT
-    already_processed = set()
-    while True:
-        if not dep_graph.get(p):
-            logger.error('dep_graph should not be empty: %s', p)
-            break
-        for job in dep_graph[p]:
-            already_processed.add(job.name)
-            yield job
-        del dep_graph[p]
-        # find new "parent" that has already been processed
-        for k in dep_graph:
-            if k in already_processed:
-                p = k
-                break
-        else:
-            if dep_graph:
-                logger.error('jobs left in the graph: %s', ','.join(dep_graph.keys()))
-            break
+def _delete_job_result(job_name: str) -> tuple[str, Literal["d"], Optional[str]]:
+    try:
+        delete_job(job_name)
+        return job_name, 'd', None
+    except (DkronException, requests.RequestException) as e:
+        return job_name, 'd', str(e)
 
 
-def resync_jobs() -> Iterator[tuple[str, Literal["u", "d"], Optional[str]]]:
-    r = _get('jobs', params={'metadata[cron]': 'auto'})
-    if r.status_code != 200:
-        raise DkronException(r.status_code, r.text)
+def _run_all(func: Callable, items: Iterable, workers: int) -> Iterator:
+    """
+    map `func` over `items` using up to `workers` threads (in the current thread if 1), yielding results as completed
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(*item)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(func, *item) for item in items]):
+            yield future.result()
+
 
-    previous_jobs = {}
-    for y in r.json():
+def _sync_levels(
+    levels: list[list[models.Job]], job_update: Callable[[models.Job], Union[bool, dict, None]], workers: int
+) -> Iterator[tuple[str, Literal["u", "n"], Optional[str]]]:
+    """
+    sync jobs one dependency level at a time (all jobs of a level concurrently, if workers > 1)
+    """
+    for level in levels:
+        by_name = {job.name: job for job in level}
+        # level needs to be finished before moving on to the children
+        for result in _run_all(_sync_job_result, ((job, job_update(job)) for job in level), workers):
+            if result[2] is None:
+                _mark_synced(by_name[result[0]])
+            yield result
+
+
+def _managed_dkron_jobs(fields: Iterable[str]) -> dict[str, dict[str, Any]]:
+    """
+    dkron jobs managed by this app (namespace and label), by job name
+    """
+    jobs = {}
+    for y in client().iter_jobs(params={'metadata[cron]': 'auto'}, fields=fields):
         k = trim_namespace(y['name'])
         if not k:
             # wrong namespace
@@ -258,26 +577,465 @@ def resync_jobs() -> Iterator[tuple[str, Literal["u", "d"], Optional[str]]]:
                 'job %s (%s) matches metadata but it is missing the label - maybe namespacing required?', k, y['name']
             )
             continue
-        previous_jobs[k] = y
+        jobs[k] = y
+    return jobs
+
+
+def resync_jobs(
+    workers: Optional[int] = None, dirty_only: bool = False
+) -> Iterator[tuple[str, Literal["u", "n", "d"], Optional[str]]]:
+    """
+    :param workers: number of jobs synced concurrently, defaults to `DKRON_RESYNC_WORKERS`.
+                    When higher than 1, jobs are synced one dependency level at a time (all jobs of a level
+                    in parallel) so parents still exist before their children are created.
+    :param dirty_only: only sync jobs changed (or never synced) since their last successful sync and delete the
+                       jobs recorded as deleted or renamed (outbox tombstones, see `queue_delete`) - dkron is not
+                       listed, so changes made to dkron directly or settings changes require a full resync
+    :return: iterator of (job name, action, error message) for every job updated ("u"), unchanged ("n")
+             or deleted ("d")
+    """
+    if workers is None:
+        workers = settings.DKRON_RESYNC_WORKERS
+
+    if dirty_only:
+        yield from _sync_jobs(models.Job.objects.filter(Q(dirty=True) | Q(sync_fingerprint__isnull=True)), workers)
+        yield from _delete_tombstones(workers)
+        return
+
+    started = timezone.now()
+    previous_jobs = _managed_dkron_jobs(JOB_LISTING_FIELDS)
 
-    # just post all jobs even if they already exist
-    # cheaper than checking all the differences (probably)
-    current_jobs = set()
     # look into dependencies for proper creation order...
-    for job in _dependency_ordered():
-        current_jobs.add(job.name)
-        try:
-            sync_job(job, previous_jobs.get(job.name, False))
-            yield job.name, 'u', None
-        except DkronException as e:
-            yield job.name, 'u', str(e)
+    levels, broken = _dependency_levels()
 
-    for job in set(previous_jobs) - current_jobs:
-        try:
-            delete_job(job)
-            yield job, 'd', None
-        except DkronException as e:
-            yield job, 'd', str(e)
+    # existing jobs are passed to sync_job so it only posts the ones that changed
+    yield from _sync_levels(levels, lambda job: previous_jobs.get(job.name, False), workers)
+
+    # jobs that cannot be synced are reported as failed updates (but still not deleted from dkron)
+    for job, error in broken.items():
+        yield job, 'u', error
+
+    current_jobs = set(broken).union(job.name for level in levels for job in level)
+    failed = set()
+    for result in _run_all(_delete_job_result, ((job,) for job in set(previous_jobs) - current_jobs), workers):
+        if result[2] is not None:
+            failed.add(result[0])
+        yield result
+    # deleted by this resync already (if they were still in dkron)
+    models.JobSyncOutbox.objects.filter(action='d', queued_at__lt=started).exclude(job_name__in=failed).delete()
+
+
+def _delete_tombstones(workers: int) -> Iterator[tuple[str, Literal["d"], Optional[str]]]:
+    """
+    delete the jobs queued for deletion (see `queue_delete`) from dkron, removing the successful outbox entries
+    """
+    entries = list(models.JobSyncOutbox.objects.filter(action='d'))
+    recreated = set(models.Job.objects.filter(name__in=[e.job_name for e in entries]).values_list('name', flat=True))
+    by_name = {e.job_name: e for e in entries}
+    for job_name, action, error in _run_all(
+        _delete_missing_job_result, ((e.job_name,) for e in entries if e.job_name not in recreated), workers
+    ):
+        if error is None:
+            entry = by_name[job_name]
+            # unless queued again in the meantime
+            models.JobSyncOutbox.objects.filter(pk=entry.pk, queued_at=entry.queued_at).delete()
+        yield job_name, action, error
+    # a job with the same name was created since: nothing to delete
+    models.JobSyncOutbox.objects.filter(pk__in=[by_name[name].pk for name in recreated]).delete()
+
+
+def _sync_jobs(jobs: Iterable[models.Job], workers: int) -> Iterator[tuple[str, Literal["u", "n"], Optional[str]]]:
+    """
+    sync a subset of the jobs, in dependency order - parents not in `jobs` are expected to be in dkron already
+    """
+    jobs = list(jobs)
+    names = {job.name for job in jobs}
+    parents = {job.parent_name for job in jobs if job.parent_name and job.parent_name not in names}
+    existing = set(models.Job.objects.filter(name__in=parents).values_list('name', flat=True))
+    levels, broken = _dependency_levels(jobs, existing=existing)
+
+    # existing job is fetched by sync_job (job_update=None) so unmanaged attributes are kept
+    yield from _sync_levels(levels, lambda job: None, workers)
+
+    for job, error in broken.items():
+        yield job, 'u', error
+
+
+def enqueue_sync(job_names: Iterable[str], action: Literal["u", "d"] = 'u') -> None:
+    """
+    queue jobs to be synced ("u") or deleted ("d") by `drain_outbox`.
+    Call it in the same transaction as the job change so both are committed (or rolled back) together.
+    """
+    now = timezone.now()
+    for job_name in job_names:
+        models.JobSyncOutbox.objects.update_or_create(
+            job_name=job_name,
+            defaults={'action': action, 'queued_at': now, 'next_attempt_at': now, 'attempts': 0, 'last_error': None},
+        )
+
+
+def queue_sync(job_names: Iterable[str], action: Literal["u", "d"] = 'u', using: Optional[str] = None) -> None:
+    """
+    sync jobs with dkron once the current transaction is committed (right away if not in one).
+    Jobs changed multiple times in the same transaction are only synced once, all of them in one (parallel) flush.
+    With DKRON_SYNC_ASYNC, jobs are queued in the outbox instead.
+
+    :param action: only used for the outbox, the flush syncs or deletes each job depending on whether it still exists
+    """
+    if settings.DKRON_SYNC_ASYNC:
+        enqueue_sync(job_names, action=action)
+        return
+
+    conn = transaction.get_connection(using)
+    if not conn.in_atomic_block:
+        _flush_sync(set(job_names), using)
+        return
+
+    pending = getattr(conn, 'dkron_pending_sync', None)
+    # callback is dropped by django if the transaction (or the savepoint that registered it) is rolled back
+    if pending is None or not any(entry[1] is pending[1] for entry in conn.run_on_commit):
+        names = set()
+
+        def callback():
+            conn.dkron_pending_sync = None
+            _flush_sync(names, using)
+
+        transaction.on_commit(callback, using=using)
+        pending = conn.dkron_pending_sync = (names, callback)
+    pending[0].update(job_names)
+
+
+def queue_delete(job_names: Iterable[str], using: Optional[str] = None) -> None:
+    """
+    record jobs deleted (or renamed) in the database as outbox tombstones, so `drain_outbox` and
+    `resync_jobs(dirty_only=True)` delete them from dkron even when they are not synced on save,
+    and delete them right away (once committed) with DKRON_SYNC_ON_SAVE
+    """
+    job_names = list(job_names)
+    enqueue_sync(job_names, action='d')
+    if settings.DKRON_SYNC_ON_SAVE and not settings.DKRON_SYNC_ASYNC:
+        queue_sync(job_names, action='d', using=using)
+
+
+def queue_upcoming_refresh(job_names: Iterable[str], using: Optional[str] = None) -> None:
+    """
+    `refresh_upcoming_runs` for these jobs once the current transaction is committed (right away if not in one),
+    all the jobs changed in the same transaction are refreshed together, like `queue_sync`
+    """
+    conn = transaction.get_connection(using)
+    if not conn.in_atomic_block:
+        refresh_upcoming_runs(job_names)
+        return
+
+    pending = getattr(conn, 'dkron_pending_upcoming', None)
+    if pending is None or not any(entry[1] is pending[1] for entry in conn.run_on_commit):
+        names = set()
+
+        def callback():
+            conn.dkron_pending_upcoming = None
+            refresh_upcoming_runs(names)
+
+        transaction.on_commit(callback, using=using)
+        pending = conn.dkron_pending_upcoming = (names, callback)
+    pending[0].update(job_names)
+
+
+def _flush_sync(job_names: set[str], using: Optional[str]) -> None:
+    workers = settings.DKRON_RESYNC_WORKERS
+    try:
+        jobs = list(models.Job.objects.using(using).filter(name__in=job_names))
+        deleted = job_names.difference(job.name for job in jobs)
+        done = []
+        for job_name, action, error in chain(
+            _sync_jobs(jobs, workers), _run_all(_delete_missing_job_result, ((name,) for name in deleted), workers)
+        ):
+            if error is not None:
+                logger.error('failed to sync job %s with dkron: %s', job_name, error)
+            elif action == 'd':
+                done.append(job_name)
+        # tombstones recorded by queue_delete
+        models.JobSyncOutbox.objects.filter(job_name__in=done, action='d').delete()
+    except Exception:
+        # transaction is already committed, jobs are left dirty for `resync_dkron --dirty-only`
+        logger.exception('failed to sync jobs %s with dkron', ', '.join(sorted(job_names)))
+
+
+def drain_outbox(
+    batch_size: Optional[int] = None, workers: Optional[int] = None
+) -> Iterator[tuple[str, Literal["u", "n", "d"], Optional[str]]]:
+    """
+    push a batch of the queued changes (that are due) to dkron.
+    Successful entries are removed from the outbox, failed ones are retried later with exponential backoff.
+
+    :return: iterator of (job name, action, error message), same as `resync_jobs`
+    """
+    if batch_size is None:
+        batch_size = settings.DKRON_OUTBOX_BATCH_SIZE
+    if workers is None:
+        workers = settings.DKRON_RESYNC_WORKERS
+
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            models.JobSyncOutbox.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        # lease the batch so other drainers skip it while dkron is being called
+        models.JobSyncOutbox.objects.filter(pk__in=[e.pk for e in entries]).update(
+            next_attempt_at=now + timezone.timedelta(seconds=settings.DKRON_OUTBOX_RETRY_DELAY)
+        )
+
+    by_name = {e.job_name: e for e in entries}
+    updates = models.Job.objects.filter(name__in=[e.job_name for e in entries if e.action == 'u'])
+    results = list(_sync_jobs(updates, workers))
+    # jobs deleted in the meantime have nothing to sync
+    synced = {r[0] for r in results}
+    results.extend((e.job_name, 'n', None) for e in entries if e.action == 'u' and e.job_name not in synced)
+    deletes = [e.job_name for e in entries if e.action == 'd']
+    # created again since, nothing to delete
+    recreated = set(models.Job.objects.filter(name__in=deletes).values_list('name', flat=True))
+    results.extend((job_name, 'n', None) for job_name in recreated)
+    results.extend(_run_all(_delete_missing_job_result, ((n,) for n in deletes if n not in recreated), workers))
+
+    for job_name, action, error in results:
+        entry = by_name[job_name]
+        # entry re-queued while being processed (queued_at changed) is kept for the next run
+        pending = models.JobSyncOutbox.objects.filter(pk=entry.pk, queued_at=entry.queued_at)
+        if error is None:
+            pending.delete()
+        else:
+            delay = min(settings.DKRON_OUTBOX_RETRY_DELAY * 2**entry.attempts, settings.DKRON_OUTBOX_MAX_RETRY_DELAY)
+            pending.update(
+                attempts=entry.attempts + 1,
+                last_error=error,
+                next_attempt_at=timezone.now() + timezone.timedelta(seconds=delay),
+            )
+        yield job_name, action, error
+
+
+def _delete_missing_job_result(job_name: str) -> tuple[str, Literal["d"], Optional[str]]:
+    # job already gone from dkron is as good as deleted
+    try:
+        delete_job(job_name)
+    except DkronException as e:
+        if e.code != 404:
+            return job_name, 'd', str(e)
+    except requests.RequestException as e:
+        return job_name, 'd', str(e)
+    return job_name, 'd', None
+
+
+def upcoming_runs(
+    jobs: Optional[Iterable[models.Job]] = None, after: Optional[datetime] = None
+) -> dict[str, list[datetime]]:
+    """
+    next fire times of jobs (all of them by default), limited by DKRON_UPCOMING_RUNS and DKRON_UPCOMING_RUNS_HOURS.
+    Times are computed once per distinct schedule (most jobs share a handful of them) and
+    `@parent` jobs get the times of the first ancestor with its own schedule.
+
+    :return: dict with job name -> fire times (empty for disabled jobs or jobs that only run manually)
+    """
+    if after is None:
+        after = timezone.now()
+    until = after + timezone.timedelta(hours=settings.DKRON_UPCOMING_RUNS_HOURS)
+    tz = timezone.get_default_timezone()
+
+    if jobs is None:
+        all_jobs = {job.name: job for job in models.Job.objects.only('name', 'schedule', 'enabled')}
+    else:
+        jobs = list(jobs)
+        all_jobs = _with_ancestors(jobs)
+    by_schedule = {}
+    by_job = {}
+
+    def _times(job: models.Job, chain: frozenset) -> list[datetime]:
+        if job.name in by_job:
+            return by_job[job.name]
+        times = []
+        if not job.enabled:
+            pass
+        elif job.parent_name:
+            # children run when the parent does (well, after it finishes)
+            parent = all_jobs.get(job.parent_name)
+            if parent is not None and parent.name not in chain:
+                times = _times(parent, chain | {job.name})
+        else:
+            if job.schedule not in by_schedule:
+                try:
+                    schedule = cron.parse(job.schedule)
+                except cron.CronError:
+                    by_schedule[job.schedule] = []
+                else:
+                    by_schedule[job.schedule] = cron.next_times(
+                        schedule, after, settings.DKRON_UPCOMING_RUNS, until=until, tz=tz
+                    )
+            times = by_schedule[job.schedule]
+        by_job[job.name] = times
+        return times
+
+    if jobs is None:
+        jobs = all_jobs.values()
+    return {job.name: _times(job, frozenset()) for job in jobs}
+
+
+def _with_ancestors(jobs: list[models.Job]) -> dict[str, models.Job]:
+    # `@parent` jobs need the schedule of their ancestors, loaded one generation per query
+    by_name = {job.name: job for job in jobs}
+    queried = set(by_name)
+    missing = {job.parent_name for job in jobs} - queried - {''}
+    while missing:
+        queried.update(missing)
+        parents = list(models.Job.objects.only('name', 'schedule', 'enabled').filter(name__in=missing))
+        by_name.update((job.name, job) for job in parents)
+        missing = {job.parent_name for job in parents} - queried - {''}
+    return by_name
+
+
+def _with_descendants(job_names: Iterable[str]) -> list[models.Job]:
+    # `@parent` children follow their parent, loaded one generation per query
+    Job = models.Job
+    jobs = {job.name: job for job in Job.objects.only('name', 'schedule', 'enabled').filter(name__in=set(job_names))}
+    generation = list(jobs)
+    while generation:
+        children = Job.objects.only('name', 'schedule', 'enabled').filter(
+            schedule__in=[f'@parent {name}' for name in generation]
+        )
+        generation = []
+        for child in children.exclude(name__in=list(jobs)):
+            jobs[child.name] = child
+            generation.append(child.name)
+    return list(jobs.values())
+
+
+def refresh_upcoming_runs(job_names: Optional[Iterable[str]] = None) -> int:
+    """
+    recompute the `UpcomingRun` rows of the jobs in `job_names` (and their `@parent` descendants) or of all the jobs
+
+    :return: number of rows created
+    """
+    jobs = list(models.Job.objects.only('name', 'schedule', 'enabled')) if job_names is None else None
+    if jobs is None:
+        jobs = _with_descendants(job_names)
+
+    pks = {job.name: job.pk for job in jobs}
+    runs = [
+        models.UpcomingRun(job_id=pks[name], run_at=run_at)
+        for name, times in upcoming_runs(jobs).items()
+        for run_at in times
+    ]
+    with transaction.atomic():
+        if job_names is None:
+            models.UpcomingRun.objects.all().delete()
+        else:
+            models.UpcomingRun.objects.filter(job_id__in=pks.values()).delete()
+        models.UpcomingRun.objects.bulk_create(runs, batch_size=1000)
+    return len(runs)
+
+
+def schedule_intervals(jobs: Iterable[models.Job], after: Optional[datetime] = None) -> dict[str, Optional[float]]:
+    """
+    shortest time (seconds) between the next runs of each of `jobs` (@parent ones follow their parent),
+    None for jobs not running regularly (disabled, @manually, @at or invalid schedules)
+    """
+    after = after or timezone.now()
+    tz = timezone.get_default_timezone()
+    schedules = {job.name: job.schedule for job in jobs if job.enabled}
+    by_schedule = {}
+
+    def _interval(schedule):
+        if schedule not in by_schedule:
+            try:
+                parsed = cron.parse(schedule)
+            except cron.CronError:
+                parsed = None
+            if isinstance(parsed, cron.EverySchedule):
+                by_schedule[schedule] = parsed.interval.total_seconds()
+            else:
+                times = cron.next_times(parsed, after, 10, tz=tz) if parsed is not None else []
+                by_schedule[schedule] = (
+                    min((b - a).total_seconds() for a, b in zip(times, times[1:])) if len(times) > 1 else None
+                )
+        return by_schedule[schedule]
+
+    intervals = {}
+    for name, schedule in schedules.items():
+        seen = {name}
+        while schedule is not None and schedule.startswith('@parent '):
+            parent = schedule[8:].strip()
+            schedule = None if parent in seen else schedules.get(parent)
+            seen.add(parent)
+        intervals[name] = None if schedule is None else _interval(schedule)
+    return intervals
+
+
+def record_usage(job_name: str, usage: dict[str, Any], date: Optional[datetime] = None) -> bool:
+    """
+    store the resource usage of a job run, as reported by `dkron.wrapper`, in the job
+    (and its rollups with DKRON_EXECUTIONS)
+
+    :return: whether the job exists
+    """
+    wall_time, cpu_user, cpu_system = float(usage['wall_time']), float(usage['cpu_user']), float(usage['cpu_system'])
+    rss = int(usage['max_rss'])
+    job_id = models.Job.objects.filter(name=job_name).values_list('pk', flat=True).first()
+    if job_id is None:
+        return False
+    models.Job.objects.filter(pk=job_id).update(
+        last_run_wall_time=wall_time,
+        last_run_cpu_user=cpu_user,
+        last_run_cpu_system=cpu_system,
+        last_run_max_rss=rss,
+    )
+    if not settings.DKRON_EXECUTIONS:
+        return True
+
+    Rollup = models.JobRunRollup
+    hour = timezone.localtime(date or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    keys = ((Rollup.HOUR, hour), (Rollup.DAY, hour.replace(hour=0)), (Rollup.TOTAL, Rollup.TOTAL_START))
+    Rollup.objects.bulk_create(
+        [Rollup(job_id=job_id, period=period, start=start) for period, start in keys], ignore_conflicts=True
+    )
+    Rollup.objects.filter(reduce(or_, (Q(period=period, start=start) for period, start in keys)), job_id=job_id).update(
+        cpu_time_sum=F('cpu_time_sum') + cpu_user + cpu_system, max_rss=Greatest(Coalesce('max_rss', 0), rss)
+    )
+    return True
+
+
+AUTH_CACHE_GENERATION_KEY = 'dkron:auth:generation'
+
+
+def auth_cache():
+    return caches[settings.DKRON_AUTH_CACHE_ALIAS]
+
+
+def auth_cache_key(session_key: str) -> str:
+    return 'dkron:auth:' + hashlib.sha1(session_key.encode()).hexdigest()
+
+
+def auth_cache_generation(cache=None) -> str:
+    """
+    current generation of the cached dashboard permission decisions - they are only valid for the generation they
+    were stored with
+    """
+    cache = cache or auth_cache()
+    generation = cache.get(AUTH_CACHE_GENERATION_KEY)
+    if generation is None:
+        cache.add(AUTH_CACHE_GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(AUTH_CACHE_GENERATION_KEY)
+    return generation
+
+
+def invalidate_auth_cache(session_key: Optional[str] = None) -> None:
+    """
+    drop the cached dashboard permission decision of `session_key` or all of them (on permission changes)
+    """
+    if not settings.DKRON_AUTH_CACHE_TTL:
+        return
+    if session_key is not None:
+        auth_cache().delete(auth_cache_key(session_key))
+    else:
+        auth_cache().set(AUTH_CACHE_GENERATION_KEY, uuid.uuid4().hex, None)
 
 
 try:
@@ -295,9 +1053,18 @@ except ImportError:
 
 def __run_async_dkron(_command, *args, **kwargs) -> tuple[str, str]:
     arguments = base64.b64encode(json.dumps({'args': args, 'kwargs': kwargs}).encode()).decode()
-    final_command = f'python ./manage.py run_dkron_async_command {_command} {arguments}'
+    if settings.DKRON_WORKERS:
+        # run by the warm worker pool of the agent, see `dkron.workers`
+        final_command = f'python -m dkron.workers {shlex.quote(settings.DKRON_WORKERS_SOCKET)} {_command} {arguments}'
+    else:
+        final_command = f'python ./manage.py run_dkron_async_command {_command} {arguments}'
 
     name = f'tmp_{_command}_{time.time():.0f}'
+    if settings.DKRON_OUTPUT_DIR:
+        # management commands can be chatty, keep their output out of dkron
+        final_command = wrapper.command(
+            add_namespace(name), final_command, False, python=settings.DKRON_WRAPPER_PYTHON, report_usage=False
+        )
 
     if dkron_binary_version() >= (3, 2, 2):
         # runoncreate was turned into asynchronous in https://github.com/distribworks/dkron/pull/1269
@@ -307,7 +1074,7 @@ def __run_async_dkron(_command, *args, **kwargs) -> tuple[str, str]:
         schedule = f'@at {(timezone.now() + timezone.timedelta(seconds=5)).isoformat()}'
         params = {}
 
-    r = _post(
+    r = client().post(
         'jobs',
         json={
             'name': add_namespace(name),
@@ -417,3 +1184,267 @@ def send_sentry_monitor(job: models.Job, status: Literal["in_progress", "ok", "e
         logger.exception("Failed to send monitor config to Sentry")
 
     return False
+
+
+@lru_cache
+def _dispatchers() -> tuple[ThreadPoolExecutor, ...]:
+    # single thread each, so calls for the same key run in order
+    return tuple(
+        ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'dkron-dispatch-{i}')
+        for i in range(settings.DKRON_WEBHOOK_WORKERS)
+    )
+
+
+def _dispatched(func: Callable, args: tuple, kwargs: dict) -> None:
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Failed to run %s in background', getattr(func, '__name__', func))
+    finally:
+        # worker threads keep running, do not leave their connections open
+        db.connections.close_all()
+
+
+def dispatch(key: str, func: Callable, *args, **kwargs) -> None:
+    """
+    run `func` in one of the DKRON_WEBHOOK_WORKERS background threads, so webhooks do not wait for sentry and
+    notifications - or right away if there are none.
+    Calls with the same `key` (job name) run in the order they were dispatched (job start before job end).
+    """
+    if not settings.DKRON_WEBHOOK_WORKERS:
+        func(*args, **kwargs)
+        return
+    dispatchers = _dispatchers()
+    dispatchers[hash(key) % len(dispatchers)].submit(_dispatched, func, args, kwargs)
+
+
+# write-behind buffers of webhook results (DKRON_WEBHOOK_FLUSH_INTERVAL): last run per job and executions
+_run_buffer: dict[str, tuple[bool, datetime]] = {}
+_execution_buffer: list[tuple[str, Optional[datetime], Optional[datetime], Optional[bool]]] = []
+_run_buffer_lock = threading.Lock()
+_run_buffer_flusher: Optional[threading.Thread] = None
+
+# an execution end is matched to the latest start of the job within this long
+EXECUTION_MAX_DURATION = timezone.timedelta(days=7)
+
+
+def _start_run_flusher() -> None:
+    global _run_buffer_flusher
+    # (re)started after a fork as well
+    if _run_buffer_flusher is None or not _run_buffer_flusher.is_alive():
+        _run_buffer_flusher = threading.Thread(target=_flush_runs_loop, name='dkron-run-flusher', daemon=True)
+        _run_buffer_flusher.start()
+
+
+def buffer_run(job_name: str, success: bool, date: datetime) -> None:
+    """
+    record the result of a job run, written to the database by the next `flush_runs`
+    """
+    with _run_buffer_lock:
+        previous = _run_buffer.get(job_name)
+        if previous is None or previous[1] <= date:
+            _run_buffer[job_name] = (success, date)
+        _start_run_flusher()
+
+
+def _buffer_execution(*event) -> None:
+    with _run_buffer_lock:
+        _execution_buffer.append(event)
+        _start_run_flusher()
+
+
+def record_execution_start(job_name: str, date: datetime) -> Optional[bool]:
+    """
+    add a (running) `JobExecution`, buffered with DKRON_WEBHOOK_FLUSH_INTERVAL
+
+    :return: whether the job exists, None if not known yet (buffered)
+    """
+    if settings.DKRON_WEBHOOK_FLUSH_INTERVAL:
+        _buffer_execution(job_name, date, None, None)
+        return None
+    return bool(_write_executions([(job_name, date, None, None)]))
+
+
+def record_execution_end(job_name: str, date: datetime, success: bool) -> Optional[bool]:
+    """
+    finish the latest running `JobExecution` of the job (or add a new one if its start is unknown),
+    buffered with DKRON_WEBHOOK_FLUSH_INTERVAL
+
+    :return: whether the job exists, None if not known yet (buffered)
+    """
+    if settings.DKRON_WEBHOOK_FLUSH_INTERVAL:
+        _buffer_execution(job_name, None, date, success)
+        return None
+    return bool(_write_executions([(job_name, None, date, success)]))
+
+
+def _write_executions(
+    events: list[tuple[str, Optional[datetime], Optional[datetime], Optional[bool]]], batch_size: int = 500
+) -> int:
+    """
+    write execution starts `(job name, started_at, None, None)` and ends `(job name, None, finished_at, success)`,
+    ends are matched to the latest start before them, including the starts in `events`
+
+    :return: number of events of existing jobs
+    """
+    ids = dict(models.Job.objects.filter(name__in={e[0] for e in events}).values_list('name', 'pk'))
+    events = [e for e in events if e[0] in ids]
+    starts = [e for e in events if e[2] is None]
+    ends = sorted((e for e in events if e[2] is not None), key=lambda e: e[2])
+
+    created = [models.JobExecution(job_id=ids[name], started_at=started_at) for name, started_at, _, _ in starts]
+    running = defaultdict(list)
+    if ends:
+        running_in_db = models.JobExecution.objects.filter(
+            job_id__in={ids[e[0]] for e in ends},
+            finished_at__isnull=True,
+            started_at__gte=ends[0][2] - EXECUTION_MAX_DURATION,
+        ).only('pk', 'job_id', 'started_at')
+        for execution in chain(running_in_db, created):
+            running[execution.job_id].append(execution)
+        for executions in running.values():
+            executions.sort(key=lambda e: e.started_at)
+
+    updated = []
+    for name, _, finished_at, success in ends:
+        executions = running[ids[name]]
+        execution = next((e for e in reversed(executions) if e.started_at <= finished_at), None)
+        if execution is None:
+            created.append(models.JobExecution(job_id=ids[name], finished_at=finished_at, success=success))
+            continue
+        executions.remove(execution)
+        execution.finished_at = finished_at
+        execution.success = success
+        if execution.pk is not None:
+            updated.append(execution)
+
+    finished = [e for e in chain(created, updated) if e.finished_at is not None]
+    # no transaction (savepoint) for the single statement of each execution start
+    with transaction.atomic() if finished else nullcontext():
+        if created:
+            models.JobExecution.objects.bulk_create(created, batch_size=batch_size)
+        if updated:
+            models.JobExecution.objects.bulk_update(updated, ['finished_at', 'success'], batch_size=batch_size)
+        if finished:
+            add_rollups(finished)
+    return len(events)
+
+
+# (job, period, start) keys per lookup query, as OR-ed filters are nested expressions for some databases (sqlite)
+ROLLUP_LOOKUP_BATCH_SIZE = 300
+
+
+def add_rollups(executions: Iterable[models.JobExecution]) -> None:
+    """
+    add finished `executions` to the hourly, daily and total `JobRunRollup` of their job (in the default timezone),
+    rows are locked while updated so concurrent flushes add up
+    """
+    Rollup = models.JobRunRollup
+    runs = defaultdict(list)
+    for e in executions:
+        hour = timezone.localtime(e.finished_at).replace(minute=0, second=0, microsecond=0)
+        duration = (e.finished_at - e.started_at).total_seconds() if e.started_at else None
+        runs[e.job_id, Rollup.HOUR, hour].append((e.success, duration))
+        runs[e.job_id, Rollup.DAY, hour.replace(hour=0)].append((e.success, duration))
+        runs[e.job_id, Rollup.TOTAL, Rollup.TOTAL_START].append((e.success, duration))
+
+    Rollup.objects.bulk_create([Rollup(job_id=k[0], period=k[1], start=k[2]) for k in runs], ignore_conflicts=True)
+    keys = list(runs)
+    pks = []
+    for i in range(0, len(keys), ROLLUP_LOOKUP_BATCH_SIZE):
+        lookup = (
+            Q(job_id=job_id, period=period, start=start)
+            for job_id, period, start in keys[i : i + ROLLUP_LOOKUP_BATCH_SIZE]
+        )
+        pks.extend(Rollup.objects.filter(reduce(or_, lookup)).values_list('pk', flat=True))
+    # always locked in the same (pk) order, so concurrent flushes wait for each other instead of deadlocking
+    pks.sort()
+    changed = []
+    for i in range(0, len(pks), ROLLUP_LOOKUP_BATCH_SIZE):
+        for rollup in (
+            Rollup.objects.select_for_update().filter(pk__in=pks[i : i + ROLLUP_LOOKUP_BATCH_SIZE]).order_by('pk')
+        ):
+            key = (rollup.job_id, rollup.period, rollup.start)
+            for success, duration in runs[key]:
+                rollup.add(success, duration)
+            changed.append(rollup)
+    Rollup.objects.bulk_update(
+        changed,
+        ['runs', 'failures', 'timed_runs', 'duration_sum', 'duration_min', 'duration_max', 'histogram'],
+        batch_size=500,
+    )
+
+
+def prune_executions(before: datetime, batch_size: int = 1000) -> Iterator[tuple[type, int]]:
+    """
+    delete executions finished (or started, if they never finished) before `before` and hourly rollups
+    (daily ones are kept), `batch_size` rows per statement so the tables are never locked for long
+
+    :return: iterator of the model and number of rows deleted by each batch
+    """
+    Rollup, Execution = models.JobRunRollup, models.JobExecution
+    for model, old in (
+        # a few rows per job and hour
+        (Rollup, Rollup.objects.filter(period=Rollup.HOUR, start__lt=before)),
+        (Execution, Execution.objects.filter(finished_at__lt=before)),
+        (Execution, Execution.objects.filter(success__isnull=True, finished_at__isnull=True, started_at__lt=before)),
+    ):
+        while True:
+            pks = list(old.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            deleted, _ = model.objects.filter(pk__in=pks).delete()
+            yield model, deleted
+
+
+def _flush_runs_loop() -> None:
+    while True:
+        time.sleep(settings.DKRON_WEBHOOK_FLUSH_INTERVAL or 1)
+        try:
+            flush_runs()
+        except Exception:
+            logger.exception('Failed to flush job runs')
+        finally:
+            db.connections.close_all()
+
+
+@atexit.register
+def flush_runs(batch_size: int = 500) -> int:
+    """
+    write the buffered job runs with one UPDATE per `batch_size` jobs, runs older than the one already stored
+    (flushed by another process) are skipped. Then the buffered executions, in bulk.
+
+    :return: number of buffered jobs and executions events
+    """
+    global _run_buffer, _execution_buffer
+    with _run_buffer_lock:
+        runs, _run_buffer = _run_buffer, {}
+        events, _execution_buffer = _execution_buffer, []
+
+    names = list(runs)
+    try:
+        while names:
+            batch = names[:batch_size]
+            newer = {
+                name: Q(name=name) & (Q(last_run_date__isnull=True) | Q(last_run_date__lte=runs[name][1]))
+                for name in batch
+            }
+            models.Job.objects.filter(name__in=batch).update(
+                last_run_success=Case(
+                    *(When(newer[name], then=Value(runs[name][0])) for name in batch), default=F('last_run_success')
+                ),
+                last_run_date=Case(
+                    *(When(newer[name], then=Value(runs[name][1])) for name in batch), default=F('last_run_date')
+                ),
+            )
+            del names[:batch_size]
+        if events:
+            _write_executions(events, batch_size=batch_size)
+    except Exception:
+        # try again next time, unless newer runs came in meanwhile
+        with _run_buffer_lock:
+            for name in names:
+                _run_buffer.setdefault(name, runs[name])
+            _execution_buffer[:0] = events
+        raise
+    return len(runs) + len(events)
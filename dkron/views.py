@@ -1,26 +1,70 @@
+from concurrent.futures import Future
+from functools import lru_cache
+from io import StringIO
+from urllib.parse import urlencode
+import gzip
+import hashlib
+import json
+import re
+import shlex
+import threading
+import traceback
+
 import requests
+from asgiref.sync import sync_to_async
+from requests.structures import CaseInsensitiveDict
 
 from django import http
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import reverse
 from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Prefetch
 from django.utils import timezone
+from django.utils._os import safe_join
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import permission_required
+from django.core.management import call_command
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 
 from notifications.utils import notify
 from dkron import models, utils
 
 
 def auth(request):
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not settings.DKRON_AUTH_CACHE_TTL or not session_key:
+        return http.HttpResponse(status=_auth_status(request))
+
+    # hit for every request of the dashboard, so the decision is cached by session without loading it (nor the user)
+    cache = utils.auth_cache()
+    key = utils.auth_cache_key(session_key)
+    cached = cache.get_many([key, utils.AUTH_CACHE_GENERATION_KEY])
+    generation = cached.get(utils.AUTH_CACHE_GENERATION_KEY) or utils.auth_cache_generation(cache)
+    if key in cached and cached[key][0] == generation:
+        return http.HttpResponse(status=cached[key][1])
+
+    status = _auth_status(request)
+    if request.session.session_key == session_key:
+        # only existing sessions, not any cookie value sent
+        cache.set(key, (generation, status), settings.DKRON_AUTH_CACHE_TTL)
+    return http.HttpResponse(status=status)
+
+
+def _auth_status(request):
     # great thing User object is already filled in because Cookies were shared anyway (assuming ProxyPass in nginx)
     # cannot use decorator though because of redirect... fail response needs to be 401 or 403
     # use 401 so nginx redirects to login
     if not request.user.is_authenticated:
-        return http.HttpResponse(status=401)
+        return 401
     # and 403 to display access forbidden
     if not request.user.has_perm('dkron.can_use_dashboard'):
-        return http.HttpResponseForbidden()
-    return http.HttpResponse()
+        return 403
+    return 200
 
 
 @csrf_exempt
@@ -42,11 +86,22 @@ def pre_webhook(request):
     if not job_name:
         return http.HttpResponseNotFound()
 
-    o = models.Job.objects.filter(name=job_name).first()
+    jobs = models.Job.objects.filter(name=job_name)
+    if settings.DKRON_EXECUTIONS:
+        if utils.record_execution_start(job_name, timezone.now()) is False:
+            return http.HttpResponseNotFound()
+    elif not settings.DKRON_SENTRY_CRON_URL:
+        # nothing else to do
+        return http.HttpResponse() if jobs.exists() else http.HttpResponseNotFound()
+
+    if not settings.DKRON_SENTRY_CRON_URL:
+        return http.HttpResponse()
+
+    o = jobs.first()
     if o is None:
         return http.HttpResponseNotFound()
 
-    utils.send_sentry_monitor(o, "in_progress")
+    utils.dispatch(o.name, utils.send_sentry_monitor, o, "in_progress")
 
     return http.HttpResponse()
 
@@ -70,18 +125,34 @@ def webhook(request):
     if not job_name:
         return http.HttpResponseNotFound()
 
-    o = models.Job.objects.filter(name=job_name).first()
-    if o is None:
+    success = lines[2] == 'true'
+    now = timezone.now()
+    jobs = models.Job.objects.filter(name=job_name)
+    if settings.DKRON_WEBHOOK_FLUSH_INTERVAL:
+        # written in batches, unknown jobs are only found out (and skipped) then
+        utils.buffer_run(job_name, success, now)
+    # single UPDATE, webhooks of all the jobs scheduled at the same time come in together
+    elif not jobs.update(last_run_success=success, last_run_date=now):
         return http.HttpResponseNotFound()
 
-    o.last_run_success = lines[2] == 'true'
-    o.last_run_date = timezone.now()
-    o.save()
+    if settings.DKRON_EXECUTIONS:
+        utils.record_execution_end(job_name, now, success)
+
+    if not settings.DKRON_SENTRY_CRON_URL and success:
+        return http.HttpResponse()
+
+    # only loaded when there is something else to do
+    o = jobs.first()
+    if o is None:
+        return http.HttpResponseNotFound() if settings.DKRON_WEBHOOK_FLUSH_INTERVAL else http.HttpResponse()
 
-    utils.send_sentry_monitor(o, "ok" if o.last_run_success else "error")
+    if settings.DKRON_SENTRY_CRON_URL:
+        utils.dispatch(o.name, utils.send_sentry_monitor, o, "ok" if success else "error")
 
-    if not o.last_run_success and o.notify_on_error:
-        notify(
+    if not success and o.notify_on_error:
+        utils.dispatch(
+            o.name,
+            notify,
             'dkron_failed_job',
             f''':red-pipeline: dkron job *{o.name}* <{request.build_absolute_uri(
                 utils.job_executions(o.name)
@@ -90,6 +161,164 @@ def webhook(request):
     return http.HttpResponse()
 
 
+@csrf_exempt
+def usage(request):
+    """
+    resource usage of a job run, reported by `dkron.wrapper`
+    """
+    if settings.DKRON_TOKEN is None:
+        return http.HttpResponseNotFound()
+
+    if request.method != 'POST':
+        return http.HttpResponseBadRequest()
+
+    lines = request.body.decode().splitlines()
+    if len(lines) != 3:
+        return http.HttpResponseBadRequest()
+
+    if lines[0] != settings.DKRON_TOKEN:
+        return http.HttpResponseForbidden()
+
+    job_name = utils.trim_namespace(lines[1])
+    if not job_name:
+        return http.HttpResponseNotFound()
+
+    try:
+        found = utils.record_usage(job_name, json.loads(lines[2]))
+    except (ValueError, TypeError, KeyError):
+        return http.HttpResponseBadRequest()
+    if not found:
+        return http.HttpResponseNotFound()
+    return http.HttpResponse()
+
+
+@csrf_exempt
+def run(request):
+    """
+    management command of an http executor job (see `Job.executor`), run in this process - its output is the response
+    """
+    if not settings.DKRON_HTTP_COMMANDS:
+        return http.HttpResponseNotFound()
+
+    if request.method != 'POST':
+        return http.HttpResponseBadRequest()
+
+    try:
+        command = utils.http_command_signer().unsign(request.body.decode())
+    except (signing.BadSignature, UnicodeDecodeError):
+        return http.HttpResponseForbidden()
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        # such as unbalanced quotes, in a job saved without the form validation
+        return http.HttpResponseBadRequest()
+    if not args or args[0] not in settings.DKRON_HTTP_COMMANDS:
+        return http.HttpResponseForbidden()
+
+    output = StringIO()
+    failed = False
+    try:
+        call_command(*args, stdout=output, stderr=output)
+    except SystemExit as e:
+        failed = bool(e.code)
+    except Exception:
+        output.write(traceback.format_exc())
+        failed = True
+    status = 500 if failed else 200
+    return http.HttpResponse(output.getvalue(), status=status, content_type='text/plain; charset=utf-8')
+
+
+def metrics(request):
+    """
+    job runs and durations (from the rollups, see DKRON_EXECUTIONS) in prometheus text format
+    """
+    if settings.DKRON_METRICS_TOKEN is None:
+        return http.HttpResponseNotFound()
+    if request.headers.get('Authorization') != f'Bearer {settings.DKRON_METRICS_TOKEN}':
+        return http.HttpResponseForbidden()
+
+    Rollup = models.JobRunRollup
+    jobs = models.Job.objects.only('name', 'schedule', 'enabled').prefetch_related(
+        Prefetch('rollups', queryset=Rollup.objects.filter(period=Rollup.TOTAL), to_attr='total_rollups'),
+        Prefetch(
+            'rollups',
+            queryset=Rollup.objects.filter(
+                period=Rollup.HOUR, start__gte=timezone.now() - timezone.timedelta(hours=24)
+            ),
+            to_attr='recent_rollups',
+        ),
+    )
+    jobs = list(jobs)
+    intervals = utils.schedule_intervals(jobs)
+
+    metrics = {
+        'dkron_job_runs_total': ('counter', 'Job runs received by the webhook', []),
+        'dkron_job_failures_total': ('counter', 'Failed job runs received by the webhook', []),
+        'dkron_job_duration_seconds': ('histogram', 'Duration of the job runs with a known start', []),
+        'dkron_job_duration_p95_seconds': ('gauge', 'Approximate 95th percentile of the job duration (24h)', []),
+        'dkron_job_schedule_interval_seconds': ('gauge', 'Shortest time between the next runs of the job', []),
+        'dkron_job_cpu_seconds_total': ('counter', 'CPU time (user and system) reported by dkron.wrapper', []),
+        'dkron_job_max_rss_bytes': ('gauge', 'Peak RSS reported by dkron.wrapper (24h)', []),
+    }
+    for job in jobs:
+        labels = f'namespace="{_metric_label(utils.namespace())}",job="{_metric_label(job.name)}"'
+        total = job.total_rollups[0] if job.total_rollups else Rollup(job=job)
+        metrics['dkron_job_runs_total'][2].append(f'{{{labels}}} {total.runs}')
+        metrics['dkron_job_failures_total'][2].append(f'{{{labels}}} {total.failures}')
+        samples = metrics['dkron_job_duration_seconds'][2]
+        count = 0
+        for bound, n in zip(Rollup.DURATION_BUCKETS, total.buckets):
+            count += n
+            samples.append(f'_bucket{{{labels},le="{bound}"}} {count}')
+        samples.append(f'_bucket{{{labels},le="+Inf"}} {total.timed_runs}')
+        samples.append(f'_sum{{{labels}}} {total.duration_sum}')
+        samples.append(f'_count{{{labels}}} {total.timed_runs}')
+        p95 = Rollup.percentile(job.recent_rollups, 0.95)
+        if p95 is not None:
+            metrics['dkron_job_duration_p95_seconds'][2].append(f'{{{labels}}} {p95}')
+        if intervals.get(job.name) is not None:
+            metrics['dkron_job_schedule_interval_seconds'][2].append(f'{{{labels}}} {intervals[job.name]}')
+        metrics['dkron_job_cpu_seconds_total'][2].append(f'{{{labels}}} {total.cpu_time_sum}')
+        max_rss = max((r.max_rss for r in job.recent_rollups if r.max_rss is not None), default=None)
+        if max_rss is not None:
+            metrics['dkron_job_max_rss_bytes'][2].append(f'{{{labels}}} {max_rss}')
+
+    lines = []
+    for name, (kind, help_text, samples) in metrics.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{sample}' for sample in samples)
+    return http.HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _metric_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@permission_required('dkron.can_use_dashboard')
+def output(request, path):
+    """
+    job output written by `dkron.wrapper` to DKRON_OUTPUT_DIR
+    """
+    if not settings.DKRON_OUTPUT_DIR or not path.endswith('.log.gz'):
+        return http.HttpResponseNotFound()
+    compressed = bool(_accepted_encodings(request).get('gzip'))
+    try:
+        full_path = safe_join(settings.DKRON_OUTPUT_DIR, path)
+        # stored compressed, sent as is when possible
+        f = open(full_path, 'rb') if compressed else gzip.open(full_path)
+    except (SuspiciousFileOperation, OSError):
+        return http.HttpResponseNotFound()
+
+    if compressed:
+        response = http.FileResponse(f, content_type='text/plain; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = http.StreamingHttpResponse(f, content_type='text/plain; charset=utf-8')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
 @permission_required('dkron.can_use_dashboard')
 @csrf_exempt
 def proxy(request, path=None):
@@ -100,6 +329,200 @@ def proxy(request, path=None):
 
     refer to `dkron authentication` section in docs #FIXME
     """
+    ttl = _cache_ttl(request, path)
+    if ttl is not None:
+        return _cached_proxy(request, path, ttl)
+
+    headers = _upstream_headers(request)
+    url = utils.dkron_url() + (path or '')
+
+    if settings.DKRON_PROXY_STREAM:
+        # shared keep-alive session, body relayed in both directions chunk by chunk
+        response = utils.client().session.request(
+            request.method,
+            url,
+            allow_redirects=False,
+            headers=headers,
+            params=request.GET.copy(),
+            data=_request_body(request),
+            stream=True,
+        )
+        passthrough = _passthrough_encoding(request, response.headers)
+        proxy_response = http.StreamingHttpResponse(_iter_response(response, passthrough), status=response.status_code)
+    else:
+        response = requests.request(
+            request.method,
+            url,
+            allow_redirects=False,
+            headers=headers,
+            params=request.GET.copy(),
+            data=request.body,
+            # not to stream it, but to be able to read the raw (still compressed) body
+            stream=True,
+        )
+        passthrough = _passthrough_encoding(request, response.headers)
+        with response:
+            content = response.raw.read(decode_content=False) if passthrough else response.content
+        proxy_response = http.HttpResponse(content, status=response.status_code)
+
+    return _finish_response(request, proxy_response, response.headers, path, passthrough)
+
+
+async def async_proxy(request, path=None):
+    """
+    same as `proxy` but as an async view (for ASGI deployments), using a pooled `httpx.AsyncClient`
+    so waiting on dkron does not hold a worker thread - map it instead of `proxy` (or set DKRON_PROXY_ASYNC)
+    """
+    if not await sync_to_async(_can_use_dashboard)(request):
+        # same as permission_required
+        return redirect_to_login(request.get_full_path())
+
+    ttl = _cache_ttl(request, path)
+    if ttl is not None:
+        # shares the cache and the in-flight requests with the sync view, blocking a thread only for cache misses
+        return await sync_to_async(_cached_proxy, thread_sensitive=False)(request, path, ttl)
+
+    client = utils.async_client()
+    upstream_request = client.build_request(
+        request.method,
+        utils.dkron_url() + (path or ''),
+        headers=_upstream_headers(request),
+        params=[(k, v) for k, values in request.GET.lists() for v in values],
+        content=request.body,
+    )
+    response = await client.send(upstream_request, stream=True)
+    passthrough = _passthrough_encoding(request, response.headers)
+    if settings.DKRON_PROXY_STREAM:
+        proxy_response = http.StreamingHttpResponse(_aiter_response(response, passthrough), status=response.status_code)
+    else:
+        content = b''.join([chunk async for chunk in _aiter_response(response, passthrough)])
+        proxy_response = http.HttpResponse(content, status=response.status_code)
+
+    return _finish_response(request, proxy_response, response.headers, path, passthrough)
+
+
+# django < 5 csrf_exempt does not support async views
+async_proxy.csrf_exempt = True
+
+
+@lru_cache
+def _cache_rules(rules):
+    return [(re.compile(pattern), ttl) for pattern, ttl in rules]
+
+
+def _cache_ttl(request, path):
+    """
+    seconds to cache the response for (0 to only share concurrent requests) or None if not cacheable at all
+    """
+    if request.method != 'GET' or not settings.DKRON_PROXY_CACHE:
+        return None
+    for pattern, ttl in _cache_rules(tuple(settings.DKRON_PROXY_CACHE.items())):
+        if pattern.search(path or ''):
+            return ttl
+    return None
+
+
+# requests to dkron currently running in this process, by cache key
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _single_flight(key, fetch):
+    """
+    call `fetch` unless there is already a call for the same `key` running, in which case wait for its result
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+    try:
+        result = fetch()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _fetch_cacheable(request, path):
+    headers = _upstream_headers(request)
+    # shared response, so no conditional requests and a fixed encoding
+    headers = {k: v for k, v in headers.items() if k.lower() not in ('if-none-match', 'if-modified-since')}
+    headers['Accept-Encoding'] = 'gzip'
+    response = utils.client().session.request(
+        'GET',
+        utils.dkron_url() + (path or ''),
+        allow_redirects=False,
+        headers=headers,
+        params=request.GET.copy(),
+        stream=True,
+    )
+    with response:
+        encoding = response.headers.get('Content-Encoding', '').strip().lower()
+        if encoding == 'gzip':
+            body = response.raw.read(decode_content=False)
+        else:
+            body = response.content
+            encoding = ''
+    return {
+        'status': response.status_code,
+        'headers': [(k, v) for k, v in response.headers.items() if k.lower() not in ('content-encoding', 'etag')],
+        'encoding': encoding,
+        'body': body,
+        'hash': hashlib.sha1(body).hexdigest(),
+    }
+
+
+def _cached_proxy(request, path, ttl):
+    query = urlencode(sorted((k, v) for k, values in request.GET.lists() for v in values))
+    key = 'dkron:proxy:' + hashlib.sha1(f'{path or ""}?{query}'.encode()).hexdigest()
+    cache = caches[settings.DKRON_PROXY_CACHE_ALIAS]
+    entry = cache.get(key) if ttl else None
+    if entry is None:
+        entry = _single_flight(key, lambda: _fetch_cacheable(request, path))
+        if ttl and entry['status'] == 200:
+            cache.set(key, entry, ttl)
+
+    passthrough = bool(entry['encoding']) and _passthrough_encoding(request, {'Content-Encoding': entry['encoding']})
+    etag = f'"{entry["hash"]}-{entry["encoding"]}"' if passthrough else f'"{entry["hash"]}"'
+    headers = CaseInsensitiveDict(entry['headers'])
+    if passthrough:
+        headers['Content-Encoding'] = entry['encoding']
+    if entry['status'] == 200:
+        headers['ETag'] = etag
+        if etag in {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}:
+            proxy_response = http.HttpResponseNotModified()
+            proxy_response['ETag'] = etag
+            if entry['encoding']:
+                patch_vary_headers(proxy_response, ('Accept-Encoding',))
+            return proxy_response
+
+    if passthrough or not entry['encoding']:
+        body = entry['body']
+    else:
+        body = gzip.decompress(entry['body'])
+    proxy_response = _finish_response(
+        request, http.HttpResponse(body, status=entry['status']), headers, path, passthrough
+    )
+    if entry['encoding']:
+        # same URL, different body depending on it
+        patch_vary_headers(proxy_response, ('Accept-Encoding',))
+    return proxy_response
+
+
+def _can_use_dashboard(request):
+    # request.user is lazy, loading it hits the database
+    return request.user.has_perm('dkron.can_use_dashboard')
+
+
+def _upstream_headers(request):
     headers = {
         k: v
         for k, v in request.headers.items()
@@ -107,22 +530,12 @@ def proxy(request, path=None):
         # also, dkron does not use cookies, simply drop the whole header to avoid sending django app session over
         if k.lower() not in ('content-length', 'cookie')
     }
-    url = utils.dkron_url() + (path or '')
-
     if settings.DKRON_API_AUTH:
         headers['Authorization'] = f'Basic {settings.DKRON_API_AUTH}'
+    return headers
 
-    response = requests.request(
-        request.method,
-        url,
-        allow_redirects=False,
-        headers=headers,
-        params=request.GET.copy(),
-        data=request.body,
-    )
-
-    proxy_response = http.HttpResponse(response.content, status=response.status_code)
 
+def _finish_response(request, proxy_response, upstream_headers, path, passthrough):
     excluded_headers = set(
         [
             # Hop-by-hop headers
@@ -148,7 +561,10 @@ def proxy(request, path=None):
             'content-length',
         ]
     )
-    for key, value in response.headers.items():
+    if passthrough:
+        # body is sent as compressed by dkron
+        excluded_headers.remove('content-encoding')
+    for key, value in upstream_headers.items():
         if key.lower() in excluded_headers:
             continue
         elif key.lower() == 'location':
@@ -156,9 +572,97 @@ def proxy(request, path=None):
         else:
             proxy_response[key] = value
 
+    if settings.DKRON_PROXY_GZIP and not passthrough:
+        # no-op if client does not accept gzip or the response is too small
+        proxy_response = GZipMiddleware(lambda r: proxy_response).process_response(request, proxy_response)
+    elif passthrough:
+        patch_vary_headers(proxy_response, ('Accept-Encoding',))
+
     return proxy_response
 
 
+def _accepted_encodings(request):
+    accepted = {}
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            k, _, v = param.partition('=')
+            if k.strip().lower() == 'q':
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _passthrough_encoding(request, upstream_headers):
+    """
+    whether the (compressed) upstream body can be sent to the client as is, instead of decompressing it
+    """
+    encoding = upstream_headers.get('Content-Encoding')
+    if not encoding:
+        return False
+    accepted = _accepted_encodings(request)
+    return all(
+        accepted.get(coding.strip().lower(), accepted.get('*', 0)) > 0
+        for coding in encoding.split(',')
+        if coding.strip().lower() != 'identity'
+    )
+
+
+class _StreamedBody:
+    """
+    file-like wrapper of the client request body, so it is read as it is sent upstream
+    (`__len__` makes requests send it with a Content-Length instead of chunked)
+    """
+
+    def __init__(self, request, length):
+        self.request = request
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.request.read(size)
+
+
+def _request_body(request):
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if not length:
+        return None
+    if hasattr(request, '_body'):
+        # already read (by some middleware)
+        return request.body
+    return _StreamedBody(request, length)
+
+
+def _iter_response(response, passthrough=False):
+    try:
+        if passthrough:
+            yield from response.raw.stream(settings.DKRON_PROXY_CHUNK_SIZE, decode_content=False)
+        else:
+            yield from response.iter_content(chunk_size=settings.DKRON_PROXY_CHUNK_SIZE)
+    finally:
+        # called once the response is sent (or the client disconnects), releasing the connection back to the pool
+        response.close()
+
+
+async def _aiter_response(response, passthrough=False):
+    try:
+        if passthrough:
+            chunks = response.aiter_raw(settings.DKRON_PROXY_CHUNK_SIZE)
+        else:
+            chunks = response.aiter_bytes(settings.DKRON_PROXY_CHUNK_SIZE)
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await response.aclose()
+
+
 def _fix_location_header(path, location):
     base = reverse('dkron:proxy')
     if location.startswith(utils.dkron_url()):
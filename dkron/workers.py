@@ -0,0 +1,228 @@
+"""
+warm worker pool for `utils.run_async` commands (see DKRON_WORKERS)
+
+    python -m dkron.workers SOCKET COMMAND [ARGUMENTS]
+
+`run_dkron_workers` (started by `run_dkron`) keeps DKRON_WORKERS pre-forked processes, with django already set up,
+accepting tasks on a local unix socket. The dkron job runs this light client instead of
+`manage.py run_dkron_async_command`: it passes its own stdout/stderr to the worker (so command output and logs go
+straight to dkron), waits for the exit code and exits with it.
+When no pool is listening, the client falls back to `manage.py run_dkron_async_command`.
+It runs on the dkron agents for every task, so only the standard library is imported here (django only by the pool).
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+MANAGE_PY = './manage.py'
+# seconds between checks of the worker processes by the pool
+POLL_INTERVAL = 1
+
+
+def request(path: str, command: str, arguments: Optional[str] = None, stdout: int = 1, stderr: int = 2) -> dict:
+    """
+    run a command in the worker pool listening on `path`
+
+    :param stdout: file descriptor the command output is written to, as is `stderr`
+    :return: worker response, with the `exit_code` of the command (and the `pid` of the worker)
+    :raise FileNotFoundError|ConnectionRefusedError: if no pool is listening on `path`
+    :raise PermissionError: if the pool listening on `path` is run by another user
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        _check_peer(sock)
+        body = json.dumps({'command': command, 'arguments': arguments}).encode() + b'\n'
+        socket.send_fds(sock, [body], [stdout, stderr])
+        sock.shutdown(socket.SHUT_WR)
+        response = b''.join(iter(lambda: sock.recv(4096), b''))
+    if not response:
+        # killed while running the command
+        return {'exit_code': 1, 'error': 'worker exited before completing the task'}
+    return json.loads(response)
+
+
+def _check_peer(sock: socket.socket) -> None:
+    # stdout/stderr are only handed to our own pool, not to a socket planted by another user (shared /tmp)
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return
+    _, uid, _ = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    if uid != os.getuid():
+        raise PermissionError(f'worker pool on {sock.getpeername()} is run by another user (uid {uid})')
+
+
+def _receive(conn: socket.socket) -> tuple[dict, list[int]]:
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+    if len(fds) != 2:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError(f'expected stdout and stderr file descriptors, got {len(fds)}')
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data), fds
+
+
+def _run_task(task: dict, fds: list[int]) -> int:
+    from django.core.management import CommandError, call_command
+    from django.db import close_old_connections
+
+    # task output goes to the client stdout/stderr, for print and logging as well
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+    close_old_connections()
+    try:
+        args = [task['arguments']] if task.get('arguments') else []
+        call_command('run_dkron_async_command', task['command'], *args)
+        return 0
+    except CommandError as e:
+        # as reported by manage.py
+        print(f'{e.__class__.__name__}: {e}', file=sys.stderr)
+        return e.returncode
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        close_old_connections()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (*saved, *fds):
+            os.close(fd)
+
+
+def _watch(conn: socket.socket, done: threading.Event) -> None:
+    # client gone (such as killed by a dkron timeout) while the task runs: exit, taking the task with it,
+    # and let the pool replace this worker
+    poller = select.poll()
+    poller.register(conn, select.POLLHUP)
+    while not done.is_set():
+        if poller.poll(POLL_INTERVAL * 1000) and not done.is_set():
+            os._exit(1)
+
+
+def _worker(listener: socket.socket, max_tasks: int) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    for _ in range(max_tasks):
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                task, fds = _receive(conn)
+            except (OSError, ValueError):
+                continue
+            done = threading.Event()
+            threading.Thread(target=_watch, args=(conn, done), daemon=True).start()
+            try:
+                exit_code = _run_task(task, fds)
+            finally:
+                done.set()
+            try:
+                conn.sendall(json.dumps({'exit_code': exit_code, 'pid': os.getpid()}).encode())
+            except OSError:
+                # client gone right after the task
+                pass
+
+
+def _spawn(listener: socket.socket, max_tasks: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        _worker(listener, max_tasks)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        # never back into the pool code
+        os._exit(code)
+
+
+def serve(path: str, workers: int, max_tasks: int) -> None:
+    """
+    run the pool (with django set up) until terminated or until its parent (such as the dkron agent) exits,
+    each worker process is replaced after `max_tasks` tasks
+    """
+    from django import db
+
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # only the same user can connect
+    umask = os.umask(0o077)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(max(workers * 4, 16))
+    # not shared with the workers
+    db.connections.close_all()
+
+    def _terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    parent = os.getppid()
+    children = set()
+    try:
+        while os.getppid() == parent:
+            while len(children) < workers:
+                children.add(_spawn(listener, max_tasks))
+            while children:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                children.discard(pid)
+            time.sleep(POLL_INTERVAL)
+    finally:
+        listener.close()
+        os.unlink(path)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (2, 3):
+        print('usage: python -m dkron.workers SOCKET COMMAND [ARGUMENTS]', file=sys.stderr)
+        return 2
+    path, command, arguments = argv[0], argv[1], argv[2] if len(argv) == 3 else None
+    try:
+        response = request(path, command, arguments)
+    except PermissionError as e:
+        print(f'dkron.workers: {e}', file=sys.stderr)
+        response = None
+    except (FileNotFoundError, ConnectionRefusedError):
+        response = None
+    if response is None:
+        # no (usable) pool running, boot django for this one
+        args = [sys.executable, MANAGE_PY, 'run_dkron_async_command', command, *([arguments] if arguments else [])]
+        os.execv(sys.executable, args)
+    if response.get('error'):
+        print(f'dkron.workers: {response["error"]}', file=sys.stderr)
+    return response['exit_code']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+execution wrapper for job commands, measuring the resources used by each run (see `Job.use_wrapper`)
+
+    python -m dkron.wrapper --job NAME [--shell] [--timeout S] [--memory MIB] [--cpu-time S] [--nice N] -- COMMAND...
+
+Runs COMMAND (passing through its output and exit code) and reports wall time, user/system CPU time and peak RSS
+to `views.usage`, using the URL and token exported by `run_dkron` (DKRON_USAGE_URL / DKRON_USAGE_TOKEN).
+COMMAND runs in its own process group, with the job resource limits (`Job.LIMIT_FIELDS`) applied: the whole group is
+terminated once the timeout expires (exit code 124, as with coreutils `timeout`).
+
+With DKRON_OUTPUT_DIR (also exported by `run_dkron`), the command output is written gzipped to that directory (up to
+DKRON_OUTPUT_MAX_SIZE bytes) instead of dkron, which only gets the last DKRON_OUTPUT_TAIL bytes and a link to the
+file (served by `views.output`).
+It runs on the dkron agents, before any django setup, so only the standard library is used.
+"""
+import argparse
+import gzip
+import json
+import os
+import resource
+import select
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from functools import partial
+from typing import IO, Callable, Optional
+
+URL_ENV = 'DKRON_USAGE_URL'
+TOKEN_ENV = 'DKRON_USAGE_TOKEN'
+OUTPUT_DIR_ENV = 'DKRON_OUTPUT_DIR'
+OUTPUT_URL_ENV = 'DKRON_OUTPUT_URL'
+OUTPUT_MAX_SIZE_ENV = 'DKRON_OUTPUT_MAX_SIZE'
+OUTPUT_TAIL_ENV = 'DKRON_OUTPUT_TAIL'
+REPORT_TIMEOUT = 10
+# seconds between SIGTERM and SIGKILL for commands that timed out
+KILL_GRACE = 10
+TIMEOUT_EXIT_CODE = 124
+CHUNK_SIZE = 64 * 1024
+OUTPUT_JOIN_TIMEOUT = 5
+# seconds between checks for the end of the capture, once processes left behind keep the output pipe open
+OUTPUT_POLL_INTERVAL = 0.5
+DEFAULT_OUTPUT_MAX_SIZE = 50 * 1024 * 1024
+DEFAULT_OUTPUT_TAIL = 8 * 1024
+
+
+def command(
+    job_name: str, command: str, use_shell: bool, python: str = 'python', report_usage: bool = True, **limits: int
+) -> str:
+    """
+    wrapped version of a job `command`, as set in dkron executor config (with shell disabled, dkron splits it)
+
+    :param report_usage: disable for commands that are not `Job`s (such as `utils.run_async`)
+    :param limits: resource limits, see `run`
+    """
+    options = f'--job {shlex.quote(job_name)}'
+    if not report_usage:
+        options += ' --no-usage'
+    for name, value in limits.items():
+        if value:
+            options += f' --{name.replace("_", "-")} {int(value)}'
+    if use_shell:
+        return f'{python} -m dkron.wrapper {options} --shell -- {shlex.quote(command)}'
+    return f'{python} -m dkron.wrapper {options} -- {command}'
+
+
+def max_rss(ru_maxrss: int) -> int:
+    # bytes on macOS, kilobytes everywhere else
+    return ru_maxrss if sys.platform == 'darwin' else ru_maxrss * 1024
+
+
+def _set_limit(limit: int, soft: int, hard: int) -> None:
+    # cannot be raised above the current hard limit
+    _, current = resource.getrlimit(limit)
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    resource.setrlimit(limit, (soft, hard))
+
+
+def _apply_limits(memory: Optional[int], cpu_time: Optional[int], nice: Optional[int]) -> None:
+    # runs in the child, before exec
+    if memory:
+        _set_limit(resource.RLIMIT_AS, memory * 1024 * 1024, memory * 1024 * 1024)
+    if cpu_time:
+        # SIGXCPU at the soft limit (commands may handle it), SIGKILL a bit later
+        _set_limit(resource.RLIMIT_CPU, cpu_time, cpu_time + 5)
+    if nice:
+        os.nice(nice)
+
+
+def output_path(directory: str, job_name: str) -> str:
+    # one directory per job, one file per run
+    name = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}.log.gz'
+    return os.path.join(directory, job_name.replace(os.sep, '_'), name)
+
+
+def output_link(path: str, directory: str, url: Optional[str]) -> str:
+    if not url:
+        return path
+    return f'{url.rstrip("/")}/{urllib.parse.quote(os.path.relpath(path, directory))}'
+
+
+def capture(
+    stream: IO[bytes], stop: threading.Event, f: IO[bytes], max_size: int, tail_size: int, result: dict
+) -> None:
+    """
+    write the command output to `f` (closed once done), up to `max_size` bytes, keeping its last `tail_size` bytes
+
+    :param stop: set to give up on the rest of the stream, such as when processes left behind still hold the pipe
+                 - what was read so far is kept
+    :param result: filled with the output size, tail and whether it was cut off by `stop`
+    """
+    size = 0
+    tail = bytearray()
+    cut_off = False
+    fd = stream.fileno()
+    with f:
+        # keep draining the pipe once the cap is reached, not to block the command
+        while True:
+            if stop.is_set():
+                cut_off = True
+                break
+            if not select.select([fd], [], [], OUTPUT_POLL_INTERVAL)[0]:
+                continue
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            if size < max_size:
+                f.write(chunk[: max_size - size])
+            size += len(chunk)
+            tail += chunk
+            # not tail[:-tail_size], a no-op for 0
+            del tail[: max(len(tail) - tail_size, 0)]
+        if size > max_size:
+            f.write(f'\n[dkron.wrapper: output truncated, {size - max_size} bytes dropped]\n'.encode())
+        if cut_off:
+            f.write(b'\n[dkron.wrapper: output cut off, still written by processes left behind]\n')
+    result.update(size=size, tail=bytes(tail), cut_off=cut_off)
+
+
+def _kill_group(proc: subprocess.Popen, signum: int) -> None:
+    try:
+        os.killpg(proc.pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def run(
+    args: list,
+    use_shell: bool = False,
+    timeout: Optional[int] = None,
+    memory: Optional[int] = None,
+    cpu_time: Optional[int] = None,
+    nice: Optional[int] = None,
+    kill_grace: float = KILL_GRACE,
+    output: Optional[Callable[[IO[bytes], threading.Event], None]] = None,
+) -> tuple[int, dict]:
+    """
+    run the command in its own process group, forwarding termination signals to it
+
+    :param timeout: seconds before the process group is terminated (then killed after `kill_grace`)
+    :param memory: address space limit (RLIMIT_AS) in MiB
+    :param cpu_time: CPU time limit (RLIMIT_CPU) in seconds
+    :param nice: niceness increment
+    :param output: called (in a thread) with the command stdout/stderr stream to capture them and an event set
+                   to stop reading it, see `capture`
+    :return: exit code (negative signal number if killed) and resource usage of the command
+    """
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        args[0] if use_shell else args,
+        shell=use_shell,
+        start_new_session=True,
+        preexec_fn=partial(_apply_limits, memory, cpu_time, nice) if memory or cpu_time or nice else None,
+        stdout=subprocess.PIPE if output else None,
+        stderr=subprocess.STDOUT if output else None,
+    )
+    reader = None
+    stop = threading.Event()
+    if output:
+
+        def _read():
+            with proc.stdout:
+                output(proc.stdout, stop)
+
+        reader = threading.Thread(target=_read, daemon=True)
+        reader.start()
+
+    def _forward(signum, frame):
+        _kill_group(proc, signum)
+
+    previous = {signum: signal.signal(signum, _forward) for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+    timed_out = False
+    try:
+        try:
+            returncode = proc.wait(timeout or None)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _kill_group(proc, signal.SIGTERM)
+            try:
+                returncode = proc.wait(kill_grace)
+            except subprocess.TimeoutExpired:
+                _kill_group(proc, signal.SIGKILL)
+                returncode = proc.wait()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    wall_time = time.monotonic() - start
+    if reader:
+        reader.join(OUTPUT_JOIN_TIMEOUT)
+        if reader.is_alive():
+            # processes left behind by the command still hold the pipe, do not wait for them
+            stop.set()
+            reader.join()
+
+    # only child of this process, so the children usage is the command one (and its own waited children)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return returncode, {
+        'exit_code': returncode,
+        'wall_time': round(wall_time, 6),
+        'cpu_user': round(usage.ru_utime, 6),
+        'cpu_system': round(usage.ru_stime, 6),
+        'max_rss': max_rss(usage.ru_maxrss),
+        'timed_out': timed_out,
+    }
+
+
+def report(job_name: str, usage: dict, url: str, token: str) -> None:
+    body = f'{token}\n{job_name}\n{json.dumps(usage)}'.encode()
+    req = urllib.request.Request(url, data=body, method='POST', headers={'Content-Type': 'text/plain'})
+    with urllib.request.urlopen(req, timeout=REPORT_TIMEOUT) as r:
+        r.read()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m dkron.wrapper', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--job', required=True, help='Job name, as known by the django app')
+    parser.add_argument('--shell', action='store_true', help='Run COMMAND (a single string) with /bin/sh -c')
+    parser.add_argument('--timeout', type=int, help='Terminate COMMAND (and its children) after these seconds')
+    parser.add_argument('--memory', type=int, help='Memory (address space) limit, in MiB')
+    parser.add_argument('--cpu-time', type=int, help='CPU time limit, in seconds')
+    parser.add_argument('--nice', type=int, help='Niceness increment')
+    parser.add_argument('--no-usage', action='store_true', help='Do not report resource usage')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    options = parser.parse_args(argv)
+    args = options.command[1:] if options.command[:1] == ['--'] else options.command
+    if not args:
+        parser.error('missing command')
+
+    output_dir = os.environ.get(OUTPUT_DIR_ENV)
+    output, result = None, {}
+    if output_dir:
+        path = output_path(output_dir, options.job)
+        tail_size = int(os.environ.get(OUTPUT_TAIL_ENV) or DEFAULT_OUTPUT_TAIL)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = gzip.open(path, 'wb', compresslevel=6)
+        except OSError as e:
+            # output left to dkron
+            print(f'dkron.wrapper: cannot capture output - {e}', file=sys.stderr)
+        else:
+            max_size = int(os.environ.get(OUTPUT_MAX_SIZE_ENV) or DEFAULT_OUTPUT_MAX_SIZE)
+            output = partial(capture, f=f, max_size=max_size, tail_size=tail_size, result=result)
+
+    try:
+        returncode, usage = run(
+            args,
+            use_shell=options.shell,
+            timeout=options.timeout,
+            memory=options.memory,
+            cpu_time=options.cpu_time,
+            nice=options.nice,
+            output=output,
+        )
+    except OSError as e:
+        # such as command not found, same exit code as the shell
+        print(f'dkron.wrapper: {e}', file=sys.stderr)
+        if output:
+            f.close()
+            os.unlink(path)
+        return 127
+
+    if output:
+        link = output_link(path, output_dir, os.environ.get(OUTPUT_URL_ENV))
+        if result['size'] <= tail_size and not result['cut_off']:
+            # all of it fits in dkron
+            sys.stdout.buffer.write(result['tail'])
+            sys.stdout.flush()
+            os.unlink(path)
+        else:
+            # processes left behind by the command were still writing it
+            cut_off = ', cut off while still being written' if result['cut_off'] else ''
+            print(
+                f'[dkron.wrapper: {result["size"]} bytes of output{cut_off}, last {len(result["tail"])} below'
+                f' - full output: {link}]',
+                flush=True,
+            )
+            sys.stdout.buffer.write(result['tail'])
+            sys.stdout.flush()
+
+    url, token = os.environ.get(URL_ENV), os.environ.get(TOKEN_ENV)
+    if url and token and not options.no_usage:
+        try:
+            report(options.job, usage, url, token)
+        except Exception as e:
+            # never fail the job because of reporting
+            print(f'dkron.wrapper: failed to report usage - {e}', file=sys.stderr)
+
+    if usage['timed_out']:
+        print(f'dkron.wrapper: timed out after {options.timeout}s', file=sys.stderr)
+        return TIMEOUT_EXIT_CODE
+    # same as a shell would for killed commands
+    return 128 - returncode if returncode < 0 else returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
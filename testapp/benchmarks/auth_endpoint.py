@@ -0,0 +1,66 @@
+"""
+Requests/second of `views.auth` (the nginx `auth_request` endpoint) with and without DKRON_AUTH_CACHE_TTL
+
+    cd testapp && python benchmarks/auth_endpoint.py [--requests 5000]
+
+Runs the full django request cycle (middlewares included) with the test client, against a throw-away test database
+and the configured cache (local memory by default).
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapp.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.models import Group, Permission  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+
+def run(client, url, total):
+    start = time.perf_counter()
+    for _ in range(total):
+        r = client.get(url)
+        assert r.status_code == 200, r.status_code
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    # permission granted through a group, as usually done
+    user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench')
+    group = Group.objects.create(name='dashboard')
+    group.permissions.add(Permission.objects.get(content_type__app_label='dkron', codename='can_use_dashboard'))
+    user.groups.add(group)
+    client = Client()
+    client.login(username='bench', password='bench')
+    url = reverse('dkron:auth')
+
+    for ttl in (0, 60):
+        cache.clear()
+        with override_settings(DKRON_AUTH_CACHE_TTL=ttl):
+            # warm up (and fill the cache)
+            run(client, url, 10)
+            print(f'DKRON_AUTH_CACHE_TTL={ttl}: {run(client, url, args.requests):.0f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Time `dkron.utils._dependency_levels` ordering for a large number of jobs with deep @parent chains
+
+    cd testapp && python benchmarks/dependency_order.py [--jobs 50000] [--depth 100]
+
+No database access is required: jobs are built in memory and passed to the ordering function.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapp.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from dkron import models, utils  # noqa: E402
+
+
+def legacy_dependency_ordered(jobs):
+    """
+    previous dependency ordering (the former `_dependency_ordered`), re-scanning the graph after each parent (quadratic)
+    """
+    NO_PARENT = '_'
+    dep_graph = defaultdict(list)
+    for job in jobs:
+        dep_graph[job.parent_name or NO_PARENT].append(job)
+
+    p = NO_PARENT
+    already_processed = set()
+    while True:
+        if not dep_graph.get(p):
+            break
+        for job in dep_graph[p]:
+            already_processed.add(job.name)
+            yield job
+        del dep_graph[p]
+        for k in dep_graph:
+            if k in already_processed:
+                p = k
+                break
+        else:
+            break
+
+
+def build_jobs(total, depth):
+    jobs = []
+    for i in range(total):
+        if i % depth == 0:
+            schedule = '@every 1h'
+        else:
+            schedule = f'@parent job{i - 1}'
+        jobs.append(models.Job(name=f'job{i}', schedule=schedule, command='true'))
+    # a few broken chains at the end, to exercise the error reporting as well
+    jobs.append(models.Job(name='loop1', schedule='@parent loop2', command='true'))
+    jobs.append(models.Job(name='loop2', schedule='@parent loop1', command='true'))
+    jobs.append(models.Job(name='orphan', schedule='@parent missing', command='true'))
+    # database order is not related to the dependencies
+    random.Random(42).shuffle(jobs)
+    return jobs
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=50000)
+    parser.add_argument('--depth', type=int, default=100, help='length of each @parent chain')
+    parser.add_argument('--legacy-jobs', type=int, default=5000, help='size used for the (quadratic) legacy ordering')
+    args = parser.parse_args()
+
+    jobs = build_jobs(args.jobs, args.depth)
+    elapsed, (levels, broken) = timed(utils._dependency_levels, jobs)
+    print(f'_dependency_levels: {len(jobs)} jobs, {len(levels)} levels, {len(broken)} broken in {elapsed * 1000:.1f}ms')
+
+    if args.legacy_jobs:
+        jobs = build_jobs(args.legacy_jobs, args.depth)
+        elapsed, ordered = timed(lambda j: list(legacy_dependency_ordered(j)), jobs)
+        print(f'legacy ordering: {len(jobs)} jobs, {len(ordered)} ordered in {elapsed * 1000:.1f}ms')
+        elapsed, _ = timed(utils._dependency_levels, jobs)
+        print(f'_dependency_levels: {len(jobs)} jobs in {elapsed * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
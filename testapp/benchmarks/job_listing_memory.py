@@ -0,0 +1,115 @@
+"""
+Peak memory used to read a large dkron job listing (`GET /v1/jobs`), full `.json()` vs `DkronClient.iter_jobs`
+
+    cd testapp && python benchmarks/job_listing_memory.py [--jobs 20000] [--page-size 500]
+
+dkron is replaced by an in-memory requests adapter that honours `_start`/`_end` paging.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapp.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from dkron import utils  # noqa: E402
+
+
+def fake_job(i):
+    # roughly what dkron returns for a temporary job created by run_async
+    return {
+        'id': f'tmp_somecommand_{i}',
+        'name': f'tmp_somecommand_{i}',
+        'displayname': '',
+        'timezone': '',
+        'schedule': '@manually',
+        'owner': '',
+        'owner_email': '',
+        'success_count': 1,
+        'error_count': 0,
+        'last_success': '2023-02-07T00:00:05.123456789Z',
+        'last_error': None,
+        'disabled': False,
+        'tags': {'label': 'testapp:1'},
+        'metadata': {'temp': 'true'},
+        'retries': 0,
+        'dependent_jobs': None,
+        'parent_job': '',
+        'processors': {},
+        'concurrency': 'allow',
+        'executor': 'shell',
+        'executor_config': {
+            'command': 'python ./manage.py run_dkron_async_command somecommand ' + 'eyJhcmdzIjogWyJhcmcxIl19' * 20
+        },
+        'status': 'success',
+        'next': '0001-01-01T00:00:00Z',
+        'ephemeral': False,
+        'expires_at': None,
+    }
+
+
+class FakeDkronAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, total):
+        super().__init__()
+        self.total = total
+
+    def send(self, request, **kwargs):
+        params = requests.utils.urlparse(request.url).query
+        query = dict(p.split('=', 1) for p in params.split('&') if '=' in p)
+        start = int(query.get('_start', 0))
+        end = min(int(query.get('_end', self.total)), self.total)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['X-Total-Count'] = str(self.total)
+        response._content = json.dumps([fake_job(i) for i in range(start, end)]).encode()
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def measure(func):
+    tracemalloc.start()
+    try:
+        count = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return count, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
+    client = utils.DkronClient('http://dkron/v1/', page_size=args.page_size)
+    client.session.mount('http://', FakeDkronAdapter(args.jobs))
+
+    # previous implementation: single request with the whole listing
+    count, peak = measure(lambda: len({j['name']: j for j in client.get('jobs').json()}))
+    print(f'full listing: {count} jobs, peak {peak:.1f}MB')
+
+    count, peak = measure(
+        lambda: len({j['name']: j for j in client.iter_jobs(params={}, fields=utils.JOB_LISTING_FIELDS)})
+    )
+    print(f'iter_jobs (page size {args.page_size}, listing fields): {count} jobs, peak {peak:.1f}MB')
+
+    count, peak = measure(lambda: len([j['name'] for j in client.iter_jobs(params={}, fields=('name',))]))
+    print(f'iter_jobs (page size {args.page_size}, name only): {count} jobs, peak {peak:.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Seconds per `run_async` task, as run by dkron, with and without the warm worker pool (DKRON_WORKERS)
+
+    cd testapp && python benchmarks/run_async_workers.py [--tasks 20] [--command check]
+
+Runs the actual commands used in the dkron jobs (`manage.py run_dkron_async_command` and the `dkron.workers` client),
+one after another, against a pool started with `run_dkron_workers`.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TESTAPP = Path(__file__).resolve().parent.parent
+
+
+def run(args, env, total):
+    start = time.perf_counter()
+    for _ in range(total):
+        subprocess.run(args, cwd=TESTAPP, env=env, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) / total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--command', default='check')
+    args = parser.parse_args()
+
+    env = {**os.environ, 'PYTHONPATH': str(TESTAPP.parent)}
+    socket_path = os.path.join(tempfile.mkdtemp(), 'workers.sock')
+    pool = subprocess.Popen(
+        [sys.executable, 'manage.py', 'run_dkron_workers', '--workers', '2', '--socket', socket_path],
+        cwd=TESTAPP,
+        env=env,
+    )
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.1)
+        cold = run([sys.executable, 'manage.py', 'run_dkron_async_command', args.command], env, args.tasks)
+        print(f'manage.py run_dkron_async_command: {cold:.3f}s per task')
+        warm = run([sys.executable, '-m', 'dkron.workers', socket_path, args.command], env, args.tasks)
+        print(f'dkron.workers: {warm:.3f}s per task')
+    finally:
+        pool.terminate()
+        pool.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
+import gzip
+import json
 import tempfile
 import os
 import platform
+import sys
+import threading
 
-from unittest import mock
+from unittest import mock, skipIf
+from asgiref.sync import async_to_sync
+import requests
 from django.apps import apps
 from django.conf import settings
 from django.urls import reverse
@@ -11,20 +18,32 @@ from django.contrib.admin.sites import AdminSite
 from django.contrib.auth import get_user_model
 from django.contrib.auth import models as auth_models
 from django.core import management
-from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.forms import modelform_factory
+from django.test import AsyncRequestFactory, TestCase, override_settings
 from django.utils import timezone
 
 from notifications import models as notify_models
-from dkron import admin, models, utils
+from dkron import admin, models, utils, views
 from dkron.apps import DkronConfig
 from dkron.forms import JobForm
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 PROXY_VIEW = 'dkron:proxy'
 JOBS_URL = 'http://dkron/v1/jobs'
+LIST_PARAMS = {'_sort': 'name', '_order': 'ASC', '_start': 0, '_end': 500}
 
 
 @override_settings(DKRON_PATH='/dkron/proxy/ui/', DKRON_URL='http://dkron')
 class Test(TestCase):
+    job_prefix = ''
+
     def setUp(self):
         # reset cached helpers
         utils.dkron_url.cache_clear()
@@ -32,6 +51,7 @@ class Test(TestCase):
         utils.api_url.cache_clear()
         utils.namespace.cache_clear()
         utils.namespace_prefix.cache_clear()
+        utils.client.cache_clear()
 
         self.user = get_user_model().objects.create_user('tester', 'tester@ppb.it', 'tester')
         self.site = AdminSite()
@@ -68,6 +88,10 @@ class Test(TestCase):
         apps.get_app_config('dkron').ready()
         self.assertEqual(settings.DKRON_URL, 'http://localhost:8888')
 
+        with override_settings(DKRON_PROXY_ASYNC=True), mock.patch('django.VERSION', (3, 2, 0, 'final', 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                apps.get_app_config('dkron').ready()
+
     def test_auth(self):
         DKRON_AUTH = reverse('dkron:auth')
 
@@ -93,6 +117,65 @@ class Test(TestCase):
         r = self.client.get(DKRON_AUTH)
         self.assertEqual(r.status_code, 200)
 
+    @override_settings(DKRON_AUTH_CACHE_TTL=60)
+    def test_auth_cache(self):
+        DKRON_AUTH = reverse('dkron:auth')
+        cache.clear()
+
+        # no session
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 401)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'made-up'
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 401)
+        self.assertIsNone(cache.get(utils.auth_cache_key('made-up')))
+
+        self._login()
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 403)
+        self.user.user_permissions.add(self._job_perm('can_use_dashboard'))
+        with self.assertNumQueries(4):
+            # session, user, user and group permissions
+            r = self.client.get(DKRON_AUTH)
+            self.assertEqual(r.status_code, 200)
+        with self.assertNumQueries(0):
+            r = self.client.get(DKRON_AUTH)
+            self.assertEqual(r.status_code, 200)
+
+        # changes in permissions drop the cache
+        self.user.user_permissions.clear()
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 403)
+        group = auth_models.Group.objects.create(name='dashboard')
+        self.user.groups.add(group)
+        group.permissions.add(self._job_perm('can_use_dashboard'))
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 401)
+        self.user.is_active = True
+        self.user.save()
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 200)
+        group.delete()
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 403)
+
+        # as well as logout (the session key is dropped anyway)
+        self.user.is_superuser = True
+        self.user.save()
+        session_key = self.client.session.session_key
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 200)
+        self.assertIsNotNone(cache.get(utils.auth_cache_key(session_key)))
+        self.client.logout()
+        self.assertIsNone(cache.get(utils.auth_cache_key(session_key)))
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        r = self.client.get(DKRON_AUTH)
+        self.assertEqual(r.status_code, 401)
+
     def test_resync_command(self):
         out = StringIO()
         err = StringIO()
@@ -105,16 +188,118 @@ class Test(TestCase):
                 ('job3', 'd', 'failed deletion'),
                 ('job4', 'x', 'ignored, not an action'),
                 ('job5', 'u', 'failed update'),
+                ('job6', 'n', None),
             ],
         ):
             management.call_command('resync_dkron', stdout=out, stderr=err)
-            self.assertEqual(out.getvalue(), "Job job1 updated\nJob job2 delete\n")
+            self.assertEqual(out.getvalue(), "Job job1 updated\nJob job2 delete\nJob job6 unchanged\n")
             self.assertEqual(err.getvalue(), "Job job3 failed\nfailed deletion\nJob job5 failed\nfailed update\n")
 
     def test_model(self):
         j = models.Job.objects.create(name='job1')
         self.assertEqual(str(j), 'job1')
 
+    def test_model_dirty(self):
+        j = models.Job.objects.create(name='job1')
+        self.assertTrue(j.dirty)
+        models.Job.objects.filter(pk=j.pk).update(dirty=False)
+
+        # fields not synced to dkron do not change it
+        j.last_run_success = True
+        j.save(update_fields=['last_run_success'])
+        models.Job.objects.filter(pk=j.pk).update(notify_on_error=False)
+        j.refresh_from_db()
+        self.assertFalse(j.dirty)
+
+        j.schedule = '@hourly'
+        j.save(update_fields=['schedule'])
+        j.refresh_from_db()
+        self.assertTrue(j.dirty)
+
+        models.Job.objects.filter(pk=j.pk).update(dirty=False)
+        models.Job.objects.filter(pk=j.pk).update(enabled=False)
+        j.refresh_from_db()
+        self.assertTrue(j.dirty)
+
+        models.Job.objects.filter(pk=j.pk).update(dirty=False)
+        j.save()
+        j.refresh_from_db()
+        self.assertTrue(j.dirty)
+
+    def test_sync_job_marks_synced(self):
+        j = models.Job.objects.create(name='job1', schedule='@hourly')
+        with mock.patch('requests.Session.post') as mp:
+            mp.return_value = mock.MagicMock(status_code=201)
+            utils.sync_job(j)
+            j.refresh_from_db()
+            self.assertFalse(j.dirty)
+            self.assertIsNotNone(j.synced_at)
+            self.assertEqual(j.sync_fingerprint, utils.job_fingerprint(utils.job_to_dict(j)))
+            # already synced, no write
+            with self.assertNumQueries(0):
+                utils._mark_synced(j)
+
+            # changed in the database while it was being synced: stays dirty
+            j2 = models.Job.objects.get(pk=j.pk)
+            models.Job.objects.filter(pk=j.pk).update(command='echo changed')
+            utils.sync_job(j2)
+            j.refresh_from_db()
+            self.assertTrue(j.dirty)
+
+            mp.return_value = mock.MagicMock(status_code=500, text='Whatever')
+            with self.assertRaises(utils.DkronException):
+                utils.sync_job(j)
+            j.refresh_from_db()
+            self.assertTrue(j.dirty)
+
+    @mock.patch('requests.Session.get')
+    def test_resync_jobs_dirty_only(self, mp1):
+        j1 = models.Job.objects.create(name='job1')
+        j2 = models.Job.objects.create(name='job2', schedule='@parent job1')
+        models.Job.objects.create(name='job3', schedule='@parent job2')
+        models.Job.objects.create(name='job4', schedule='@parent nope')
+        for j in (j1, j2):
+            models.Job.objects.filter(pk=j.pk).update(
+                dirty=False, sync_fingerprint=utils.job_fingerprint(utils.job_to_dict(j))
+            )
+        # deleted and renamed jobs are recorded as tombstones
+        j5 = models.Job.objects.create(name='job5')
+        j5.name = 'job6'
+        j5.save()
+        models.Job.objects.create(name='job7').delete()
+        # created again, nothing to delete
+        models.Job.objects.create(name='job8').delete()
+        models.Job.objects.create(name='job8')
+        self.assertEqual(
+            sorted(models.JobSyncOutbox.objects.values_list('job_name', 'action')),
+            [('job5', 'd'), ('job7', 'd'), ('job8', 'd')],
+        )
+
+        with mock.patch('dkron.utils.sync_job', return_value=True) as mp2, mock.patch('dkron.utils.delete_job') as mp3:
+            results = list(utils.resync_jobs(dirty_only=True))
+
+        self.assertEqual(
+            sorted(results),
+            [
+                ('job3', 'u', None),
+                ('job4', 'u', 'parent job nope does not exist'),
+                ('job5', 'd', None),
+                ('job6', 'u', None),
+                ('job7', 'd', None),
+                ('job8', 'u', None),
+            ],
+        )
+        self.assertEqual(sorted(c.args[0].name for c in mp2.call_args_list), ['job3', 'job6', 'job8'])
+        self.assertEqual(sorted(c.args[0] for c in mp3.call_args_list), ['job5', 'job7'])
+        # dkron is not listed
+        mp1.assert_not_called()
+        self.assertFalse(models.JobSyncOutbox.objects.exists())
+
+        # settings changes are left to a full resync
+        with override_settings(DKRON_JOB_LABEL='other'), mock.patch('dkron.utils.sync_job', return_value=True):
+            results = list(utils.resync_jobs(dirty_only=True))
+        self.assertEqual(results, [('job4', 'u', 'parent job nope does not exist')])
+
     def test_api_url(self):
         with self.settings(DKRON_URL='http://dkron'):
             utils.api_url.cache_clear()
@@ -124,9 +309,64 @@ class Test(TestCase):
             utils.api_url.cache_clear()
             self.assertEqual(utils.api_url(), 'http://dkron/v1/')
 
+    @override_settings(DKRON_API_AUTH='dXNlcjpwYXNz', DKRON_API_CONNECT_TIMEOUT=1, DKRON_API_READ_TIMEOUT=2)
+    def test_client(self):
+        c = utils.client()
+        # shared (pooled) instance
+        self.assertIs(c, utils.client())
+        self.assertEqual(c.base_url, 'http://dkron/v1/')
+        self.assertEqual(c.session.headers['Authorization'], 'Basic dXNlcjpwYXNz')
+
+        adapter = c.session.get_adapter(JOBS_URL)
+        self.assertEqual(adapter.timeout, (1, 2))
+        self.assertEqual(adapter.max_retries.total, 3)
+        # only idempotent methods are retried
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+        self.assertIn('DELETE', adapter.max_retries.allowed_methods)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+
+        with mock.patch('requests.adapters.HTTPAdapter.send') as mp:
+            mp.return_value = mock.MagicMock(status_code=200, is_redirect=False)
+            c.get('jobs')
+            self.assertEqual(mp.call_args.kwargs['timeout'], (1, 2))
+            c.get('jobs', timeout=10)
+            self.assertEqual(mp.call_args.kwargs['timeout'], 10)
+
+    @override_settings(DKRON_API_PAGE_SIZE=2)
+    def test_client_iter_jobs(self):
+        jobs = [{'name': f'job{i}', 'status': 'success', 'executor_config': {'command': 'x' * 100}} for i in range(5)]
+
+        def _get(url, params):
+            return mock.MagicMock(
+                status_code=200,
+                json=lambda: jobs[params['_start'] : params['_end']],
+                headers={'X-Total-Count': str(len(jobs))},
+            )
+
+        with mock.patch('requests.Session.get', side_effect=_get) as mp:
+            self.assertEqual(
+                list(utils.client().iter_jobs(params={'metadata[temp]': 'true'}, fields=('name',))),
+                [{'name': f'job{i}'} for i in range(5)],
+            )
+            self.assertEqual(mp.call_count, 3)
+            mp.assert_called_with(
+                JOBS_URL, params={'metadata[temp]': 'true', '_sort': 'name', '_order': 'ASC', '_start': 4, '_end': 6}
+            )
+
+            # no paging support: full listing in the first response
+            mp.reset_mock()
+            mp.side_effect = None
+            mp.return_value = mock.MagicMock(status_code=200, json=lambda: jobs, headers={})
+            self.assertEqual(list(utils.client().iter_jobs()), jobs)
+            mp.assert_called_once()
+
+            mp.return_value = mock.MagicMock(status_code=500, text='Whatever')
+            with self.assertRaisesMessage(utils.DkronException, 'Whatever'):
+                list(utils.client().iter_jobs())
+
     def test_sync_job(self, job_prefix=''):
         j = models.Job.objects.create(name='job1')
-        with mock.patch('requests.post') as mp:
+        with mock.patch('requests.Session.post') as mp:
             mp.return_value = mock.MagicMock(status_code=201)
             utils.sync_job(j)
             mp.assert_called_once_with(
@@ -181,6 +421,34 @@ class Test(TestCase):
             self.assertEqual(exc.exception.code, 500)
             self.assertEqual(exc.exception.message, 'Whatever')
 
+    def test_sync_job_unchanged(self):
+        j = models.Job.objects.create(name='job1', schedule='@every 1h', command='echo test')
+        # as returned by dkron API: extra (unmanaged) attributes and empty values instead of null
+        existing = self._job_template(
+            {'name': f'{self.job_prefix}job1', 'schedule': '@every 1h', 'parent_job': '', 'status': 'success'}
+        )
+        with mock.patch('requests.Session.post') as mp:
+            mp.return_value = mock.MagicMock(status_code=201)
+            self.assertFalse(utils.sync_job(j, dict(existing)))
+            mp.assert_not_called()
+
+            j.command = 'echo changed'
+            self.assertTrue(utils.sync_job(j, dict(existing)))
+            mp.assert_called_once_with(
+                JOBS_URL,
+                json=dict(
+                    existing,
+                    parent_job=None,
+                    executor_config={'shell': 'false', 'command': 'echo changed'},
+                ),
+            )
+
+            mp.reset_mock()
+            with mock.patch('requests.Session.get') as mp_get:
+                mp_get.return_value = mock.MagicMock(status_code=200, json=lambda: dict(existing))
+                self.assertFalse(utils.sync_job(models.Job.objects.get(name='job1'), job_update=None))
+            mp.assert_not_called()
+
     def test_job_form(self, job_prefix=''):
         form_data = {'name': 'job1', 'schedule': '* 0 1 * * *', 'command': 'echo test', "retries": 0}
         form = JobForm(data=form_data)
@@ -194,10 +462,46 @@ class Test(TestCase):
         form_data = {'name': 'job1', 'schedule': '0 0 1 * * *', 'command': 'echo test', "retries": 0}
         form = JobForm(data=form_data)
         self.assertEqual(form.is_valid(), True)
+        form_data = {'name': 'job1', 'schedule': '0 0 25 * * *', 'command': 'echo test', "retries": 0}
+        form = JobForm(data=form_data)
+        self.assertEqual(form.is_valid(), False)
+        self.assertEqual(form.errors['schedule'], ['Invalid schedule - hour: 25 is above maximum (23)'])
+
+    @override_settings(DKRON_HTTP_COMMANDS=('clearsessions',), DKRON_HTTP_EXECUTOR_URL='http://app/dkron/api/run/')
+    def test_job_form_http_executor(self):
+        form_data = {'name': 'job1', 'schedule': '@hourly', 'command': 'clearsessions', 'retries': 0}
+        form = JobForm(data=form_data)
+        self.assertTrue(form.is_valid())
+        self.assertEqual('shell', form.save().executor)
+        form = JobForm(data={**form_data, 'name': 'job2', 'executor': 'http'})
+        self.assertTrue(form.is_valid())
+        form = JobForm(data={**form_data, 'name': 'job2', 'executor': 'http', 'command': 'flush --no-input'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors['command'], ['Not a management command allowed for http executor (DKRON_HTTP_COMMANDS)']
+        )
+        form = JobForm(data={**form_data, 'name': 'job2', 'executor': 'http', 'command': 'clearsessions "oops'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['command'], ['Invalid command - No closing quotation'])
+        with override_settings(DKRON_HTTP_EXECUTOR_URL=None):
+            form = JobForm(data={**form_data, 'name': 'job2', 'executor': 'http'})
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.errors['executor'], ['http executor requires DKRON_HTTP_EXECUTOR_URL'])
+
+    def test_job_admin_form(self):
+        form_class = modelform_factory(models.Job, form=admin.JobAdminForm, fields='__all__')
+        with mock.patch('requests.Session.post') as mp:
+            form = form_class(data={'name': 'job1', 'schedule': '@every 5m', 'command': 'ls', 'retries': 0})
+            self.assertTrue(form.is_valid())
+            form = form_class(data={'name': 'job1', 'schedule': '@every 5d', 'command': 'ls', 'retries': 0})
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.errors['schedule'], ["Invalid value - invalid duration '5d'"])
+        # validated offline
+        mp.assert_not_called()
 
     def test_delete_job(self, job_prefix=''):
         j = models.Job.objects.create(name='job1')
-        with mock.patch('requests.delete') as mp:
+        with mock.patch('requests.Session.delete') as mp:
             mp.return_value = mock.MagicMock(status_code=200)
             utils.delete_job(j)
             mp.assert_called_once_with(f'{JOBS_URL}/{job_prefix}job1')
@@ -210,7 +514,7 @@ class Test(TestCase):
             self.assertEqual(exc.exception.code, 500)
             self.assertEqual(exc.exception.message, 'Whatever')
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     def test_resync_jobs(self, mp1):
         j1 = models.Job.objects.create(name='job1')
         j2 = models.Job.objects.create(name='job2')
@@ -222,20 +526,22 @@ class Test(TestCase):
             {'name': 'job5', 'tags': {'label': 'testapp2'}, 'metadata': {'cron': 'auto'}},
             {'name': 'job6', 'tags': {}, 'metadata': {'cron': 'auto'}},
         ]
-        mp1.return_value = mock.MagicMock(status_code=200, json=lambda: jobs)
+        mp1.return_value = mock.MagicMock(status_code=200, json=lambda: jobs, headers={})
+        # tombstones of deleted jobs
+        utils.enqueue_sync(['job3', 'job4'], action='d')
         it = utils.resync_jobs()
 
         with mock.patch('dkron.utils.sync_job') as mp2, mock.patch('dkron.utils.delete_job') as mp3:
             el = next(it)
-            mp1.assert_called_once_with(JOBS_URL, params={'metadata[cron]': 'auto'})
+            mp1.assert_called_once_with(JOBS_URL, params={'metadata[cron]': 'auto', **LIST_PARAMS})
             self.assertEqual(('job1', 'u', None), el)
-            mp2.assert_called_once_with(j1, jobs[0])
+            mp2.assert_called_once_with(j1, jobs[0], mark_synced=False)
             mp2.reset_mock()
 
             mp2.side_effect = utils.DkronException(666, 'looking for d/a/emon')
             el = next(it)
             self.assertEqual(('job2', 'u', 'looking for d/a/emon'), el)
-            mp2.assert_called_once_with(j2, False)
+            mp2.assert_called_once_with(j2, False, mark_synced=False)
             mp2.reset_mock()
 
             # no order in a set(), check for both
@@ -255,6 +561,91 @@ class Test(TestCase):
             with self.assertRaises(StopIteration):
                 # assert nothing left
                 next(it)
+        # only the failed delete is left for later
+        self.assertEqual(list(models.JobSyncOutbox.objects.values_list('job_name', flat=True)), [el[0]])
+
+    def test_dependency_levels(self):
+        models.Job.objects.create(name='job1')
+        models.Job.objects.create(name='job2', schedule='@parent job1')
+        models.Job.objects.create(name='job3', schedule='@parent job2')
+        models.Job.objects.create(name='job4', schedule='@parent job1')
+        models.Job.objects.create(name='job5')
+        levels, broken = utils._dependency_levels()
+        self.assertEqual(
+            [sorted(j.name for j in level) for level in levels], [['job1', 'job5'], ['job2', 'job4'], ['job3']]
+        )
+        self.assertEqual(broken, {})
+
+    def test_dependency_levels_broken(self):
+        models.Job.objects.create(name='job1')
+        models.Job.objects.create(name='job2', schedule='@parent job1')
+        # missing parent
+        models.Job.objects.create(name='job3', schedule='@parent nope')
+        models.Job.objects.create(name='job4', schedule='@parent job3')
+        # circular dependency (and a child of it)
+        models.Job.objects.create(name='job5', schedule='@parent job6')
+        models.Job.objects.create(name='job6', schedule='@parent job5')
+        models.Job.objects.create(name='job7', schedule='@parent job6')
+        models.Job.objects.create(name='job8', schedule='@parent job8')
+
+        levels, broken = utils._dependency_levels()
+        self.assertEqual([[j.name for j in level] for level in levels], [['job1'], ['job2']])
+        self.assertEqual(
+            broken,
+            {
+                'job3': 'parent job nope does not exist',
+                'job4': 'parent job job3 cannot be synced',
+                'job5': 'circular dependency: job5 -> job6 -> job5',
+                'job6': 'circular dependency: job5 -> job6 -> job5',
+                'job7': 'parent job job6 cannot be synced',
+                'job8': 'circular dependency: job8 -> job8',
+            },
+        )
+
+    @mock.patch('requests.Session.get')
+    def test_resync_jobs_parallel(self, mp1):
+        models.Job.objects.create(name='job1')
+        models.Job.objects.create(name='job2', schedule='@parent job1')
+        models.Job.objects.create(name='job3', schedule='@parent job2')
+        models.Job.objects.create(name='job4')
+        models.Job.objects.create(name='job5', schedule='@parent nope')
+        jobs = [
+            {'name': 'job1', 'tags': {'label': 'testapp'}, 'metadata': {'cron': 'auto'}},
+            # broken job is not deleted
+            {'name': 'job5', 'tags': {'label': 'testapp'}, 'metadata': {'cron': 'auto'}},
+            {'name': 'job9', 'tags': {'label': 'testapp'}, 'metadata': {'cron': 'auto'}},
+        ]
+        mp1.return_value = mock.MagicMock(
+            status_code=200, json=lambda: [dict(j, name=f'{self.job_prefix}{j["name"]}') for j in jobs]
+        )
+
+        synced = []
+
+        def _sync(job, job_update, mark_synced):
+            if job.name == 'job4':
+                raise utils.DkronException(666, 'looking for d/a/emon')
+            synced.append(job.name)
+            return True
+
+        with mock.patch('dkron.utils.sync_job', side_effect=_sync) as mp2, mock.patch('dkron.utils.delete_job') as mp3:
+            results = list(utils.resync_jobs(workers=4))
+
+        self.assertEqual(
+            sorted(results),
+            [
+                ('job1', 'u', None),
+                ('job2', 'u', None),
+                ('job3', 'u', None),
+                ('job4', 'u', 'looking for d/a/emon'),
+                ('job5', 'u', 'parent job nope does not exist'),
+                ('job9', 'd', None),
+            ],
+        )
+        # parents always synced before children
+        self.assertLess(synced.index('job1'), synced.index('job2'))
+        self.assertLess(synced.index('job2'), synced.index('job3'))
+        self.assertEqual(mp2.call_count, 4)
+        mp3.assert_called_once_with('job9')
 
     def test_admin__change_job_enabled(self):
         j1 = models.Job.objects.create(name='job1')
@@ -327,6 +718,293 @@ class Test(TestCase):
                 40, 'Failed to delete job1 from dkron - looking for d/a/emon', ''
             )
 
+    def test_outbox(self):
+        j1 = models.Job.objects.create(name='job1')
+        utils.enqueue_sync(['job1', 'job3'])
+        utils.enqueue_sync(['job2'], action='d')
+        # coalesced, latest action wins
+        utils.enqueue_sync(['job3'], action='d')
+        utils.enqueue_sync(['job3'])
+        self.assertEqual(
+            sorted(models.JobSyncOutbox.objects.values_list('job_name', 'action')),
+            [('job1', 'u'), ('job2', 'd'), ('job3', 'u')],
+        )
+
+        with mock.patch('dkron.utils.sync_job', return_value=True) as mp1, mock.patch('dkron.utils.delete_job') as mp2:
+            mp2.side_effect = utils.DkronException(500, 'looking for d/a/emon')
+            self.assertEqual(
+                sorted(utils.drain_outbox()),
+                [('job1', 'u', None), ('job2', 'd', 'looking for d/a/emon'), ('job3', 'n', None)],
+            )
+            mp1.assert_called_once_with(j1, None, mark_synced=False)
+            mp2.assert_called_once_with('job2')
+
+        # failed entry is kept and delayed
+        e = models.JobSyncOutbox.objects.get()
+        self.assertEqual((e.job_name, e.attempts, e.last_error), ('job2', 1, 'looking for d/a/emon'))
+        self.assertGreater(e.next_attempt_at, timezone.now() + timezone.timedelta(seconds=25))
+        self.assertEqual(list(utils.drain_outbox()), [])
+
+        # already deleted in dkron
+        models.JobSyncOutbox.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('dkron.utils.delete_job', side_effect=utils.DkronException(404, 'not found')):
+            self.assertEqual(list(utils.drain_outbox()), [('job2', 'd', None)])
+        self.assertFalse(models.JobSyncOutbox.objects.exists())
+
+        # changed again while being synced: entry stays for the next run
+        utils.enqueue_sync(['job1'])
+        with mock.patch('dkron.utils.sync_job', side_effect=lambda *a, **b: utils.enqueue_sync(['job1']) or True):
+            self.assertEqual(list(utils.drain_outbox()), [('job1', 'u', None)])
+        self.assertEqual(models.JobSyncOutbox.objects.get().attempts, 0)
+
+    def test_outbox_dkron_down(self):
+        models.Job.objects.create(name='job1')
+        utils.enqueue_sync(['job1'])
+        utils.enqueue_sync(['job2'], action='d')
+        with mock.patch('requests.Session.request', side_effect=requests.ConnectionError('connection refused')):
+            self.assertEqual(
+                sorted(utils.drain_outbox()), [('job1', 'u', 'connection refused'), ('job2', 'd', 'connection refused')]
+            )
+        # failed, delayed with backoff
+        for e in models.JobSyncOutbox.objects.all():
+            self.assertEqual((e.attempts, e.last_error), (1, 'connection refused'))
+            self.assertGreater(e.next_attempt_at, timezone.now() + timezone.timedelta(seconds=25))
+
+        with mock.patch('requests.Session.request', side_effect=requests.Timeout('read timed out')):
+            self.assertEqual(
+                sorted(utils.resync_jobs(workers=2, dirty_only=True)),
+                [('job1', 'u', 'read timed out'), ('job2', 'd', 'read timed out')],
+            )
+
+    def test_drain_outbox_command(self):
+        models.Job.objects.create(name='job1')
+        utils.enqueue_sync(['job1'])
+        utils.enqueue_sync(['job2'], action='d')
+        out = StringIO()
+        err = StringIO()
+        with mock.patch('dkron.utils.sync_job', return_value=True), mock.patch(
+            'dkron.utils.delete_job', side_effect=utils.DkronException(500, 'looking for d/a/emon')
+        ):
+            management.call_command('drain_dkron_outbox', batch_size=1, stdout=out, stderr=err)
+        self.assertEqual(out.getvalue(), 'Job job1 synced\n')
+        self.assertEqual(err.getvalue(), 'Job job2 failed - looking for d/a/emon\n')
+        self.assertEqual(list(models.JobSyncOutbox.objects.values_list('job_name', flat=True)), ['job2'])
+
+    @override_settings(DKRON_SYNC_ASYNC=True)
+    def test_admin_sync_async(self):
+        j1 = models.Job.objects.create(name='job1')
+        ja = admin.JobAdmin(models.Job, self.site)
+        request = mock.MagicMock()
+        with mock.patch('dkron.utils.sync_job') as mp1, mock.patch('dkron.utils.delete_job') as mp2:
+            ja.save_model(request, j1, None, None)
+            self.assertEqual(list(models.JobSyncOutbox.objects.values_list('job_name', 'action')), [('job1', 'u')])
+
+            ja._change_job_enabled(request, models.Job.objects.all(), False)
+            j1.refresh_from_db()
+            self.assertFalse(j1.enabled)
+            self.assertEqual(list(models.JobSyncOutbox.objects.values_list('job_name', 'action')), [('job1', 'u')])
+
+            ja.delete_model(request, j1)
+            self.assertEqual(list(models.JobSyncOutbox.objects.values_list('job_name', 'action')), [('job1', 'd')])
+
+            mp1.assert_not_called()
+            mp2.assert_not_called()
+            request._messages.add.assert_not_called()
+
+    def test_admin_sync_state(self):
+        j1 = models.Job.objects.create(name='job1')
+        ja = admin.JobAdmin(models.Job, self.site)
+        request = mock.MagicMock()
+
+        def _state():
+            return ja.get_sync_state(ja.get_queryset(request).get(pk=j1.pk))
+
+        self.assertIn('alt="dirty"', _state())
+        models.Job.objects.filter(pk=j1.pk).update(dirty=False)
+        self.assertIn('alt="synced"', _state())
+        utils.enqueue_sync(['job1'])
+        self.assertIn('alt="pending"', _state())
+        models.JobSyncOutbox.objects.update(attempts=1, last_error='looking for d/a/emon')
+        self.assertIn('title="looking for d/a/emon" alt="failed"', _state())
+
+    @override_settings(DKRON_SYNC_ON_SAVE=True)
+    def test_sync_on_save(self):
+        with mock.patch('dkron.utils.sync_job', return_value=True) as mp1, mock.patch('dkron.utils.delete_job') as mp2:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                j2 = models.Job.objects.create(name='job2', schedule='@parent job1', command='ls')
+                j1 = models.Job.objects.create(name='job1', schedule='@hourly', command='ls')
+                j1.command = 'ls -l'
+                j1.save()
+                j3 = models.Job.objects.create(name='job3', schedule='@hourly', command='ls')
+                j3.delete()
+                models.Job.objects.filter(name='job2').update(enabled=False)
+                mp1.assert_not_called()
+            # coalesced in a single flush, parents first
+            self.assertEqual(len(callbacks), 1)
+            self.assertEqual(
+                mp1.call_args_list, [mock.call(j1, None, mark_synced=False), mock.call(j2, None, mark_synced=False)]
+            )
+            self.assertFalse(mp1.call_args_list[1].args[0].enabled)
+            mp2.assert_called_once_with('job3')
+            # its tombstone is done
+            self.assertFalse(models.JobSyncOutbox.objects.exists())
+            self.assertFalse(models.Job.objects.filter(dirty=True).exists())
+            mp1.reset_mock()
+
+            # not synced fields (such as webhook ones)
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                j1.last_run_success = True
+                j1.save(update_fields=['last_run_success'])
+            self.assertEqual(callbacks, [])
+
+            # rolled back changes are not synced
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                try:
+                    with transaction.atomic():
+                        j1.save()
+                        raise ValueError()
+                except ValueError:
+                    pass
+                j2.save()
+            self.assertEqual(len(callbacks), 1)
+            mp1.assert_called_once_with(j2, None, mark_synced=False)
+
+    @override_settings(DKRON_SYNC_ON_SAVE=True, DKRON_SYNC_ASYNC=True)
+    def test_sync_on_save_async(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            j1 = models.Job.objects.create(name='job1', schedule='@hourly', command='ls')
+            j2 = models.Job.objects.create(name='job2', schedule='@hourly', command='ls')
+            j2.delete()
+            models.Job.objects.filter(pk=j1.pk).update(name='job3')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(
+            sorted(models.JobSyncOutbox.objects.values_list('job_name', 'action')),
+            # job1 renamed to job3
+            [('job1', 'd'), ('job2', 'd'), ('job3', 'u')],
+        )
+
+    def test_upcoming_runs(self):
+        after = timezone.now().replace(year=2024, month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        models.Job.objects.create(name='job1', schedule='0 0 */6 * * *', command='ls')
+        models.Job.objects.create(name='job2', schedule='@parent job1', command='ls')
+        models.Job.objects.create(name='job3', schedule='0 0 */6 * * *', command='ls', enabled=False)
+        models.Job.objects.create(name='job4', schedule='@every 30m', command='ls')
+        models.Job.objects.create(name='job5', schedule='@manually', command='ls')
+        models.Job.objects.create(name='job6', schedule='@parent job6', command='ls')
+        hours = [after + timezone.timedelta(hours=h) for h in (6, 12, 18, 24)]
+        with override_settings(DKRON_UPCOMING_RUNS=4):
+            self.assertEqual(
+                utils.upcoming_runs(after=after),
+                {
+                    'job1': hours,
+                    'job2': hours,
+                    'job3': [],
+                    'job4': [after + timezone.timedelta(minutes=m) for m in (30, 60, 90, 120)],
+                    'job5': [],
+                    'job6': [],
+                },
+            )
+
+    @override_settings(DKRON_UPCOMING_RUNS=10)
+    def test_upcoming_runs_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            j1 = models.Job.objects.create(name='job1', schedule='0 0 * * * *', command='ls')
+            j2 = models.Job.objects.create(name='job2', schedule='@parent job1', command='ls')
+            models.Job.objects.create(name='job3', schedule='@hourly', command='ls')
+            self.assertEqual(models.UpcomingRun.objects.count(), 0)
+        # refreshed once committed, all together
+        self.assertEqual(len(callbacks), 1)
+
+        def _runs(job):
+            return list(job.upcoming_runs.values_list('run_at', flat=True))
+
+        # children included
+        self.assertEqual(len(_runs(j1)), 10)
+        self.assertEqual(_runs(j2), _runs(j1))
+        self.assertEqual(models.UpcomingRun.objects.count(), 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            j1.schedule = '@daily'
+            j1.save()
+        self.assertEqual(len(_runs(j1)), 1)
+        self.assertEqual(_runs(j2), _runs(j1))
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Job.objects.filter(name='job1').update(enabled=False)
+        self.assertEqual(_runs(j1), [])
+        self.assertEqual(_runs(j2), [])
+        self.assertEqual(models.UpcomingRun.objects.count(), 10)
+
+        # only the changed job and its children are loaded (not the whole table)
+        with self.captureOnCommitCallbacks(execute=True):
+            j2.schedule = '@hourly'
+            j2.save(update_fields=['schedule'])
+        with self.assertNumQueries(6):
+            # job, its children (none), delete and create (in a savepoint)
+            utils.refresh_upcoming_runs(['job2'])
+        with self.assertNumQueries(5):
+            # disabled, nothing to create
+            utils.refresh_upcoming_runs(['job1'])
+        self.assertEqual(len(_runs(j2)), 10)
+        # ancestors loaded for children of parents not being refreshed
+        models.Job.objects.filter(name='job2').update(schedule='@parent job3')
+        models.UpcomingRun.objects.all().delete()
+        self.assertEqual(10, utils.refresh_upcoming_runs(['job2']))
+        models.UpcomingRun.objects.all().delete()
+
+        out = StringIO()
+        management.call_command('refresh_dkron_upcoming', stdout=out)
+        self.assertEqual(out.getvalue(), '20 upcoming runs\n')
+
+        # rolled back, nothing to refresh
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    models.Job.objects.filter(name='job3').update(schedule='@daily')
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+
+        with override_settings(DKRON_UPCOMING_RUNS=0):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                j1.schedule = '@hourly'
+                j1.save()
+            self.assertEqual(_runs(j1), [])
+
+    @override_settings(DKRON_UPCOMING_RUNS=10)
+    def test_admin_upcoming(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Job.objects.create(name='job1', schedule='0 30 * * * *', command='ls')
+            models.Job.objects.create(name='job2', schedule='@daily', command='ls')
+        self.user.is_staff = True
+        self.user.save()
+        self._login()
+        r = self.client.get(reverse('admin:dkron_job_upcoming'))
+        self.assertEqual(r.status_code, 403)
+
+        self.user.user_permissions.add(self._job_perm('view_job'))
+        with self.assertNumQueries(5):
+            # session, user, permissions (x2) and a single query for the runs
+            r = self.client.get(reverse('admin:dkron_job_upcoming'))
+        self.assertEqual(r.status_code, 200)
+        link = f'<a href="{reverse("admin:dkron_job_upcoming")}"'
+        self.assertContains(self.client.get(reverse('admin:dkron_job_changelist')), link)
+        with override_settings(DKRON_UPCOMING_RUNS=0):
+            # disabled (default): no link, no page
+            self.assertNotContains(self.client.get(reverse('admin:dkron_job_changelist')), link)
+            self.assertEqual(self.client.get(reverse('admin:dkron_job_upcoming')).status_code, 404)
+        self.assertEqual([run.job.name for run in r.context['runs']].count('job1'), 10)
+
+        # what runs in the first 5 minutes of tomorrow
+        midnight = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + timezone.timedelta(days=1)
+        r = self.client.get(
+            reverse('admin:dkron_job_upcoming'),
+            {
+                'start': midnight.strftime('%Y-%m-%dT%H:%M'),
+                'end': (midnight + timezone.timedelta(minutes=5)).strftime('%Y-%m-%dT%H:%M'),
+            },
+        )
+        self.assertEqual([(run.job.name, run.run_at) for run in r.context['runs']], [('job2', midnight)])
+
     def test_admin_resync_button(self):
         resync_html = (
             '<a href="'
@@ -354,6 +1032,7 @@ class Test(TestCase):
                 ('job1', 'u', None),
                 ('job2', 'd', None),
                 ('job3', 'd', 'failed deletion'),
+                ('job4', 'n', None),
                 ('job5', 'u', 'failed update'),
             ]
             r = self.client.get(
@@ -367,7 +1046,7 @@ class Test(TestCase):
                 <ul class="messagelist">
                     <li class="error">Failed deletion</li>
                     <li class="error">Failed update</li>
-                    <li class="info">1 jobs updated and 1 deleted</li>
+                    <li class="info">1 jobs updated, 1 unchanged and 1 deleted</li>
                 </ul>
                 ''',
                 status_code=200,
@@ -449,8 +1128,470 @@ class Test(TestCase):
         self.assertTrue(j.last_run_success)
         self.assertEqual(notify_models.Notification.objects.count(), 1)
 
+    @override_settings(DKRON_SENTRY_CRON_URL='https://sentry/<monitor_slug>/')
+    @mock.patch('dkron.utils.send_sentry_monitor')
+    def test_webhook_dispatch(self, mp1):
+        j = models.Job.objects.create(name='job1', notify_on_error=True)
+        webhook = reverse('dkron_api:webhook')
+
+        with override_settings(DKRON_SENTRY_CRON_URL=None):
+            # only the UPDATE
+            with self.assertNumQueries(1):
+                r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\ntrue', content_type='not_form_data')
+            self.assertEqual(r.status_code, 200)
+            with self.assertNumQueries(1):
+                r = self.client.post(
+                    reverse('dkron_api:pre_webhook'), data=f'test\n{self.job_prefix}job1', content_type='not_form_data'
+                )
+            self.assertEqual(r.status_code, 200)
+        mp1.assert_not_called()
+
+        with self.assertNumQueries(2):
+            r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\ntrue', content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        mp1.assert_called_once_with(j, 'ok')
+        mp1.reset_mock()
+
+        # in background threads
+        utils._dispatchers.cache_clear()
+        with override_settings(DKRON_WEBHOOK_WORKERS=2), mock.patch('dkron.views.notify') as mp2:
+            r = self.client.post(
+                reverse('dkron_api:pre_webhook'), data=f'test\n{self.job_prefix}job1', content_type='not_form_data'
+            )
+            self.assertEqual(r.status_code, 200)
+            r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\nfalse', content_type='not_form_data')
+            self.assertEqual(r.status_code, 200)
+            for executor in utils._dispatchers():
+                executor.shutdown()
+        utils._dispatchers.cache_clear()
+        self.assertEqual([mock.call(j, 'in_progress'), mock.call(j, 'error')], mp1.call_args_list)
+        mp2.assert_called_once()
+        j.refresh_from_db()
+        self.assertFalse(j.last_run_success)
+
+    @override_settings(DKRON_WEBHOOK_FLUSH_INTERVAL=5)
+    @mock.patch('dkron.utils._flush_runs_loop')
+    def test_webhook_buffer(self, mp1):
+        j1 = models.Job.objects.create(name='job1')
+        j2 = models.Job.objects.create(name='job2', last_run_success=False, last_run_date=timezone.now())
+        webhook = reverse('dkron_api:webhook')
+
+        r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\nfalse', content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        with self.assertNumQueries(0):
+            for name, result in (('job2', 'true'), ('job1', 'true'), ('job3', 'true')):
+                r = self.client.post(
+                    webhook, data=f'test\n{self.job_prefix}{name}\n{result}', content_type='not_form_data'
+                )
+                self.assertEqual(r.status_code, 200)
+        mp1.assert_called()
+        j1.refresh_from_db()
+        self.assertIsNone(j1.last_run_date)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(3, utils.flush_runs())
+        j1.refresh_from_db()
+        self.assertTrue(j1.last_run_success)
+        self.assertIsNotNone(j1.last_run_date)
+        j2.refresh_from_db()
+        self.assertTrue(j2.last_run_success)
+        self.assertFalse(models.Job.objects.filter(name='job3').exists())
+        self.assertEqual(0, utils.flush_runs())
+
+        # older results (flushed late by another process) do not override newer ones
+        utils.buffer_run('job1', False, j1.last_run_date - timezone.timedelta(seconds=10))
+        utils.buffer_run('job2', False, j2.last_run_date + timezone.timedelta(seconds=10))
+        self.assertEqual(2, utils.flush_runs(batch_size=1))
+        j1.refresh_from_db()
+        self.assertTrue(j1.last_run_success)
+        j2.refresh_from_db()
+        self.assertFalse(j2.last_run_success)
+
+        # kept for next time on errors
+        utils.buffer_run('job1', False, timezone.now())
+        with mock.patch.object(models.Job.objects, 'filter', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                utils.flush_runs()
+        self.assertEqual(1, utils.flush_runs())
+        j1.refresh_from_db()
+        self.assertFalse(j1.last_run_success)
+
+        # unknown jobs still 404 when the job has to be loaded anyway
+        r = self.client.post(webhook, data=f'test\n{self.job_prefix}job3\nfalse', content_type='not_form_data')
+        self.assertEqual(r.status_code, 404)
+        utils.flush_runs()
+
+    @override_settings(DKRON_EXECUTIONS=True)
+    def test_executions(self):
+        j = models.Job.objects.create(name='job1', notify_on_error=False)
+        pre_webhook, webhook = reverse('dkron_api:pre_webhook'), reverse('dkron_api:webhook')
+
+        # job id and INSERT
+        with self.assertNumQueries(2):
+            r = self.client.post(pre_webhook, data=f'test\n{self.job_prefix}job1', content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        r = self.client.post(pre_webhook, data=f'test\n{self.job_prefix}job2', content_type='not_form_data')
+        self.assertEqual(r.status_code, 404)
+        e = j.executions.get()
+        self.assertIsNotNone(e.started_at)
+        self.assertIsNone(e.finished_at)
+        self.assertIsNone(e.success)
+
+        # job UPDATE and SELECT (notify_on_error), job id, running executions, then in a transaction (savepoint)
+        # execution UPDATE and rollups INSERT, SELECT (ids then locked rows, in id order) and UPDATE
+        with self.assertNumQueries(11):
+            r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\nfalse', content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        e.refresh_from_db()
+        self.assertIsNotNone(e.finished_at)
+        self.assertFalse(e.success)
+
+        # start not received
+        r = self.client.post(webhook, data=f'test\n{self.job_prefix}job1\ntrue', content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(2, j.executions.count())
+        e = j.executions.latest('pk')
+        self.assertIsNone(e.started_at)
+        self.assertTrue(e.success)
+
+        # in bulk, ends matched to the latest start before them
+        now = timezone.now()
+        with override_settings(DKRON_WEBHOOK_FLUSH_INTERVAL=5), mock.patch('dkron.utils._flush_runs_loop'):
+            utils.record_execution_start('job1', now - timezone.timedelta(seconds=20))
+            self.assertIsNone(utils.record_execution_start('job1', now - timezone.timedelta(seconds=10)))
+            utils.record_execution_end('job1', now - timezone.timedelta(seconds=5), True)
+            utils.record_execution_start('job1', now)
+            utils.record_execution_end('job1', now + timezone.timedelta(seconds=1), False)
+            utils.record_execution_end('job1', now + timezone.timedelta(seconds=2), True)
+            utils.record_execution_end('job2', now, True)
+            self.assertEqual(2, j.executions.count())
+            self.assertEqual(7, utils.flush_runs())
+        self.assertEqual(
+            [
+                (now - timezone.timedelta(seconds=20), now + timezone.timedelta(seconds=2), True),
+                (now - timezone.timedelta(seconds=10), now - timezone.timedelta(seconds=5), True),
+                (now, now + timezone.timedelta(seconds=1), False),
+            ],
+            list(
+                j.executions.filter(pk__gt=e.pk)
+                .order_by('started_at')
+                .values_list('started_at', 'finished_at', 'success')
+            ),
+        )
+
+    @override_settings(DKRON_EXECUTIONS=True)
+    def test_rollups(self):
+        j1 = models.Job.objects.create(name='job1')
+        j2 = models.Job.objects.create(name='job2')
+        now = timezone.now().replace(minute=30)
+        e = models.JobExecution.objects.create(job=j1, started_at=now - timezone.timedelta(seconds=200))
+
+        events = [('job1', None, now - timezone.timedelta(seconds=10), False)]
+        for i in range(20):
+            # 19 x 1s and 1 x 50s
+            events.append(('job1', now + timezone.timedelta(minutes=i), None, None))
+            events.append(('job1', None, now + timezone.timedelta(minutes=i, seconds=50 if i == 5 else 1), True))
+        events.append(('job2', None, now, True))
+        utils._write_executions(events)
+        # more runs later on, added up
+        utils._write_executions([('job2', None, now + timezone.timedelta(seconds=1), False)])
+        self.assertEqual(23, models.JobExecution.objects.count())
+        e.refresh_from_db()
+        self.assertEqual(now - timezone.timedelta(seconds=10), e.finished_at)
+
+        hour = timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+        r = j1.rollups.get(period='h', start=hour)
+        self.assertEqual((21, 1, 21), (r.runs, r.failures, r.timed_runs))
+        self.assertEqual((1, 190), (r.duration_min, r.duration_max))
+        self.assertEqual(19 + 50 + 190, r.duration_sum)
+        self.assertEqual(j1.rollups.get(period='d', start=hour.replace(hour=0)).buckets, r.buckets)
+        self.assertEqual(1, models.JobRunRollup.percentile([r], 0.5))
+        self.assertEqual(60, models.JobRunRollup.percentile([r], 0.95))
+        self.assertEqual(190, models.JobRunRollup.percentile([r], 1))
+        r = j2.rollups.get(period='h', start=hour)
+        self.assertEqual((2, 1, 0), (r.runs, r.failures, r.timed_runs))
+        self.assertIsNone(models.JobRunRollup.percentile([r], 0.95))
+
+        # in the admin, without a query per job
+        self.user.is_superuser = True
+        self.user.is_staff = True
+        self.user.save()
+        self._login()
+        # session, user, counts (x2), jobs, rollups and filters (x2)
+        with self.assertNumQueries(8):
+            r = self.client.get(reverse('admin:dkron_job_changelist'))
+        self.assertContains(r, '24h failure rate')
+        self.assertContains(r, '5% of 21')
+        self.assertContains(r, '1.0m')
+        self.assertContains(r, '50% of 2')
+        models.Job.objects.create(name='job3')
+        with self.assertNumQueries(8):
+            self.client.get(reverse('admin:dkron_job_changelist'))
+
+    @override_settings(DKRON_EXECUTIONS=True, DKRON_METRICS_TOKEN='secret')
+    def test_metrics(self):
+        models.Job.objects.create(name='job1', schedule='@every 1m')
+        models.Job.objects.create(name='job2', schedule='@parent job1')
+        models.Job.objects.create(name='job3', schedule='0 0 * * * *', enabled=False)
+        now = timezone.now()
+        utils._write_executions(
+            [
+                ('job1', now, None, None),
+                ('job1', None, now + timezone.timedelta(seconds=3), True),
+                ('job1', None, now + timezone.timedelta(seconds=4), False),
+            ]
+        )
+
+        with override_settings(DKRON_METRICS_TOKEN=None):
+            r = self.client.get(reverse('dkron_api:metrics'))
+            self.assertEqual(r.status_code, 404)
+        r = self.client.get(reverse('dkron_api:metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(r.status_code, 403)
+
+        # jobs and rollups (x2)
+        with self.assertNumQueries(3):
+            r = self.client.get(reverse('dkron_api:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = r.content.decode().splitlines()
+        ns = self.job_prefix.rstrip('_')
+        labels = f'namespace="{ns}",job="job1"'
+        self.assertIn('# TYPE dkron_job_duration_seconds histogram', lines)
+        self.assertIn(f'dkron_job_runs_total{{{labels}}} 2', lines)
+        self.assertIn(f'dkron_job_failures_total{{{labels}}} 1', lines)
+        self.assertIn(f'dkron_job_duration_seconds_bucket{{{labels},le="2.5"}} 0', lines)
+        self.assertIn(f'dkron_job_duration_seconds_bucket{{{labels},le="5"}} 1', lines)
+        self.assertIn(f'dkron_job_duration_seconds_bucket{{{labels},le="+Inf"}} 1', lines)
+        self.assertIn(f'dkron_job_duration_seconds_sum{{{labels}}} 3.0', lines)
+        self.assertIn(f'dkron_job_duration_seconds_count{{{labels}}} 1', lines)
+        self.assertIn(f'dkron_job_duration_p95_seconds{{{labels}}} 3.0', lines)
+        self.assertIn(f'dkron_job_runs_total{{namespace="{ns}",job="job2"}} 0', lines)
+        self.assertIn(f'dkron_job_schedule_interval_seconds{{{labels}}} 60.0', lines)
+        self.assertIn(f'dkron_job_schedule_interval_seconds{{namespace="{ns}",job="job2"}} 60.0', lines)
+        self.assertFalse([line for line in lines if 'job="job3"' in line and 'interval' in line])
+
+    def test_schedule_intervals(self):
+        jobs = [
+            models.Job(name='a', schedule='0 0,30 * * * *'),
+            models.Job(name='b', schedule='0 0 0,20 * * *'),
+            models.Job(name='c', schedule='@parent b'),
+            models.Job(name='d', schedule='@parent d'),
+            models.Job(name='e', schedule='@manually'),
+            models.Job(name='f', schedule='@at 2020-01-01T00:00:00Z'),
+            models.Job(name='g', schedule='@every 10s', enabled=False),
+        ]
+        self.assertEqual(
+            {'a': 1800, 'b': 4 * 3600, 'c': 4 * 3600, 'd': None, 'e': None, 'f': None},
+            utils.schedule_intervals(jobs, after=timezone.now()),
+        )
+
+    def test_usage(self):
+        usage = reverse('dkron_api:usage')
+        report = {'exit_code': 0, 'wall_time': 2.5, 'cpu_user': 1.25, 'cpu_system': 0.5, 'max_rss': 1024}
+        with override_settings(DKRON_TOKEN=None):
+            r = self.client.post(usage)
+            self.assertEqual(r.status_code, 404)
+        r = self.client.get(usage)
+        self.assertEqual(r.status_code, 400)
+        r = self.client.post(usage, data=f'wrong\n{self.job_prefix}job1\n{{}}', content_type='not_form_data')
+        self.assertEqual(r.status_code, 403)
+        r = self.client.post(usage, data=f'test\n{self.job_prefix}job1\n{{}}', content_type='not_form_data')
+        self.assertEqual(r.status_code, 400)
+        data = f'test\n{self.job_prefix}job1\n{json.dumps(report)}'
+        r = self.client.post(usage, data=data, content_type='not_form_data')
+        self.assertEqual(r.status_code, 404)
+
+        j = models.Job.objects.create(name='job1')
+        r = self.client.post(usage, data=data, content_type='not_form_data')
+        self.assertEqual(r.status_code, 200)
+        j.refresh_from_db()
+        self.assertEqual(
+            (2.5, 1.25, 0.5, 1024),
+            (j.last_run_wall_time, j.last_run_cpu_user, j.last_run_cpu_system, j.last_run_max_rss),
+        )
+        self.assertFalse(j.rollups.exists())
+
+        # added up in the rollups
+        with override_settings(DKRON_EXECUTIONS=True):
+            self.client.post(usage, data=data, content_type='not_form_data')
+            report.update(max_rss=512)
+            self.client.post(
+                usage, data=f'test\n{self.job_prefix}job1\n{json.dumps(report)}', content_type='not_form_data'
+            )
+        self.assertEqual(3, j.rollups.count())
+        for rollup in j.rollups.all():
+            self.assertEqual((3.5, 1024, 0), (rollup.cpu_time_sum, rollup.max_rss, rollup.runs))
+        j.refresh_from_db()
+        self.assertEqual(512, j.last_run_max_rss)
+
+    def test_job_to_dict_wrapper(self):
+        j = models.Job(name='job1', schedule='@hourly', command='echo "1"', use_shell=True)
+        self.assertEqual({'shell': 'true', 'command': 'echo "1"'}, utils.job_to_dict(j)['executor_config'])
+        with override_settings(DKRON_WRAPPER=True, DKRON_WRAPPER_PYTHON='/venv/bin/python'):
+            self.assertEqual(
+                {
+                    'shell': 'false',
+                    'command': f'/venv/bin/python -m dkron.wrapper --job {self.job_prefix}job1 --shell -- \'echo "1"\'',
+                },
+                utils.job_to_dict(j)['executor_config'],
+            )
+            j.use_wrapper = False
+            self.assertEqual('echo "1"', utils.job_to_dict(j)['executor_config']['command'])
+        j.use_wrapper = True
+        j.use_shell = False
+        self.assertEqual(
+            f'python -m dkron.wrapper --job {self.job_prefix}job1 -- echo "1"',
+            utils.job_to_dict(j)['executor_config']['command'],
+        )
+
+    def test_output(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            os.mkdir(os.path.join(output_dir, 'job1'))
+            with gzip.open(os.path.join(output_dir, 'job1', 'run.log.gz'), 'wb') as f:
+                f.write(b'line 1\nline 2\n')
+            url = reverse('dkron:output', kwargs={'path': 'job1/run.log.gz'})
+
+            with override_settings(DKRON_OUTPUT_DIR=output_dir):
+                r = self.client.get(url)
+                self.assertEqual(r.status_code, 302)
+                self._login()
+                r = self.client.get(url)
+                self.assertEqual(r.status_code, 302)
+                self.user.user_permissions.add(self._job_perm('can_use_dashboard'))
+
+                r = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual('gzip', r.headers['Content-Encoding'])
+                self.assertEqual(b'line 1\nline 2\n', gzip.decompress(b''.join(r.streaming_content)))
+                r = self.client.get(url)
+                self.assertEqual(r.status_code, 200)
+                self.assertNotIn('Content-Encoding', r.headers)
+                self.assertEqual(b'line 1\nline 2\n', b''.join(r.streaming_content))
+
+                for path in ('job1/missing.log.gz', 'job1/run.log', '../job1/run.log.gz'):
+                    r = self.client.get(reverse('dkron:output', kwargs={'path': path}))
+                    self.assertEqual(r.status_code, 404)
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 404)
+
+    def test_job_to_dict_http_executor(self):
+        j = models.Job(name='job1', schedule='@hourly', command='clearsessions', executor='http', max_runtime=10)
+        with self.assertRaises(utils.DkronException):
+            utils.job_to_dict(j)
+        # failed sync of that job only
+        j.save()
+        models.Job.objects.create(name='job2')
+        with mock.patch('requests.Session.post', return_value=mock.MagicMock(status_code=201)), mock.patch(
+            'requests.Session.get',
+            side_effect=lambda url, **kw: mock.MagicMock(status_code=200 if url == JOBS_URL else 404, json=list),
+        ):
+            self.assertEqual(
+                sorted(utils.resync_jobs(dirty_only=True)),
+                [('job1', 'u', 'DKRON_HTTP_EXECUTOR_URL is required by http executor jobs'), ('job2', 'u', None)],
+            )
+        with override_settings(DKRON_HTTP_EXECUTOR_URL='http://app/dkron/api/run/'):
+            d = utils.job_to_dict(j)
+        self.assertEqual('http', d['executor'])
+        self.assertEqual(
+            {
+                'method': 'POST',
+                'url': 'http://app/dkron/api/run/',
+                'headers': '["Content-Type: text/plain"]',
+                'body': utils.http_command_signer().sign('clearsessions'),
+                'timeout': '60',
+                'expectCode': '200',
+            },
+            d['executor_config'],
+        )
+        self.assertEqual('clearsessions', utils.http_command_signer().unsign(d['executor_config']['body']))
+
+    def test_run(self):
+        url = reverse('dkron_api:run')
+        signer = utils.http_command_signer()
+        r = self.client.post(url, data=signer.sign('check'), content_type='text/plain')
+        self.assertEqual(r.status_code, 404)
+
+        with override_settings(DKRON_HTTP_COMMANDS=('check',)):
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 400)
+            r = self.client.post(url, data='check:made-up', content_type='text/plain')
+            self.assertEqual(r.status_code, 403)
+            r = self.client.post(url, data=signer.sign('migrate'), content_type='text/plain')
+            self.assertEqual(r.status_code, 403)
+            r = self.client.post(url, data=signer.sign('check "oops'), content_type='text/plain')
+            self.assertEqual(r.status_code, 400)
+
+            r = self.client.post(url, data=signer.sign('check'), content_type='text/plain')
+            self.assertEqual(r.status_code, 200)
+            self.assertIn(b'System check identified no issues', r.content)
+            r = self.client.post(
+                url, data=signer.sign('check --deploy --fail-level WARNING'), content_type='text/plain'
+            )
+            self.assertEqual(r.status_code, 500)
+            self.assertIn(b'SystemCheckError', r.content)
+
+    def test_job_limits(self):
+        j = models.Job.objects.create(name='job1', schedule='@hourly', command='echo 1', use_wrapper=False)
+        models.Job.objects.filter(pk=j.pk).update(dirty=False)
+        j.refresh_from_db()
+        self.assertEqual({}, j.limits)
+        self.assertEqual('echo 1', utils.job_to_dict(j)['executor_config']['command'])
+
+        # limits are applied by the wrapper, so they imply it
+        j.max_runtime = 3600
+        j.max_memory = 512
+        j.niceness = 0
+        j.save(update_fields=['max_runtime', 'max_memory', 'niceness'])
+        self.assertTrue(j.dirty)
+        self.assertEqual({'timeout': 3600, 'memory': 512}, j.limits)
+        self.assertEqual(
+            f'python -m dkron.wrapper --job {self.job_prefix}job1 --timeout 3600 --memory 512 -- echo 1',
+            utils.job_to_dict(j)['executor_config']['command'],
+        )
+
+    @override_settings(DKRON_EXECUTIONS_RETENTION_DAYS=10)
+    def test_prune_executions_command(self):
+        j = models.Job.objects.create(name='job1')
+        now = timezone.now()
+        for days in (0, 5, 11, 15, 20):
+            models.JobExecution.objects.create(
+                job=j, started_at=now - timezone.timedelta(days=days), finished_at=now - timezone.timedelta(days=days)
+            )
+        # never finished
+        models.JobExecution.objects.create(job=j, started_at=now - timezone.timedelta(days=5))
+        models.JobExecution.objects.create(job=j, started_at=now - timezone.timedelta(days=12))
+        Rollup = models.JobRunRollup
+        for days in (0, 11, 12, 13):
+            Rollup.objects.create(job=j, period=Rollup.HOUR, start=now - timezone.timedelta(days=days))
+        Rollup.objects.create(job=j, period=Rollup.DAY, start=now - timezone.timedelta(days=20))
+
+        # in batches, hourly rollups included
+        before = now - timezone.timedelta(days=10)
+        batches = list(utils.prune_executions(before, batch_size=2))
+        self.assertEqual(
+            [(Rollup, 2), (Rollup, 1), (models.JobExecution, 2), (models.JobExecution, 1), (models.JobExecution, 1)],
+            batches,
+        )
+        self.assertEqual(3, j.executions.count())
+        self.assertEqual(2, j.rollups.count())
+
+        models.JobExecution.objects.create(
+            job=j, started_at=now - timezone.timedelta(days=15), finished_at=now - timezone.timedelta(days=15)
+        )
+        Rollup.objects.create(job=j, period=Rollup.HOUR, start=now - timezone.timedelta(days=11))
+        out = StringIO()
+        management.call_command('prune_dkron_executions', batch_size=2, stdout=out)
+        self.assertIn('1 executions deleted', out.getvalue())
+        self.assertIn('1 hourly rollups deleted', out.getvalue())
+        self.assertEqual(3, j.executions.count())
+
+        out = StringIO()
+        management.call_command('prune_dkron_executions', days=1, stdout=out)
+        self.assertIn('2 executions deleted', out.getvalue())
+        self.assertEqual(now, j.executions.get().started_at)
+
     @mock.patch('time.time', return_value=1)
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_run_async(self, mp, tp, job_prefix=''):
         expected_mock_call = mock.call(
             'http://dkron/v1/jobs',
@@ -491,20 +1632,42 @@ class Test(TestCase):
             mp.assert_has_calls([expected_mock_call])
             self.assertEqual(x, expected_return)
 
+            # output offloaded by the wrapper
+            mp.reset_mock()
+            config = expected_mock_call.kwargs['json']['executor_config']
+            config['command'] = (
+                f'python -m dkron.wrapper --job {job_prefix}tmp_somecommand_1 --no-usage -- ' + config['command']
+            )
+            type(mpp).status_code = mock.PropertyMock(side_effect=[201, 200])
+            with override_settings(DKRON_VERSION='3.1.10', DKRON_OUTPUT_DIR='/tmp/dkron-output'):
+                x = utils.run_async('somecommand', 'arg1', kwarg='value', enable=True)
+            mp.assert_has_calls([expected_mock_call])
+            self.assertEqual(x, expected_return)
+
+            # run by the warm workers
+            mp.reset_mock()
+            config['command'] = config['command'].replace(
+                'python ./manage.py run_dkron_async_command', 'python -m dkron.workers /tmp/dkron-workers.sock'
+            )
+            type(mpp).status_code = mock.PropertyMock(side_effect=[201, 200])
+            with override_settings(DKRON_VERSION='3.1.10', DKRON_OUTPUT_DIR='/tmp/dkron-output', DKRON_WORKERS=2):
+                x = utils.run_async('somecommand', 'arg1', kwarg='value', enable=True)
+            mp.assert_has_calls([expected_mock_call])
+            self.assertEqual(x, expected_return)
+
     @mock.patch('after_response.decorators.AFTER_RESPONSE_IMMEDIATE', new_callable=mock.PropertyMock, return_value=True)
-    @mock.patch('dkron.utils.requests')
+    @mock.patch('dkron.utils.client')
     @mock.patch('dkron.utils.call_command')
-    def test_run_async_fallback(self, ccp, req_mock, __not_used):
+    def test_run_async_fallback(self, ccp, client_mock, __not_used):
         # force ConnectionError (to fallback) instead of using invalid URL
-        req_mock.ConnectionError = Exception
-        req_mock.post.side_effect = req_mock.ConnectionError
+        client_mock.return_value.post.side_effect = utils.requests.ConnectionError
         x = utils.run_async('somecommand', 'arg1', kwarg='value')
         self.assertIsNone(x)
         ccp.assert_called_with('somecommand', 'arg1', kwarg='value')
 
-    @mock.patch('dkron.utils._get')
+    @mock.patch('dkron.utils.client')
     @mock.patch('dkron.utils.delete_job')
-    def test_cleanup_command(self, dj_mock, get_mock):
+    def test_cleanup_command(self, dj_mock, client_mock):
         err = StringIO()
         test_now = timezone.now()
 
@@ -512,14 +1675,15 @@ class Test(TestCase):
             {'name': f'tmp_job1_{int((test_now - timezone.timedelta(days=1)).timestamp())}'},
             {'name': f'tmp_job2_{int((test_now - timezone.timedelta(days=5)).timestamp())}'},
         ]
-        get_mock.return_value = mock.MagicMock(json=lambda: jobs)
+        get_mock = client_mock.return_value.iter_jobs
+        get_mock.side_effect = lambda *a, **b: iter(jobs)
 
         out = StringIO()
         with mock.patch('django.utils.timezone.now', return_value=test_now):
             management.call_command('cleanup_dkron', stdout=out, stderr=err)
         self.assertIn('Deleting 0 jobs (out of 2)', out.getvalue())
         self.assertEqual(err.getvalue(), '')
-        get_mock.assert_called_once_with('jobs', params={'metadata[temp]': 'true'})
+        get_mock.assert_called_once_with(params={'metadata[temp]': 'true'}, fields=('name',))
 
         get_mock.reset_mock()
         out = StringIO()
@@ -527,7 +1691,7 @@ class Test(TestCase):
             management.call_command('cleanup_dkron', days=3, stdout=out, stderr=err)
         self.assertIn('Deleting 1 jobs (out of 2)', out.getvalue())
         self.assertEqual(err.getvalue(), '')
-        get_mock.assert_called_once_with('jobs', params={'metadata[temp]': 'true'})
+        get_mock.assert_called_once_with(params={'metadata[temp]': 'true'}, fields=('name',))
         dj_mock.assert_called_once_with(jobs[1]['name'])
 
         get_mock.reset_mock()
@@ -537,7 +1701,7 @@ class Test(TestCase):
             management.call_command('cleanup_dkron', days=0, stdout=out, stderr=err)
         self.assertIn('Deleting 2 jobs (out of 2)', out.getvalue())
         self.assertEqual(err.getvalue(), '')
-        get_mock.assert_called_once_with('jobs', params={'metadata[temp]': 'true'})
+        get_mock.assert_called_once_with(params={'metadata[temp]': 'true'}, fields=('name',))
         # called twice - on both jobs
         self.assertEqual(dj_mock.call_count, 2)
 
@@ -558,6 +1722,21 @@ class Test(TestCase):
 
         exec_mock.assert_called_once_with(exe_name, [exe_name, 'agent', '--tag', 'label=testapp'])
 
+    @override_settings(DKRON_SERVER=False, DKRON_WORKERS=2)
+    @mock.patch('subprocess.Popen')
+    @mock.patch('os.execv')
+    def test_run_dkron_workers(self, exec_mock, popen_mock):
+        tmp = tempfile.mkdtemp()
+        exe_name = os.path.join(tmp, 'dkron.exe' if platform.system() == 'Windows' else 'dkron')
+        with open(exe_name, 'wb') as f:
+            f.write(b'1')
+
+        with mock.patch('tempfile.mkdtemp', return_value=tmp):
+            management.call_command('run_dkron', stdout=StringIO(), stderr=StringIO())
+
+        popen_mock.assert_called_once_with([sys.executable, os.path.abspath(sys.argv[0]), 'run_dkron_workers'])
+        exec_mock.assert_called_once_with(exe_name, [exe_name, 'agent', '--tag', 'label=testapp'])
+
     @override_settings(
         DKRON_SERVER=True,
         DKRON_NODE_NAME='whatever',
@@ -641,7 +1820,7 @@ class Test(TestCase):
         r = self.client.get(reverse(PROXY_VIEW))
         self.assertEqual(302, r.status_code)
 
-        mp1.return_value = mock.MagicMock(content='', status_code=202)
+        mp1.return_value = mock.MagicMock(content='', status_code=202, headers={})
         self._login()
         r = self.client.get(reverse(PROXY_VIEW))
         self.assertEqual(202, r.status_code)
@@ -656,13 +1835,250 @@ class Test(TestCase):
         r = self.client.get(reverse(PROXY_VIEW))
         self.assertEqual(202, r.status_code)
 
+    @mock.patch('requests.request')
+    def test_proxy_view_encoding(self, mp1):
+        self.user.is_superuser = True
+        self.user.save()
+        self._login()
+
+        upstream = mock.MagicMock(content=b'decoded', status_code=200, headers={'Content-Encoding': 'gzip'})
+        upstream.raw.read.return_value = b'gzipped'
+        mp1.return_value = upstream
+        # compressed body passed through
+        r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.5')
+        self.assertEqual(b'gzipped', r.content)
+        self.assertEqual('gzip', r.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', r.headers['Vary'])
+        upstream.raw.read.assert_called_once_with(decode_content=False)
+        self.assertEqual(mp1.call_args.kwargs['headers']['Accept-Encoding'], 'deflate, gzip;q=0.5')
+
+        # or decoded when client does not support it
+        for accept_encoding in ('deflate', 'gzip;q=0, *', ''):
+            r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(b'decoded', r.content)
+            self.assertIsNone(r.headers.get('Content-Encoding'))
+        r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='*')
+        self.assertEqual(b'gzipped', r.content)
+
+        # compressed by the proxy if upstream did not
+        upstream = mock.MagicMock(content=b'decoded' * 100, status_code=200, headers={'Content-Type': 'text/html'})
+        mp1.return_value = upstream
+        r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIsNone(r.headers.get('Content-Encoding'))
+        with override_settings(DKRON_PROXY_GZIP=True):
+            r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual('gzip', r.headers['Content-Encoding'])
+            self.assertEqual(b'decoded' * 100, gzip.decompress(r.content))
+            # already compressed upstream is not compressed again
+            mp1.return_value = mock.MagicMock(status_code=200, headers={'Content-Encoding': 'gzip'})
+            mp1.return_value.raw.read.return_value = b'gzipped' * 100
+            r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(b'gzipped' * 100, r.content)
+
+    @override_settings(DKRON_PROXY_STREAM=True)
+    @mock.patch('requests.Session.request')
+    def test_proxy_view_stream_encoding(self, mp1):
+        self.user.is_superuser = True
+        self.user.save()
+        self._login()
+
+        upstream = mock.MagicMock(status_code=200, headers={'Content-Encoding': 'gzip'})
+        upstream.raw.stream.return_value = iter([b'gzi', b'pped'])
+        mp1.return_value = upstream
+        r = self.client.get(reverse(PROXY_VIEW), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(b'gzipped', b''.join(r.streaming_content))
+        self.assertEqual('gzip', r.headers['Content-Encoding'])
+        upstream.raw.stream.assert_called_once_with(64 * 1024, decode_content=False)
+        upstream.iter_content.assert_not_called()
+
+    @override_settings(DKRON_PROXY_CACHE={r'^ui/': 60, r'^v1/': 0})
+    @mock.patch('requests.Session.request')
+    def test_proxy_view_cache(self, mp1):
+        self.user.is_superuser = True
+        self.user.save()
+        self._login()
+        cache.clear()
+
+        upstream = mock.MagicMock(status_code=200, headers={'Content-Type': 'text/html', 'Content-Encoding': 'gzip'})
+        upstream.raw.read.return_value = gzip.compress(b'index')
+        mp1.return_value = upstream
+        r = self.client.get(reverse(PROXY_VIEW) + 'ui/index.html?b=1&a=2', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(b'index', gzip.decompress(r.content))
+        self.assertEqual('gzip', r.headers['Content-Encoding'])
+        self.assertEqual('text/html', r.headers['Content-Type'])
+        self.assertIn('Accept-Encoding', r.headers['Vary'])
+        etag = r.headers['ETag']
+        mp1.assert_called_once()
+        self.assertEqual(mp1.call_args.kwargs['headers']['Accept-Encoding'], 'gzip')
+
+        # served from cache, whatever the order of the query params
+        r = self.client.get(reverse(PROXY_VIEW) + 'ui/index.html?a=2&b=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(b'index', gzip.decompress(r.content))
+        self.assertEqual(etag, r.headers['ETag'])
+        # decoded for clients not accepting gzip
+        r = self.client.get(reverse(PROXY_VIEW) + 'ui/index.html?a=2&b=1', HTTP_ACCEPT_ENCODING='')
+        self.assertEqual(b'index', r.content)
+        self.assertIsNone(r.headers.get('Content-Encoding'))
+        self.assertNotEqual(etag, r.headers['ETag'])
+        # revalidated by the browser
+        r = self.client.get(
+            reverse(PROXY_VIEW) + 'ui/index.html?a=2&b=1', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'W/{etag}'
+        )
+        self.assertEqual(304, r.status_code)
+        self.assertEqual(b'', r.content)
+        mp1.assert_called_once()
+
+        # other query, other path not cached, other methods are not
+        self.client.get(reverse(PROXY_VIEW) + 'ui/index.html?a=3', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(2, mp1.call_count)
+        upstream = mock.MagicMock(content=b'[]', status_code=200, headers={})
+        mp1.return_value = upstream
+        for _ in range(2):
+            r = self.client.get(reverse(PROXY_VIEW) + 'v1/jobs')
+            self.assertEqual(b'[]', r.content)
+            self.client.post(reverse(PROXY_VIEW) + 'ui/index.html')
+            self.client.get(reverse(PROXY_VIEW) + 'other')
+        self.assertEqual(8, mp1.call_count)
+
+    def test_proxy_single_flight(self):
+        started, waiting, release = threading.Event(), threading.Event(), threading.Event()
+        calls = []
+
+        class _Future(views.Future):
+            def result(self, timeout=None):
+                waiting.set()
+                return super().result(timeout)
+
+        def _fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        with ThreadPoolExecutor(2) as executor, mock.patch('dkron.views.Future', _Future):
+            leader = executor.submit(views._single_flight, 'key', _fetch)
+            started.wait(5)
+            follower = executor.submit(views._single_flight, 'key', _fetch)
+            waiting.wait(5)
+            release.set()
+            self.assertEqual('result', leader.result())
+            self.assertEqual('result', follower.result())
+        self.assertEqual(1, len(calls))
+        self.assertEqual({}, views._inflight)
+
+        # errors are shared as well, but not kept
+        with self.assertRaises(ZeroDivisionError):
+            views._single_flight('key', lambda: 1 / 0)
+        self.assertEqual('again', views._single_flight('key', lambda: 'again'))
+
+    @skipIf(httpx is None, 'httpx not installed')
+    def test_async_proxy_view(self):
+        upstream_requests = []
+
+        def _handler(request):
+            upstream_requests.append(request)
+            return httpx.Response(
+                302, headers={'Location': '/whatever', 'X-Custom': 'untouched'}, content=b'raw content'
+            )
+
+        request = AsyncRequestFactory().post(
+            reverse(PROXY_VIEW) + 'v1/jobs?q=1', data=b'{}', content_type='application/json', headers={'cookie': 'a=b'}
+        )
+        request.user = auth_models.AnonymousUser()
+        r = async_to_sync(views.async_proxy)(request, 'v1/jobs')
+        self.assertEqual(302, r.status_code)
+        self.assertTrue(r.headers['location'].startswith(settings.LOGIN_URL))
+
+        self.user.is_superuser = True
+        request.user = self.user
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        with mock.patch('dkron.utils.async_client', return_value=client):
+            r = async_to_sync(views.async_proxy)(request, 'v1/jobs')
+        self.assertEqual(302, r.status_code)
+        self.assertEqual(b'raw content', r.content)
+        self.assertEqual(reverse(PROXY_VIEW) + 'whatever', r.headers['location'])
+        self.assertEqual('untouched', r.headers['x-custom'])
+        self.assertEqual(str(upstream_requests[0].url), 'http://dkron/v1/jobs?q=1')
+        self.assertEqual(upstream_requests[0].content, b'{}')
+        self.assertNotIn('cookie', upstream_requests[0].headers)
+
+    @skipIf(httpx is None, 'httpx not installed')
+    @override_settings(DKRON_PROXY_STREAM=True, DKRON_PROXY_CHUNK_SIZE=4, DKRON_API_AUTH='dXNlcjpwYXNz')
+    async def test_async_proxy_view_stream(self):
+        upstream_requests = []
+
+        def _handler(request):
+            upstream_requests.append(request)
+            # not read yet, as if it came from the network
+            body = httpx.ByteStream(gzip.compress(b'raw content'))
+            return httpx.Response(200, headers={'Content-Encoding': 'gzip'}, stream=body)
+
+        self.user.is_superuser = True
+        request = AsyncRequestFactory().get(reverse(PROXY_VIEW), headers={'accept-encoding': 'gzip'})
+        request.user = self.user
+        with mock.patch(
+            'dkron.utils.async_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        ):
+            r = await views.async_proxy(request)
+        self.assertTrue(r.streaming)
+        self.assertEqual('gzip', r.headers['Content-Encoding'])
+        self.assertEqual(b'raw content', gzip.decompress(b''.join([chunk async for chunk in r.streaming_content])))
+        self.assertEqual(upstream_requests[0].headers['Authorization'], 'Basic dXNlcjpwYXNz')
+
+        # shared within the event loop
+        self.assertIs(utils.async_client(), utils.async_client())
+
+    @override_settings(DKRON_PROXY_STREAM=True, DKRON_PROXY_CHUNK_SIZE=4)
+    @mock.patch('requests.Session.request')
+    def test_proxy_view_stream(self, mp1):
+        self.user.is_superuser = True
+        self.user.save()
+        self._login()
+
+        upstream = mock.MagicMock(status_code=202, headers={'Content-Length': '11', 'X-Custom': 'untouched'})
+        upstream.iter_content.return_value = iter([b'raw ', b'cont', b'ent'])
+        mp1.return_value = upstream
+        r = self.client.get(reverse(PROXY_VIEW) + 'v1/jobs', {'q': '1'})
+        self.assertEqual(202, r.status_code)
+        self.assertTrue(r.streaming)
+        self.assertEqual('untouched', r.headers['x-custom'])
+        self.assertIsNone(r.headers.get('Content-Length'))
+        mp1.assert_called_once_with(
+            'GET',
+            'http://dkron/v1/jobs',
+            allow_redirects=False,
+            headers=mock.ANY,
+            params=mock.ANY,
+            data=None,
+            stream=True,
+        )
+        self.assertEqual(mp1.call_args.kwargs['params'], {'q': ['1']})
+        upstream.close.assert_not_called()
+        self.assertEqual(b'raw content', b''.join(r.streaming_content))
+        upstream.iter_content.assert_called_once_with(chunk_size=4)
+        r.close()
+        upstream.close.assert_called_once_with()
+
+        # request body is read while sent upstream
+        bodies = []
+
+        def _request(method, url, data=None, **kwargs):
+            bodies.append((len(data), data.read(4), data.read()))
+            return upstream
+
+        mp1.side_effect = _request
+        upstream.iter_content.return_value = iter([])
+        r = self.client.post(reverse(PROXY_VIEW) + 'v1/jobs', data=b'{"name": "job1"}', content_type='application/json')
+        self.assertEqual(202, r.status_code)
+        self.assertEqual(bodies, [(16, b'{"na', b'me": "job1"}')])
+
     @mock.patch('requests.request')
     def test_proxy_view(self, mp1):
         self.user.is_superuser = True
         self.user.save()
         self._login()
 
-        mp1.return_value = mock.MagicMock(content='raw content', status_code=202)
+        mp1.return_value = mock.MagicMock(content='raw content', status_code=202, headers={})
         r = self.client.get(reverse(PROXY_VIEW))
         self.assertEqual(202, r.status_code)
         self.assertEqual(b'raw content', r.content)
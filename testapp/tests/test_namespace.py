@@ -4,18 +4,20 @@ from django.test import override_settings
 
 from dkron import models, utils
 
-from .test_generic import Test as GenericTest
+from .test_generic import LIST_PARAMS, Test as GenericTest
 
 
 @override_settings(DKRON_PATH='/dkron/proxy/ui/', DKRON_URL='http://dkron', DKRON_NAMESPACE='wtv')
 class Test(GenericTest):
+    job_prefix = 'wtv_'
+
     def test_sync_job(self, job_prefix=''):
         super().test_sync_job(job_prefix='wtv_')
 
     def test_delete_job(self, job_prefix=''):
         super().test_delete_job(job_prefix='wtv_')
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     def test_resync_jobs(self, mp1):
         j1 = models.Job.objects.create(name='job1')
         j2 = models.Job.objects.create(name='job2')
@@ -27,20 +29,20 @@ class Test(GenericTest):
             # skipped, wrong label
             {'name': 'wtv_job5', 'tags': {'label': 'testapp2'}, 'metadata': {'cron': 'auto'}},
         ]
-        mp1.return_value = mock.MagicMock(status_code=200, json=lambda: jobs)
+        mp1.return_value = mock.MagicMock(status_code=200, json=lambda: jobs, headers={})
         it = utils.resync_jobs()
 
         with mock.patch('dkron.utils.sync_job') as mp2, mock.patch('dkron.utils.delete_job') as mp3:
             el = next(it)
-            mp1.assert_called_once_with('http://dkron/v1/jobs', params={'metadata[cron]': 'auto'})
+            mp1.assert_called_once_with('http://dkron/v1/jobs', params={'metadata[cron]': 'auto', **LIST_PARAMS})
             self.assertEqual(('job1', 'u', None), el)
-            mp2.assert_called_once_with(j1, jobs[0])
+            mp2.assert_called_once_with(j1, jobs[0], mark_synced=False)
             mp2.reset_mock()
 
             mp2.side_effect = utils.DkronException(666, 'looking for d/a/emon')
             el = next(it)
             self.assertEqual(('job2', 'u', 'looking for d/a/emon'), el)
-            mp2.assert_called_once_with(j2, False)
+            mp2.assert_called_once_with(j2, False, mark_synced=False)
             mp2.reset_mock()
 
             # no order in a set(), check for both
@@ -1,11 +1,28 @@
 from io import StringIO
-from unittest import mock
+from unittest import mock, skipIf
 from django.test import TestCase, override_settings
 from django.core.management import call_command
 import json
 import base64
+import gzip
+import io
+import os
+import shlex
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import zoneinfo
 
-from dkron import utils
+from dkron import cron, utils, workers, wrapper
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
 
 
 class Test(TestCase):
@@ -74,3 +91,299 @@ class Test(TestCase):
         args = base64.b64encode(json.dumps({'kwargs': {'command': 'wtv'}}).encode()).decode()
         call_command('run_dkron_async_command', 'shell', args, stdout=out)
         cc_mock.assert_called_once_with('shell', command='wtv', stdout=out, stderr=None)
+
+    def test_cron_parse(self):
+        c = cron.parse('0 */15 9-17 * JAN-mar,dec mon-fri')
+        self.assertEqual(c.second, {0})
+        self.assertEqual(c.minute, {0, 15, 30, 45})
+        self.assertEqual(c.hour, set(range(9, 18)))
+        self.assertEqual(c.day, set(range(1, 32)))
+        self.assertEqual(c.month, {1, 2, 3, 12})
+        self.assertEqual(c.weekday, {1, 2, 3, 4, 5})
+        self.assertEqual((c.day_star, c.weekday_star, c.tz), (True, False, None))
+        # compiled once
+        self.assertIs(cron.parse('0 */15 9-17 * JAN-mar,dec mon-fri'), c)
+
+        self.assertEqual(cron.parse('5/20 0 0 ? * *').second, {5, 25, 45})
+        self.assertEqual(cron.parse('CRON_TZ=Europe/Dublin 0 0 0 * * *').tz, 'Europe/Dublin')
+        self.assertEqual(cron.parse('@weekly'), cron.parse('0 0 0 * * 0'))
+        self.assertEqual(cron.parse('@minutely').second, {0})
+        self.assertEqual(cron.parse('@manually'), cron.ManualSchedule())
+        self.assertEqual(cron.parse('@parent job1'), cron.ParentSchedule('job1'))
+        self.assertEqual(cron.parse('@every 1h30m'), cron.EverySchedule(timedelta(minutes=90)))
+        self.assertEqual(cron.parse('@every 1.5s'), cron.EverySchedule(timedelta(seconds=1)))
+        self.assertEqual(cron.parse('@every 10ms'), cron.EverySchedule(timedelta(seconds=1)))
+        self.assertEqual(
+            cron.parse('@at 2023-01-02T03:04:05.5+01:00'),
+            cron.AtSchedule(datetime(2023, 1, 2, 3, 4, 5, 500000, tzinfo=timezone(timedelta(hours=1)))),
+        )
+        self.assertEqual(
+            cron.parse('@at 2023-01-02T03:04:05Z'), cron.AtSchedule(datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+        )
+
+        for spec in (
+            '',
+            '0 0 * * *',
+            '0 0 0 * * * *',
+            '60 0 0 * * *',
+            '0 0 0 0 * *',
+            '0 0 0 * 13 *',
+            '0 0 0 * * 7',
+            '0 0 5-1 * * *',
+            '0 0 */0 * * *',
+            '0 0 1-2-3 * * *',
+            '0 0 */2/3 * * *',
+            '0 0 *-2 * * *',
+            '0 0 x * * *',
+            '0 0 -1 * * *',
+            'TZ=Nowhere/Atlantis 0 0 0 * * *',
+            '@daily 1',
+            '@whenever',
+            '@every',
+            '@every 1',
+            '@every 1d',
+            '@at 2023-01-02 03:04:05',
+            '@at 2023-02-30T03:04:05Z',
+            '@parent',
+        ):
+            with self.assertRaises(cron.CronError, msg=spec):
+                cron.parse(spec)
+
+    def test_cron_next_times(self):
+        after = datetime(2024, 3, 31, 0, 30, tzinfo=timezone.utc)
+        dublin = zoneinfo.ZoneInfo('Europe/Dublin')
+
+        def _next(spec, limit=3, **kwargs):
+            return cron.next_times(cron.parse(spec), after, limit, **kwargs)
+
+        self.assertEqual(_next('*/20 * * * * *'), [after + timedelta(seconds=s) for s in (20, 40, 60)])
+        # day of month OR day of week, when both are set
+        self.assertEqual(
+            [t.day for t in _next('0 0 12 13 * FRI', tz=dublin)],
+            [5, 12, 13],
+        )
+        # 01:30 does not exist in Dublin on DST change day
+        self.assertEqual(
+            _next('0 30 1 * * *', tz=dublin),
+            [datetime(2024, 4, d, 1, 30, tzinfo=dublin) for d in (1, 2, 3)],
+        )
+        self.assertEqual(
+            _next('CRON_TZ=Europe/Dublin 0 30 1 * * *')[0], datetime(2024, 4, 1, 0, 30, tzinfo=timezone.utc)
+        )
+        self.assertEqual(_next('0 0 0 29 2 *'), [datetime(2028, 2, 29, tzinfo=timezone.utc)])
+        self.assertEqual(_next('0 0 0 30 2 *'), [])
+        self.assertEqual(
+            _next('@every 90m', until=after + timedelta(hours=3)),
+            [after + timedelta(minutes=90), after + timedelta(hours=3)],
+        )
+        self.assertEqual(_next('@at 2024-03-31T00:30:00Z'), [])
+        self.assertEqual(_next('@at 2024-03-31T00:30:01Z'), [after + timedelta(seconds=1)])
+        self.assertEqual(_next('@manually'), [])
+        self.assertEqual(_next('@parent job1'), [])
+
+    @skipIf(pytz is None, 'pytz not installed')
+    def test_cron_next_times_pytz(self):
+        after = datetime(2024, 3, 31, 0, 30, tzinfo=timezone.utc)
+        times = cron.next_times(cron.parse('0 30 1 * * *'), after, 2, tz=pytz.timezone('Europe/Dublin'))
+        self.assertEqual(times, [datetime(2024, 4, d, 0, 30, tzinfo=timezone.utc) for d in (1, 2)])
+
+    @mock.patch('urllib.request.urlopen')
+    def test_wrapper(self, mp1):
+        with mock.patch.dict(os.environ, {wrapper.URL_ENV: 'http://app/usage/', wrapper.TOKEN_ENV: 'secret'}):
+            code = sys.executable + ' -c "import sys; sys.exit(3)"'
+            self.assertEqual(3, wrapper.main(['--job', 'job1', '--shell', '--', code]))
+            mp1.assert_called_once()
+            request = mp1.call_args.args[0]
+            self.assertEqual('http://app/usage/', request.full_url)
+            token, job, usage = request.data.decode().splitlines()
+            self.assertEqual(('secret', 'job1'), (token, job))
+            usage = json.loads(usage)
+            self.assertEqual(3, usage['exit_code'])
+            self.assertEqual({'exit_code', 'wall_time', 'cpu_user', 'cpu_system', 'max_rss', 'timed_out'}, set(usage))
+            self.assertGreater(usage['max_rss'], 1024 * 1024)
+
+            # reporting errors do not fail the job
+            mp1.reset_mock()
+            mp1.side_effect = OSError('connection refused')
+            self.assertEqual(0, wrapper.main(['--job', 'job1', '--', sys.executable, '-c', 'pass']))
+            mp1.assert_called_once()
+            self.assertEqual(127, wrapper.main(['--job', 'job1', '--', '/does/not/exist']))
+
+        mp1.reset_mock()
+        self.assertEqual(0, wrapper.main(['--job', 'job1', '--', sys.executable, '-c', 'pass']))
+        mp1.assert_not_called()
+
+    @mock.patch('urllib.request.urlopen')
+    def test_wrapper_output(self, mp1):
+        def _main(output_size):
+            code = f'import sys; sys.stdout.write("x" * {output_size - 3}); sys.stdout.flush(); sys.stderr.write("end")'
+            stdout = io.TextIOWrapper(io.BytesIO())
+            with mock.patch('sys.stdout', stdout):
+                self.assertEqual(0, wrapper.main(['--job', 'job1', '--no-usage', '--', sys.executable, '-c', code]))
+            return stdout.buffer.getvalue()
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            env = {
+                wrapper.URL_ENV: 'http://app/usage/',
+                wrapper.TOKEN_ENV: 'secret',
+                wrapper.OUTPUT_DIR_ENV: output_dir,
+                wrapper.OUTPUT_MAX_SIZE_ENV: '1000',
+                wrapper.OUTPUT_TAIL_ENV: '100',
+            }
+            with mock.patch.dict(os.environ, env):
+                # fits in dkron, nothing kept
+                self.assertEqual(b'x' * 47 + b'end', _main(50))
+                self.assertEqual([], os.listdir(os.path.join(output_dir, 'job1')))
+
+                stdout = _main(5000)
+                (name,) = os.listdir(os.path.join(output_dir, 'job1'))
+                path = os.path.join(output_dir, 'job1', name)
+                self.assertEqual(
+                    f'[dkron.wrapper: 5000 bytes of output, last 100 below - full output: {path}]\n'.encode()
+                    + b'x' * 97
+                    + b'end',
+                    stdout,
+                )
+                with gzip.open(path) as f:
+                    self.assertEqual(
+                        b'x' * 1000 + b'\n[dkron.wrapper: output truncated, 4000 bytes dropped]\n', f.read()
+                    )
+                os.unlink(path)
+
+                with mock.patch.dict(os.environ, {wrapper.OUTPUT_URL_ENV: 'https://app/dkron/output/'}):
+                    stdout = _main(5000)
+                (name,) = os.listdir(os.path.join(output_dir, 'job1'))
+                self.assertIn(f'full output: https://app/dkron/output/job1/{name}]'.encode(), stdout)
+
+                # background process still writing: cut off after OUTPUT_JOIN_TIMEOUT, complete gzip file
+                os.unlink(os.path.join(output_dir, 'job1', name))
+                stdout = io.TextIOWrapper(io.BytesIO())
+                with mock.patch('sys.stdout', stdout), mock.patch('dkron.wrapper.OUTPUT_JOIN_TIMEOUT', 1):
+                    code = 'seq 1 2000; (sleep 1; seq 1 1000; sleep 5; echo late) &'
+                    self.assertEqual(0, wrapper.main(['--job', 'job1', '--no-usage', '--shell', '--', code]))
+                stdout = stdout.buffer.getvalue()
+                self.assertIn(b'bytes of output, cut off while still being written, last 100 below', stdout)
+                self.assertNotIn(b'late', stdout)
+                (name,) = os.listdir(os.path.join(output_dir, 'job1'))
+                with gzip.open(os.path.join(output_dir, 'job1', name)) as f:
+                    self.assertTrue(
+                        f.read().endswith(
+                            b'\n[dkron.wrapper: output cut off, still written by processes left behind]\n'
+                        )
+                    )
+
+                # nothing left to dkron
+                with mock.patch.dict(os.environ, {wrapper.OUTPUT_TAIL_ENV: '0'}):
+                    stdout = _main(5000)
+                self.assertTrue(stdout.startswith(b'[dkron.wrapper: 5000 bytes of output, last 0 below'))
+                self.assertTrue(stdout.endswith(b']\n'))
+        mp1.assert_not_called()
+
+    def test_workers(self):
+        path = os.path.join(tempfile.mkdtemp(), 'workers.sock')
+        pid = os.fork()
+        if not pid:
+            try:
+                workers.serve(path, 1, 2)
+            finally:
+                os._exit(0)
+
+        try:
+            for _ in range(50):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.1)
+
+            def _request(command, arguments=None):
+                with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+                    response = workers.request(path, command, arguments, stdout=out.fileno(), stderr=err.fileno())
+                    out.seek(0)
+                    err.seek(0)
+                    return response, out.read().decode(), err.read().decode()
+
+            arguments = base64.b64encode(json.dumps({'kwargs': {'fail_level': 'CRITICAL'}}).encode()).decode()
+            self.assertFalse(stat.S_IMODE(os.stat(path).st_mode) & 0o077)
+            response, out, err = _request('check', arguments)
+            self.assertEqual(0, response['exit_code'])
+            self.assertIn('System check identified no issues', out)
+            first = response['pid']
+
+            response, out, err = _request('doesnotexist')
+            self.assertEqual(1, response['exit_code'])
+            self.assertIn("CommandError: Unknown command: 'doesnotexist'", err)
+            self.assertEqual(first, response['pid'])
+
+            # recycled after 2 tasks
+            response, out, err = _request('check')
+            self.assertEqual(0, response['exit_code'])
+            self.assertNotEqual(first, response['pid'])
+
+            # client killed while the command runs: the worker is replaced instead of finishing it
+            sleep = base64.b64encode(json.dumps({'kwargs': {'command': 'import time; time.sleep(30)'}}).encode())
+            body = json.dumps({'command': 'shell', 'arguments': sleep.decode()}).encode() + b'\n'
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+                socket.send_fds(sock, [body], [1, 2])
+                sock.shutdown(socket.SHUT_WR)
+            start = time.monotonic()
+            response, out, err = _request('check')
+            self.assertEqual(0, response['exit_code'])
+            self.assertLess(time.monotonic() - start, 10)
+
+            # not handing stdout/stderr to another user
+            with mock.patch('os.getuid', return_value=os.getuid() + 1), self.assertRaises(PermissionError):
+                _request('check')
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        self.assertFalse(os.path.exists(path))
+
+        # stdout and stderr are both required
+        a, b = socket.socketpair()
+        with a, b:
+            socket.send_fds(a, [b'{}\n'], [1])
+            with self.assertRaises(ValueError):
+                workers._receive(b)
+
+        # no pool, falls back to manage.py
+        with mock.patch('os.execv', side_effect=SystemExit) as mp1, self.assertRaises(SystemExit):
+            workers.main([path, 'check', arguments])
+        mp1.assert_called_once_with(
+            sys.executable, [sys.executable, './manage.py', 'run_dkron_async_command', 'check', arguments]
+        )
+
+    def test_wrapper_limits(self):
+        # whole process group terminated on timeout
+        start = time.monotonic()
+        self.assertEqual(124, wrapper.main(['--job', 'job1', '--timeout', '1', '--shell', '--', 'sleep 30 & sleep 30']))
+        self.assertLess(time.monotonic() - start, 5)
+        # and killed if it ignores it
+        start = time.monotonic()
+        returncode, usage = wrapper.run(['trap "" TERM; sleep 30'], use_shell=True, timeout=1, kill_grace=0.5)
+        self.assertEqual((-signal.SIGKILL, True), (returncode, usage['timed_out']))
+        self.assertLess(time.monotonic() - start, 5)
+
+        returncode, usage = wrapper.run([sys.executable, '-c', 'pass'], timeout=10)
+        self.assertEqual((0, False), (returncode, usage['timed_out']))
+        allocate = [sys.executable, '-c', 'try: x = bytearray(512 * 1024 * 1024)\nexcept MemoryError: exit(1)']
+        self.assertEqual(0, wrapper.run(allocate)[0])
+        self.assertEqual(1, wrapper.run(allocate, memory=256)[0])
+        returncode, _ = wrapper.run([sys.executable, '-c', 'while True: pass'], cpu_time=1, timeout=30)
+        self.assertEqual(-signal.SIGXCPU, returncode)
+        nice = [sys.executable, '-c', 'import os, sys; sys.exit(os.nice(0))']
+        self.assertEqual(os.nice(0) + 5, wrapper.run(nice, nice=5)[0])
+
+    def test_wrapper_command(self):
+        # as split by dkron (shell disabled)
+        self.assertEqual(
+            ['python', '-m', 'dkron.wrapper', '--job', 'wtv_job1', '--shell', '--', "echo 1 && echo '2'"],
+            shlex.split(wrapper.command('wtv_job1', "echo 1 && echo '2'", True)),
+        )
+        self.assertEqual(
+            '/venv/bin/python -m dkron.wrapper --job job1 -- ./manage.py something "with args"',
+            wrapper.command('job1', './manage.py something "with args"', False, python='/venv/bin/python'),
+        )
+        self.assertEqual(
+            'python -m dkron.wrapper --job job1 --timeout 60 --cpu-time 10 --nice 5 --shell -- \'sleep 1\'',
+            wrapper.command('job1', 'sleep 1', True, timeout=60, memory=None, cpu_time=10, nice=5),
+        )